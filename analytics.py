@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+
+
+# Quote volume/revenue/discount rollups live in quote_rollups, one document per
+# (dim, day, farmer_id, crop): dim is "total", "farmer" or "crop", and day=None holds the
+# all-time figure. refresh_quote_rollups() folds in quotes past a watermark on _id, so
+# each quote is read once; dashboards read only rollup documents.
+_WATERMARK = "quote_rollups:watermark"
+_METRICS = ("quotes", "lines", "quantity", "revenue", "base_total", "discount_total")
+
+
+def quote_lines(quote: dict) -> list:
+    """(farmer_id, crop name, quantity, base total, final price) for each line of a quote."""
+    if quote.get("lines"):
+        return [(ln.get("farmer_id"), ln.get("crop_name"), ln.get("crop_count") or 0,
+                 (ln.get("base_price") or 0) * (ln.get("crop_count") or 0), ln.get("final_price") or 0)
+                for ln in quote["lines"]]
+    final = quote.get("final_price") or 0
+    discount = quote.get("discount_percent") or 0
+    # Single-line quotes only store the final price and the discount applied to it
+    base = final * 100 / (100 - discount) if discount < 100 else final
+    return [(quote.get("farmer_id"), quote.get("crop_name"), quote.get("crop_count") or 0, base, final)]
+
+
+def _quote_day(quote: dict) -> str:
+    created = quote.get("created_at") or quote["_id"].generation_time
+    return created.strftime("%Y-%m-%d")
+
+
+def _rollup_increments(quotes) -> dict:
+    """{(dim, day, farmer_id, crop): {metric: increment}} for a batch of quotes."""
+    from db import normalize_crop_name
+
+    totals = {}
+    for quote in quotes:
+        day = _quote_day(quote)
+        per_key = {}
+        for farmer_id, crop, quantity, base, final in quote_lines(quote):
+            crop = normalize_crop_name(crop) if isinstance(crop, str) else None
+            keys = [("total", None, None)]
+            if farmer_id is not None:
+                keys.append(("farmer", farmer_id, None))
+            if crop:
+                keys.append(("crop", None, crop))
+            for dim, fid, name in keys:
+                for d in (day, None):
+                    m = per_key.setdefault((dim, d, fid, name), dict.fromkeys(_METRICS, 0))
+                    m["lines"] += 1
+                    m["quantity"] += quantity
+                    m["revenue"] += final
+                    m["base_total"] += base
+                    m["discount_total"] += base - final
+        for key, m in per_key.items():
+            m["quotes"] = 1
+            acc = totals.setdefault(key, dict.fromkeys(_METRICS, 0))
+            for metric in _METRICS:
+                acc[metric] += m[metric]
+    return totals
+
+
+def _apply(increments: dict, batch_end) -> None:
+    """
+    Fold one batch into the rollups. Each document remembers the last batch it absorbed
+    (applied_through), so replaying the same batch after a crash is a duplicate-key no-op
+    for the documents it already reached.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    from db import quote_rollups_col
+
+    ops = []
+    for (dim, day, farmer_id, crop), m in increments.items():
+        ops.append(UpdateOne(
+            {"_id": {"dim": dim, "day": day, "farmer_id": farmer_id, "crop": crop}, "applied_through": {"$lt": batch_end}},
+            {"$inc": m, "$set": {"dim": dim, "day": day, "farmer_id": farmer_id, "crop": crop, "applied_through": batch_end}},
+            upsert=True,
+        ))
+    if not ops:
+        return
+    try:
+        quote_rollups_col.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+def _take_lease(counters_col, owner: str, seconds: int) -> bool:
+    """Claim the watermark for one refresh; False while another run's lease is unexpired."""
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.utcnow()
+    free = {"_id": _WATERMARK, "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]}
+    try:
+        counters_col.update_one(free, {"$set": {"lease_owner": owner, "lease_until": now + timedelta(seconds=seconds)}},
+                                upsert=True)
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def refresh_quote_rollups(settle: timedelta = timedelta(minutes=2), batch_size: int = 1000, max_batches=None,
+                          lease_seconds: int = 300):
+    """
+    Fold quotes created since the last run into the rollups; returns how many were read, or
+    None if another refresh holds the lease. Quotes younger than `settle` wait for the next
+    run: their ObjectIds are assigned when the quote is built, slightly before the insert, so
+    a fresh _id can still appear behind the newest one already visible. Deleted quotes stay
+    counted (rollups record issuance).
+    """
+    import uuid
+
+    from bson import ObjectId
+    from db import counters_col, quotes_col
+
+    # Two runners starting from the same watermark with different horizons would pick
+    # different batch ends, and applied_through would accept both; one runner at a time
+    owner = uuid.uuid4().hex
+    if not _take_lease(counters_col, owner, lease_seconds):
+        return None
+    mine = {"_id": _WATERMARK, "lease_owner": owner}
+    try:
+        state = counters_col.find_one({"_id": _WATERMARK}) or {}
+        last_id = state.get("last_id")
+        # A batch is recorded before it is applied; a run that stopped part way replays exactly
+        # that batch, since one ending elsewhere would pass applied_through and count it twice
+        pending = state.get("pending_through")
+        horizon = ObjectId.from_datetime(datetime.utcnow() - settle)
+        fields = {"farmer_id": 1, "crop_name": 1, "crop_count": 1, "final_price": 1, "discount_percent": 1,
+                  "created_at": 1, "lines": 1}
+        read = batches = 0
+        while max_batches is None or batches < max_batches:
+            id_range = {"$lte": pending} if pending is not None else {"$lt": horizon}
+            if last_id is not None:
+                id_range["$gt"] = last_id
+            batch = list(quotes_col.find({"_id": id_range}, fields, sort=[("_id", 1)],
+                                         limit=0 if pending is not None else batch_size))
+            if not batch:
+                if pending is None:
+                    break
+                last_id, pending = pending, None  # the batch's quotes were deleted meanwhile
+                counters_col.update_one(mine, {"$set": {"last_id": last_id}, "$unset": {"pending_through": ""}})
+                continue
+            batch_end = pending if pending is not None else batch[-1]["_id"]
+            lease_until = datetime.utcnow() + timedelta(seconds=lease_seconds)
+            if not counters_col.update_one(mine, {"$set": {"pending_through": batch_end, "lease_until": lease_until}}).matched_count:
+                break  # the lease expired and another run took over
+            _apply(_rollup_increments(batch), batch_end)
+            counters_col.update_one(mine, {
+                "$set": {"last_id": batch_end, "updated_at": datetime.utcnow()}, "$unset": {"pending_through": ""},
+            })
+            last_id, pending = batch_end, None
+            read += len(batch)
+            batches += 1
+        return read
+    finally:
+        counters_col.update_one(mine, {"$unset": {"lease_owner": "", "lease_until": ""}})
+
+
+def rollups_updated_at():
+    from db import counters_col
+
+    state = counters_col.find_one({"_id": _WATERMARK}) or {}
+    return state.get("updated_at")
+
+
+def _row(doc: dict) -> dict:
+    row = {k: doc.get(k) for k in ("day", "farmer_id", "crop", *_METRICS)}
+    row["avg_discount_percent"] = 100 * doc["discount_total"] / doc["base_total"] if doc.get("base_total") else 0.0
+    return row
+
+
+def overall_totals() -> dict:
+    """All-time totals across every quote."""
+    from db import quote_rollups_col
+
+    doc = quote_rollups_col.find_one({"dim": "total", "day": None})
+    return _row(doc) if doc else _row(dict.fromkeys(_METRICS, 0))
+
+
+def daily_totals(days: int = 30, until=None) -> list:
+    """One row per day with quotes, for the `days` days ending at `until` (default today, UTC)."""
+    from db import quote_rollups_col
+
+    until = until or datetime.utcnow().date()
+    start = (until - timedelta(days=days - 1)).isoformat()
+    docs = quote_rollups_col.find({"dim": "total", "day": {"$gte": start, "$lte": until.isoformat()}}, sort=[("day", 1)])
+    return [_row(d) for d in docs]
+
+
+def top(dim: str, limit: int = 10, by: str = "revenue") -> list:
+    """All-time leaders for dim "farmer" or "crop", ranked by "revenue" or "quotes" (both indexed)."""
+    from db import quote_rollups_col
+
+    if dim not in ("farmer", "crop") or by not in ("revenue", "quotes"):
+        raise ValueError(f"unknown rollup dimension or metric: {dim}, {by}")
+    docs = quote_rollups_col.find({"dim": dim, "day": None}, sort=[(by, -1)], limit=limit)
+    return [_row(d) for d in docs]
@@ -1,49 +1,40 @@
 import streamlit as st
 from db import farmers_col, crops_col, quotes_col
-from cpq import calculate_price
 from datetime import datetime
 from utils import (
     render_template_to_html,
-    render_quote_to_pdf,
-    render_lease_to_pdf,
+    render_quote_to_pdf_bytes,
+    render_lease_to_pdf_bytes,
 )
-from email_utils import send_pdf_via_gmail, send_gmail_pdf_env
-from gridfs import GridFS
-from db import db
-import os, hashlib, hmac, secrets
+from email_utils import enqueue_pdf_email, get_mail_dispatcher
+from db import get_db, insert_crop, crop_price_average, normalize_crop_name
+from cache import price_suggestions
+import data_cache
+from quotes import build_quote, insert_quote
 from uuid import uuid4
 from manage_data import render_manage_data
+from dashboard import render_analytics
+from pickers import farmer_picker
+from page_state import field, begin_run, save_fields
+import time
 
 st.title("CPQ Agri Application")
+data_cache.start_change_stream_listener()
 
 
 def _suggest_base_price(crop_name: str, farmer_id):
     """Suggest a base price using historical data. Priority: farmer-specific, then global."""
-    try:
-        # Farmer-specific history
-        farmer_prices = list(crops_col.find(
-            {"farmer_id": farmer_id, "name": {"$regex": f"^{crop_name}$", "$options": "i"}},
-            {"base_price": 1}
-        ))
-        candidate_prices = [p.get("base_price") for p in farmer_prices if isinstance(p.get("base_price"), (int, float)) and p.get("base_price") > 0]
-        if candidate_prices:
-            return sum(candidate_prices) / len(candidate_prices)
-
-        # Global history (all farmers)
-        global_prices = list(crops_col.find(
-            {"name": {"$regex": f"^{crop_name}$", "$options": "i"}},
-            {"base_price": 1}
-        ))
-        candidate_prices = [p.get("base_price") for p in global_prices if isinstance(p.get("base_price"), (int, float)) and p.get("base_price") > 0]
-        if candidate_prices:
-            return sum(candidate_prices) / len(candidate_prices)
-    except Exception:
-        pass
-    return None
+    def _load():
+        try:
+            # Point reads on the maintained running stats
+            return crop_price_average(crop_name, farmer_id) or crop_price_average(crop_name)
+        except Exception:
+            return None
+    return price_suggestions.get_or_load((farmer_id, normalize_crop_name(crop_name)), _load)
 
 def page_add_farmer():
     st.header("Add a New Farmer")
-    farmer_name = st.text_input("Farmer Name", key="farmer_name_input")
+    farmer_name = st.text_input("Farmer Name", key=field("farmer_name_input"))
     if st.button("Add Farmer", key="add_farmer_btn"):
         if not farmer_name:
             st.error("Please enter farmer name")
@@ -53,33 +44,29 @@ def page_add_farmer():
                 st.warning(f"Farmer '{farmer_name}' already exists.")
             else:
                 farmers_col.insert_one({"name": farmer_name})
+                data_cache.invalidate_farmers()
                 st.success(f"Farmer '{farmer_name}' added successfully!")
 
 def page_add_crop():
     st.header("Add Crop for Farmer")
 
-    farmers = list(farmers_col.find({}, {"name": 1}))
-    farmer_names = [f.get('name') for f in farmers if f.get('name')]
-
-    if not farmer_names:
-        st.warning("No farmers found! Please add a farmer first.")
+    farmer = farmer_picker("Select Farmer", key="add_crop_farmer")
+    if farmer is None:
         return
 
-    selected_farmer = st.selectbox("Select Farmer", farmer_names, key="add_crop_farmer")
-    crop_name = st.text_input("Crop Name", key="crop_name_input")
+    crop_name = st.text_input("Crop Name", key=field("crop_name_input"))
     if "_last_crop_name" not in st.session_state:
         st.session_state._last_crop_name = ""
     if crop_name and crop_name != st.session_state._last_crop_name:
         st.session_state._last_crop_name = crop_name
-        farmer = farmers_col.find_one({"name": selected_farmer})
-        suggestion = _suggest_base_price(crop_name, farmer["_id"]) if farmer else None
+        suggestion = _suggest_base_price(crop_name, farmer["_id"])
         if suggestion is not None:
             st.session_state._base_price_suggestion = float(suggestion)
-    default_base = st.session_state.get("_base_price_suggestion", 0.0)
-    base_price = st.number_input("Base Price (₹)", min_value=0.0, format="%.2f", value=float(default_base), key="base_price_input")
+            st.session_state.base_price_input = float(suggestion)
+    base_price = st.number_input("Base Price (₹)", min_value=0.0, format="%.2f", key=field("base_price_input"))
     if st.session_state.get("_base_price_suggestion"):
         st.caption(f"Suggested from history: ₹{st.session_state._base_price_suggestion:,.2f} (editable)")
-    discounts = st.text_input("Discounts (e.g. 2:5,3:10)", key="discounts_input")
+    discounts = st.text_input("Discounts (e.g. 2:5,3:10)", key=field("discounts_input"))
 
     if st.button("Add Crop", key="add_crop_btn"):
         if not crop_name:
@@ -95,162 +82,113 @@ def page_add_crop():
                     except Exception:
                         st.warning(f"Ignored invalid discount format: {part}")
 
-            farmer = farmers_col.find_one({"name": selected_farmer})
-            crops_col.insert_one({
+            insert_crop({
                 "farmer_id": farmer["_id"],
                 "name": crop_name,
                 "base_price": base_price,
                 "discount_rules": discount_rules
             })
-            st.success(f"Crop '{crop_name}' added for farmer '{selected_farmer}'.")
+            data_cache.invalidate_crops(farmer["_id"])
+            st.success(f"Crop '{crop_name}' added for farmer '{farmer['name']}'.")
 
 def page_get_quote():
     st.header("Get Quote")
 
-    # Fetch farmers for selection
-    farmers = list(farmers_col.find({}, {"name": 1}))
-    farmer_names = [f.get('name') for f in farmers if f.get('name')]
-
-    if not farmer_names:
-        st.warning("No farmers found! Please add a farmer first.")
+    farmer = farmer_picker("Select Farmer", key="quote_farmer")
+    if farmer is None:
         return
-    selected_farmer = st.selectbox("Select Farmer", farmer_names, key="quote_farmer")
-    farmer = farmers_col.find_one({"name": selected_farmer})
 
-    crops = list(crops_col.find({"farmer_id": farmer["_id"]}, {"name": 1}))
-    crop_names = [c.get('name') for c in crops if c.get('name')]
+    crop_names = data_cache.crop_names(farmer["_id"])
 
     if not crop_names:
         st.warning("No crops found for this farmer! Please add crops first.")
         return
-    selected_crop = st.selectbox("Select Crop", crop_names, key="quote_crop")
-    crop = crops_col.find_one({"farmer_id": farmer["_id"], "name": selected_crop})
-
-    crop_count = st.number_input("Enter Crop Count", min_value=1, step=1)
-
-    buyer_name = st.text_input("Buyer Name (for PDF)")
-    valid_until = st.date_input("Valid Until (for PDF)")
-    seller_email = st.text_input("Seller Email (optional)")
-    buyer_email = st.text_input("Buyer Email (optional)")
-    gmail_user = st.text_input("Gmail Address (for sending)")
+    selected_crops = st.multiselect("Select Crops", crop_names, default=crop_names[:1], key="quote_crops")
+    crop_counts = {
+        name: st.number_input(f"Enter Crop Count ({name})", min_value=1, step=1, key=field(f"quote_count_{name}"))
+        for name in selected_crops
+    }
+
+    buyer_name = st.text_input("Buyer Name (for PDF)", key=field("quote_buyer_name"))
+    valid_until = st.date_input("Valid Until (for PDF)", key=field("quote_valid_until"))
+    seller_email = st.text_input("Seller Email (optional)", key=field("quote_seller_email"))
+    buyer_email = st.text_input("Buyer Email (optional)", key=field("quote_buyer_email"))
+    gmail_user = st.text_input("Gmail Address (for sending)", key=field("quote_gmail_user"))
     gmail_app_pw = st.text_input("Gmail App Password", type="password")
     use_env = st.checkbox("Use env vars (GMAIL_USER/GMAIL_APP_PW)", value=False)
 
     if st.button("Calculate Quote", key="calc_quote_btn"):
-        final_price, discount = calculate_price(crop["base_price"], crop_count, crop.get("discount_rules", []))
-
-        # Save quote in DB
-        quote_id = f"Q-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid4())[:6].upper()}"
-        quote = {
-            "farmer_id": farmer["_id"],
-            "crop_name": selected_crop,
-            "crop_count": crop_count,
-            "final_price": final_price,
-            "discount_percent": discount,
-            "seller_email": seller_email or None,
-            "buyer_email": buyer_email or None,
-            "quote_id": quote_id,
-            # signing scaffold (token hashes will be added after PDF created)
-            "buyer": {"signed": False},
-            "seller": {"signed": False},
-            "status": "pending",
-            "created_at": datetime.utcnow()
-        }
-        quotes_col.insert_one(quote)
-
-        st.success(f"Quote for {crop_count} '{selected_crop}' crops: ₹{final_price:.2f} (Discount Applied: {discount}%)")
-
-        # Prepare PDF context and provide download
-        import tempfile, os
-        breakdown = [{
-            "name": selected_crop,
-            "quantity": crop_count,
-            "base": float(crop["base_price"]),
-            "discount_percent": float(discount),
-            "discount_amount": float((crop["base_price"] * crop_count) - final_price),
-            "final": float(final_price)
-        }]
-        total_base = float(crop["base_price"] * crop_count)
-        total_discount = float(total_base - final_price)
-        total_final = float(final_price)
-        context = {
-            "quote_id": quote_id,
-            "date": datetime.utcnow().date().isoformat(),
-            "farmer": selected_farmer,
-            "buyer": buyer_name or "",
-            "breakdown": breakdown,
-            "total_base": f"{total_base:,.2f}",
-            "total_discount": f"{total_discount:,.2f}",
-            "total_final": f"{total_final:,.2f}",
-            "valid_until": valid_until.isoformat()
-        }
-
-        # Generate per-party signing tokens and embed clickable confirm links into PDF
-        secret = os.environ.get("SIGN_SECRET", "change-me")
-        def _hash_token(t: str) -> str:
-            return hmac.new(secret.encode(), t.encode(), hashlib.sha256).hexdigest()
-        buyer_tok = secrets.token_urlsafe(24)
-        seller_tok = secrets.token_urlsafe(24)
-        quotes_col.update_one({"quote_id": quote_id}, {"$set": {
-            "buyer.token_hash": _hash_token(buyer_tok),
-            "seller.token_hash": _hash_token(seller_tok),
-        }})
-        signing_base = os.environ.get("SIGN_BASE_URL", "http://localhost:5001/sign")
-        buyer_link = f"{signing_base}/{buyer_tok}"
-        seller_link = f"{signing_base}/{seller_tok}"
-        context["buyer_confirm_link"] = buyer_link
-        context["seller_confirm_link"] = seller_link
+        if not selected_crops:
+            st.error("Please select at least one crop")
+            return
+        lines = [{"farmer_id": farmer["_id"], "crop_name": name, "quantity": int(crop_counts[name])} for name in selected_crops]
+        try:
+            # Prices every line in one pass; crops are fetched with a single $in query
+            quote, context, tokens = build_quote(
+                lines,
+                {farmer["_id"]: farmer["name"]},
+                buyer_name=buyer_name,
+                valid_until=valid_until.isoformat(),
+                seller_email=seller_email,
+                buyer_email=buyer_email,
+            )
+        except KeyError as e:
+            st.error(f"Could not price quote: {e}")
+            return
+        quote_id = quote["quote_id"]
 
-        # Offer both PDF and HTML
+        pdf_bytes = None
         try:
-            import tempfile, os
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                pdf_path = tmp.name
-            render_quote_to_pdf(context, pdf_path)
-            with open(pdf_path, "rb") as f:
-                pdf_bytes = f.read()
-            os.unlink(pdf_path)
+            pdf_bytes = render_quote_to_pdf_bytes(context)
+        except Exception as e:
+            st.warning(f"PDF unavailable: {e}")
+        if pdf_bytes is not None:
+            # Save original PDF in GridFS first so the quote is written with its file id
+            try:
+                from gridfs import GridFS
+                fs = GridFS(get_db())
+                quote["original_file_id"] = fs.put(pdf_bytes, filename=f"{quote_id}.pdf", metadata={"type": "quote_original", "quote_id": quote_id})
+            except Exception:
+                pass
+
+        # Save quote in DB: one insert carrying lines, token hashes and file reference
+        insert_quote(quote)
+
+        if len(lines) == 1:
+            st.success(f"Quote for {quote['crop_count']} '{quote['crop_name']}' crops: ₹{quote['final_price']:.2f} (Discount Applied: {quote['discount_percent']}%)")
+        else:
+            st.success(f"Quote {quote_id} for {len(lines)} crops: ₹{context['total_final']} (Effective discount: {quote['discount_percent']:.2f}%)")
+
+        if pdf_bytes is not None:
             st.download_button(
                 label="Download Quote (PDF)",
                 data=pdf_bytes,
                 file_name=f"{quote_id}.pdf",
                 mime="application/pdf"
             )
-            # Save original PDF in GridFS and attach file id
-            try:
-                fs = GridFS(db)
-                original_id = fs.put(pdf_bytes, filename=f"{quote_id}.pdf", metadata={"type": "quote_original", "quote_id": quote_id})
-                quotes_col.update_one({"quote_id": quote_id}, {"$set": {"original_file_id": original_id}})
-            except Exception:
-                pass
-            # Removed GridFS storage
             # Send email if credentials and recipients provided (include tokenized signing links)
             if (use_env or (gmail_user and gmail_app_pw)) and (seller_email or buyer_email):
                 try:
                     recipients = [e for e in [seller_email, buyer_email] if e]
                     email_body = (
                         "Please find attached the quote PDF.\n"
-                        f"Seller sign: {seller_link}\n"
-                        f"Buyer sign: {buyer_link}\n"
+                        f"Seller sign: {context['seller_confirm_link']}\n"
+                        f"Buyer sign: {context['buyer_confirm_link']}\n"
                     )
-                    if use_env:
-                        send_gmail_pdf_env(recipients, f"Quote {quote_id}", email_body, pdf_bytes, f"{quote_id}.pdf")
-                    else:
-                        send_pdf_via_gmail(
-                            gmail_user,
-                            gmail_app_pw,
-                            recipients,
-                            subject=f"Quote {quote_id}",
-                            body=email_body,
-                            pdf_bytes=pdf_bytes,
-                            filename=f"{quote_id}.pdf",
-                        )
-                    st.success("Email sent.")
+                    # Queued for the background dispatcher; the page returns immediately
+                    job_id = enqueue_pdf_email(
+                        recipients,
+                        subject=f"Quote {quote_id}",
+                        body=email_body,
+                        pdf_bytes=pdf_bytes,
+                        filename=f"{quote_id}.pdf",
+                        gmail_user=None if use_env else gmail_user,
+                        app_password=None if use_env else gmail_app_pw,
+                    )
+                    st.session_state.setdefault("_mail_jobs", []).append((job_id, quote_id))
+                    st.success("Email queued; its delivery status is shown in the sidebar.")
                 except Exception as mail_err:
                     st.warning(f"Email failed: {mail_err}")
-            
-        except Exception as e:
-            st.warning(f"PDF unavailable: {e}")
         html_str = render_template_to_html('quote.html', context)
         st.download_button(
             label="Download Quote (HTML)",
@@ -259,7 +197,6 @@ def page_get_quote():
             mime="text/html"
         )
 
-        
 
 def page_lease():
     st.header("Generate Lease Agreement (PDF)")
@@ -267,40 +204,40 @@ def page_lease():
     st.subheader("Parties")
     col1, col2 = st.columns(2)
     with col1:
-        lessor_name = st.text_input("Lessor Name")
-        lessor_address = st.text_input("Lessor Address")
-        lessor_contact = st.text_input("Lessor Contact")
-        lessor_id_type = st.text_input("Lessor ID Type", value="Aadhaar")
-        lessor_id_number = st.text_input("Lessor ID Number")
+        lessor_name = st.text_input("Lessor Name", key=field("lease_lessor_name"))
+        lessor_address = st.text_input("Lessor Address", key=field("lease_lessor_address"))
+        lessor_contact = st.text_input("Lessor Contact", key=field("lease_lessor_contact"))
+        lessor_id_type = st.text_input("Lessor ID Type", key=field("lease_lessor_id_type", "Aadhaar"))
+        lessor_id_number = st.text_input("Lessor ID Number", key=field("lease_lessor_id_number"))
     with col2:
-        lessee_name = st.text_input("Lessee Name")
-        lessee_address = st.text_input("Lessee Address")
-        lessee_contact = st.text_input("Lessee Contact")
-        lessee_id_type = st.text_input("Lessee ID Type", value="Aadhaar")
-        lessee_id_number = st.text_input("Lessee ID Number")
+        lessee_name = st.text_input("Lessee Name", key=field("lease_lessee_name"))
+        lessee_address = st.text_input("Lessee Address", key=field("lease_lessee_address"))
+        lessee_contact = st.text_input("Lessee Contact", key=field("lease_lessee_contact"))
+        lessee_id_type = st.text_input("Lessee ID Type", key=field("lease_lessee_id_type", "Aadhaar"))
+        lessee_id_number = st.text_input("Lessee ID Number", key=field("lease_lessee_id_number"))
 
     st.subheader("Property & Term")
-    village = st.text_input("Village")
-    taluka = st.text_input("Taluka")
-    district = st.text_input("District")
-    state = st.text_input("State")
-    parcel_id = st.text_input("Survey/Plot No.")
-    area_acres = st.number_input("Area (acres)", min_value=0.0, format="%.2f")
+    village = st.text_input("Village", key=field("lease_village"))
+    taluka = st.text_input("Taluka", key=field("lease_taluka"))
+    district = st.text_input("District", key=field("lease_district"))
+    state = st.text_input("State", key=field("lease_state"))
+    parcel_id = st.text_input("Survey/Plot No.", key=field("lease_survey_plot_no"))
+    area_acres = st.number_input("Area (acres)", min_value=0.0, format="%.2f", key=field("lease_area"))
     col3, col4, col5 = st.columns(3)
     with col3:
-        term_start = st.date_input("Start Date")
+        term_start = st.date_input("Start Date", key=field("lease_start_date"))
     with col4:
-        term_end = st.date_input("End Date")
+        term_end = st.date_input("End Date", key=field("lease_end_date"))
     with col5:
-        duration_text = st.text_input("Duration (e.g., 12 months)")
-    possession_date = st.date_input("Possession/Handover Date")
+        duration_text = st.text_input("Duration (e.g., 12 months)", key=field("lease_duration"))
+    possession_date = st.date_input("Possession/Handover Date", key=field("lease_possession_handover_date"))
 
     st.subheader("Crop Details")
-    crops_raw = st.text_area("Enter crops (one per line: Crop,Variety,Season,Acreage)")
+    crops_raw = st.text_area("Enter crops (one per line: Crop,Variety,Season,Acreage)", key=field("lease_enter_crops"))
 
     st.subheader("Financials")
-    amount_original = st.number_input("Agreed Lease Amount (₹)", min_value=0.0, format="%.2f")
-    discount_percent = st.number_input("Discount (%)", min_value=0.0, max_value=100.0, format="%.2f")
+    amount_original = st.number_input("Agreed Lease Amount (₹)", min_value=0.0, format="%.2f", key=field("lease_agreed_lease_amount"))
+    discount_percent = st.number_input("Discount (%)", min_value=0.0, max_value=100.0, format="%.2f", key=field("lease_discount"))
     discount_amount = amount_original * (discount_percent / 100.0)
     amount_final = max(0.0, amount_original - discount_amount)
 
@@ -308,10 +245,10 @@ def page_lease():
     ps = []
     for i in range(1, 4):
         with st.expander(f"Payment {i}"):
-            due = st.date_input(f"Due Date {i}")
-            amt = st.number_input(f"Amount {i} (₹)", min_value=0.0, format="%.2f")
-            method = st.text_input(f"Method {i}", value="NEFT")
-            notes = st.text_input(f"Notes {i}", value="")
+            due = st.date_input(f"Due Date {i}", key=field(f"lease_due_date_{i}"))
+            amt = st.number_input(f"Amount {i} (₹)", min_value=0.0, format="%.2f", key=field(f"lease_amount_{i}"))
+            method = st.text_input(f"Method {i}", key=field(f"lease_method_{i}", "NEFT"))
+            notes = st.text_input(f"Notes {i}", key=field(f"lease_notes_{i}"))
             if amt > 0:
                 ps.append({
                     "due_date": due.isoformat(),
@@ -321,21 +258,21 @@ def page_lease():
                 })
 
     st.subheader("Terms")
-    irrigation_clause = st.text_input("Irrigation Clause", value="Irrigation from existing source; electricity charges on actuals, payable by Lessee.")
-    termination_notice_days = st.number_input("Termination notice (days)", min_value=0, value=30, step=1)
-    additional_clauses = st.text_area("Additional Clauses (optional)", value="")
+    irrigation_clause = st.text_input("Irrigation Clause", key=field("lease_irrigation_clause", "Irrigation from existing source; electricity charges on actuals, payable by Lessee."))
+    termination_notice_days = st.number_input("Termination notice (days)", min_value=0, step=1, key=field("lease_termination_notice", 30))
+    additional_clauses = st.text_area("Additional Clauses (optional)", key=field("lease_additional_clauses"))
 
     st.subheader("Witnesses")
-    w1_name = st.text_input("Witness 1 Name")
-    w1_address = st.text_input("Witness 1 Address")
-    w1_id_type = st.text_input("Witness 1 ID Type", value="Aadhaar")
-    w1_id_number = st.text_input("Witness 1 ID Number")
-    w2_name = st.text_input("Witness 2 Name")
-    w2_address = st.text_input("Witness 2 Address")
-    w2_id_type = st.text_input("Witness 2 ID Type", value="Aadhaar")
-    w2_id_number = st.text_input("Witness 2 ID Number")
+    w1_name = st.text_input("Witness 1 Name", key=field("lease_witness_1_name"))
+    w1_address = st.text_input("Witness 1 Address", key=field("lease_witness_1_address"))
+    w1_id_type = st.text_input("Witness 1 ID Type", key=field("lease_witness_1_id_type", "Aadhaar"))
+    w1_id_number = st.text_input("Witness 1 ID Number", key=field("lease_witness_1_id_number"))
+    w2_name = st.text_input("Witness 2 Name", key=field("lease_witness_2_name"))
+    w2_address = st.text_input("Witness 2 Address", key=field("lease_witness_2_address"))
+    w2_id_type = st.text_input("Witness 2 ID Type", key=field("lease_witness_2_id_type", "Aadhaar"))
+    w2_id_number = st.text_input("Witness 2 ID Number", key=field("lease_witness_2_id_number"))
 
-    signature_date = st.date_input("Signature Date")
+    signature_date = st.date_input("Signature Date", key=field("lease_signature_date"))
 
     if st.button("Generate Document", key="lease_generate_btn"):
         agreement_id = f"LEASE-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid4())[:6].upper()}"
@@ -406,13 +343,7 @@ def page_lease():
 
         # Offer both PDF and HTML
         try:
-            import tempfile, os
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                pdf_path = tmp.name
-            render_lease_to_pdf(context, pdf_path)
-            with open(pdf_path, "rb") as f:
-                pdf_bytes = f.read()
-            os.unlink(pdf_path)
+            pdf_bytes = render_lease_to_pdf_bytes(context)
             st.download_button(
                 label="Download Lease Agreement (PDF)",
                 data=pdf_bytes,
@@ -429,14 +360,71 @@ def page_lease():
             mime="text/html"
         )
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["Add Farmer", "Add Crop", "Get Quote", "Lease Agreement", "Manage Data"])
-with tab1:
-    page_add_farmer()
-with tab2:
-    page_add_crop()
-with tab3:
-    page_get_quote()
-with tab4:
-    page_lease()
-with tab5:
-    render_manage_data()
+def _dismiss_mail_job(job_id) -> None:
+    st.session_state["_mail_jobs"] = [(j, label) for j, label in st.session_state.get("_mail_jobs", []) if j != job_id]
+
+
+def _mail_status():
+    """Delivery state of the quote emails queued in this session; failed sends stay until dismissed."""
+    jobs = st.session_state.get("_mail_jobs")
+    if not jobs:
+        return
+    dispatcher = get_mail_dispatcher()
+    labels = dict(jobs)
+    for job in dispatcher.job_statuses(labels):
+        job_id, label = job["_id"], labels[job["_id"]]
+        if job["status"] == "sent":
+            st.caption(f"Email for {label} sent.")
+            _dismiss_mail_job(job_id)
+        elif job["status"] == "failed":
+            st.error(f"Email for {label} was not sent: {job.get('last_error')}")
+            retry_col, dismiss_col = st.columns(2)
+            retry_col.button("Retry", key=f"mail_retry_{job_id}", on_click=dispatcher.retry, args=(job_id,))
+            dismiss_col.button("Dismiss", key=f"mail_dismiss_{job_id}", on_click=_dismiss_mail_job, args=(job_id,))
+        else:
+            st.caption(f"Email for {label}: {job['status']} (attempt {job.get('attempts', 0) + 1})")
+
+
+# Polls while this session has emails in flight, so a failed send shows up without a rerun
+_render_mail_status = st.fragment(_mail_status, run_every=5)
+
+
+def _render_cache_stats():
+    stats = data_cache.cache_stats()
+    st.sidebar.caption("Cache hit rate: " + ", ".join(f"{name} {v['hit_rate']:.0%} ({v['hits']}/{v['hits'] + v['misses']})" for name, v in stats.items()))
+    listener = data_cache.change_stream_status()
+    if listener and listener["state"] == "reconnecting":
+        st.sidebar.warning(f"Live cache updates interrupted, retrying ({listener['last_error']}); data may be up to 5 minutes old.")
+    elif listener:
+        st.sidebar.caption(f"Live cache updates: {listener['state']}")
+
+def _record_rerun(title: str, seconds: float):
+    """Keep the last 50 rerun times per page and show the latest and median in the sidebar."""
+    times = st.session_state.setdefault("_rerun_times", {}).setdefault(title, [])
+    times.append(seconds)
+    del times[:-50]
+    median = sorted(times)[len(times) // 2]
+    st.sidebar.caption(f"Rerun ({title}): {seconds * 1e3:.0f} ms, median {median * 1e3:.0f} ms over {len(times)}")
+
+
+# Only the selected page runs on a rerun (st.tabs executed all five every time)
+page = st.navigation([
+    st.Page(page_add_farmer, title="Add Farmer", url_path="add-farmer", default=True),
+    st.Page(page_add_crop, title="Add Crop", url_path="add-crop"),
+    st.Page(page_get_quote, title="Get Quote", url_path="quote"),
+    st.Page(page_lease, title="Lease Agreement", url_path="lease"),
+    st.Page(render_manage_data, title="Manage Data", url_path="manage-data"),
+    st.Page(render_analytics, title="Analytics", url_path="analytics"),
+])
+_started = time.perf_counter()
+begin_run()
+try:
+    page.run()
+finally:
+    save_fields()
+    _record_rerun(page.title, time.perf_counter() - _started)
+
+if st.session_state.get("_mail_jobs"):
+    with st.sidebar:
+        _render_mail_status()
+_render_cache_stats()
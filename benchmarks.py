@@ -0,0 +1,808 @@
+import random
+import time
+
+import click
+
+
+@click.group()
+def cli():
+    pass
+
+
+def _timeit(fn, repeat: int) -> float:
+    """Return mean seconds per call of fn over `repeat` calls."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+@cli.command()
+@click.option("--quotes", default=10000, show_default=True, help="Quotes priced per measurement")
+@click.option("--seed", default=7, show_default=True)
+def pricing(quotes, seed):
+    """Per-quote cost of calculate_price vs compiled and batch pricing at 1, 10 and 1000 rules"""
+    import numpy as np
+    from cpq import calculate_price, CropPricer
+
+    rng = random.Random(seed)
+    base_price = 42.5
+    counts = [rng.randint(1, 5000) for _ in range(quotes)]
+    count_arr = np.asarray(counts)
+
+    for n_rules in (1, 10, 1000):
+        rules = [{"min_crops": rng.randint(1, 5000), "discount_percent": float(rng.randint(0, 40))} for _ in range(n_rules)]
+        pricer = CropPricer(base_price, rules)
+
+        expected = [calculate_price(base_price, c, rules) for c in counts]
+        finals, discounts = pricer.price_many(count_arr)
+        assert [pricer.price(c) for c in counts] == expected
+        assert finals.tolist() == [e[0] for e in expected]
+        assert discounts.tolist() == [e[1] for e in expected]
+
+        scalar = _timeit(lambda: [calculate_price(base_price, c, rules) for c in counts], 1) / quotes
+        compiled = _timeit(lambda: [pricer.price(c) for c in counts], 3) / quotes
+        batch = _timeit(lambda: pricer.price_many(count_arr), 10) / quotes
+        click.echo(
+            f"rules={n_rules:>5}  scalar={scalar * 1e6:8.3f}us  compiled={compiled * 1e6:8.3f}us  "
+            f"batch={batch * 1e6:8.3f}us per quote"
+        )
+
+
+def _percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+@cli.command("token-lookup")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--sizes", default="10000,100000,1000000,10000000", show_default=True, help="Quote counts to grow through")
+@click.option("--lookups", default=2000, show_default=True)
+def token_lookup(uri, sizes, lookups):
+    """Signing-token lookup latency (sign_tokens point read vs legacy $or) as quote history grows"""
+    import secrets
+    from pymongo import MongoClient, InsertOne
+
+    db = MongoClient(uri)["agr_cpq_bench"]
+    db.client.drop_database(db.name)
+    quotes, tokens = db["quotes"], db["sign_tokens"]
+    have = 0
+    for size in [int(s) for s in sizes.split(",")]:
+        while have < size:
+            n = min(10000, size - have)
+            q_ops, t_ops = [], []
+            for _ in range(n):
+                bh, sh = secrets.token_hex(32), secrets.token_hex(32)
+                doc = {"buyer": {"token_hash": bh}, "seller": {"token_hash": sh}}
+                q_ops.append(doc)
+            ids = quotes.insert_many(q_ops, ordered=False).inserted_ids
+            for oid, doc in zip(ids, q_ops):
+                t_ops.append(InsertOne({"_id": doc["buyer"]["token_hash"], "quote_oid": oid, "role": "buyer"}))
+                t_ops.append(InsertOne({"_id": doc["seller"]["token_hash"], "quote_oid": oid, "role": "seller"}))
+            tokens.bulk_write(t_ops, ordered=False)
+            have += n
+        sample = [t["_id"] for t in tokens.aggregate([{"$sample": {"size": lookups}}])]
+
+        point = []
+        for th in sample:
+            start = time.perf_counter()
+            tok = tokens.find_one({"_id": th})
+            quotes.find_one({"_id": tok["quote_oid"]})
+            point.append(time.perf_counter() - start)
+        legacy = []
+        for th in sample[: max(1, lookups // 100)]:
+            start = time.perf_counter()
+            quotes.find_one({"$or": [{"buyer.token_hash": th}, {"seller.token_hash": th}]})
+            legacy.append(time.perf_counter() - start)
+        click.echo(
+            f"quotes={size:>9}  sign_tokens p50={_percentile(point, 50) * 1e3:.3f}ms p99={_percentile(point, 99) * 1e3:.3f}ms  "
+            f"unindexed $or p50={_percentile(legacy, 50) * 1e3:.3f}ms"
+        )
+    db.client.drop_database(db.name)
+
+
+def _sample_quote_context(i: int = 0) -> dict:
+    base, qty, disc = 42.5, 10 + i % 50, 5.0
+    total = base * qty
+    final = total - total * disc / 100
+    return {
+        "quote_id": f"Q-BENCH-{i:06d}",
+        "date": "2025-01-01",
+        "farmer": f"Farmer {i % 100}",
+        "buyer": "Bench Buyer",
+        "breakdown": [{"name": "Wheat", "quantity": qty, "base": base, "discount_percent": disc,
+                       "discount_amount": total - final, "final": final}],
+        "total_base": f"{total:,.2f}",
+        "total_discount": f"{total - final:,.2f}",
+        "total_final": f"{final:,.2f}",
+        "valid_until": "2025-02-01",
+    }
+
+
+def _sample_lease_context(i: int = 0) -> dict:
+    party = {"name": "Bench Party", "address": "Village Road", "contact": "9999999999", "id_type": "Aadhaar", "id_number": "1234"}
+    return {
+        "agreement_id": f"LEASE-BENCH-{i:06d}",
+        "agreement_date": "2025-01-01",
+        "lessor": party,
+        "lessee": party,
+        "property": {"village": "V", "taluka": "T", "district": "D", "state": "S", "parcel_id": "42/1", "area_acres": 2.5},
+        "term": {"start_date": "2025-01-01", "end_date": "2025-12-31", "duration_text": "12 months"},
+        "possession_date": "2025-01-01",
+        "crops": [{"name": "Wheat", "variety": "HD-2967", "season": "Rabi", "acreage": 2.5}],
+        "amounts": {"original": 50000.0, "discount_percent": 5.0, "discount_amount": 2500.0, "final": 47500.0},
+        "payment_schedule": [{"due_date": "2025-03-01", "amount": 47500.0, "method": "NEFT", "notes": None}],
+        "irrigation_clause": "Irrigation from existing source.",
+        "termination_notice_days": 30,
+        "additional_clauses": None,
+        "witnesses": [party, party],
+        "signature_date": "2025-01-01",
+    }
+
+
+@cli.command()
+@click.option("--renders", default=500, show_default=True)
+def templates(renders):
+    """Cold (new Environment per render) vs warm (shared cached Environment) template throughput"""
+    import os
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    from utils import render_template_to_html
+
+    templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+    def cold(name, ctx):
+        env = Environment(loader=FileSystemLoader(templates_dir), autoescape=select_autoescape(["html", "xml"]))
+        return env.get_template(name).render(**ctx)
+
+    for name, ctx in (("quote.html", _sample_quote_context()), ("lease.html", _sample_lease_context())):
+        assert cold(name, ctx) == render_template_to_html(name, ctx)
+        cold_s = _timeit(lambda: cold(name, ctx), renders)
+        warm_s = _timeit(lambda: render_template_to_html(name, ctx), renders)
+        click.echo(f"{name:<11} cold={1 / cold_s:9.0f}/s  warm={1 / warm_s:9.0f}/s  speedup={cold_s / warm_s:5.1f}x")
+
+
+def _peak_bytes(fn) -> int:
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@cli.command("pdf-pipeline")
+@click.option("--docs", default=50, show_default=True)
+def pdf_pipeline(docs):
+    """Latency and peak memory per document: temp-file round trip vs in-memory renderers"""
+    import os
+    import tempfile
+    import utils
+
+    def via_tempfile(render_to_path, ctx):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+            pdf_path = tmp.name
+        render_to_path(ctx, pdf_path)
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+        os.unlink(pdf_path)
+        return data
+
+    cases = (
+        ("quote", utils.render_quote_to_pdf, utils.render_quote_to_pdf_bytes, _sample_quote_context()),
+        ("lease", utils.render_lease_to_pdf, utils.render_lease_to_pdf_bytes, _sample_lease_context()),
+    )
+    for name, to_path, to_bytes, ctx in cases:
+        try:
+            to_bytes(ctx)
+        except Exception as e:
+            click.echo(f"{name}: skipped ({e})")
+            continue
+        before = _timeit(lambda: via_tempfile(to_path, ctx), docs)
+        after = _timeit(lambda: to_bytes(ctx), docs)
+        click.echo(
+            f"{name}: tempfile {before * 1e3:.2f}ms peak {_peak_bytes(lambda: via_tempfile(to_path, ctx)) / 1024:.0f}KiB  |  "
+            f"in-memory {after * 1e3:.2f}ms peak {_peak_bytes(lambda: to_bytes(ctx)) / 1024:.0f}KiB"
+        )
+
+
+@cli.command("quote-pdfs")
+@click.option("--docs", default=10000, show_default=True, help="Quote PDFs generated per loop")
+def quote_pdfs(docs):
+    """Generate quote PDFs in a loop with per-document font loading vs the cached fonts"""
+    import os
+    import utils
+
+    def legacy_add_unicode_font(pdf, context):
+        # Pre-cache behaviour: probe every candidate and parse the full TTF twice per document
+        for font_path in utils._UNICODE_FONT_CANDIDATES:
+            if os.path.exists(font_path):
+                pdf.add_font('UNI', '', font_path)
+                pdf.add_font('UNI', 'B', font_path)
+                return True
+        return False
+
+    cached_add_unicode_font = utils._add_unicode_font
+    contexts = [_sample_quote_context(i) for i in range(docs)]
+    timings = {}
+    for name, add_font in (("per-document fonts", legacy_add_unicode_font), ("cached fonts", cached_add_unicode_font)):
+        utils._add_unicode_font = add_font
+        try:
+            start = time.perf_counter()
+            for ctx in contexts:
+                utils.render_quote_to_pdf_bytes(ctx)
+            timings[name] = time.perf_counter() - start
+        finally:
+            utils._add_unicode_font = cached_add_unicode_font
+        click.echo(f"{name:<19} {timings[name]:8.2f}s  {timings[name] / docs * 1e3:6.2f}ms/doc")
+    click.echo(f"speedup {timings['per-document fonts'] / timings['cached fonts']:.1f}x")
+
+
+@cli.command("bulk-quotes")
+@click.option("--docs", default=2000, show_default=True)
+@click.option("--workers", default="1,2,4,8", show_default=True, help="Worker counts to compare")
+def bulk_quotes(docs, workers):
+    """Bulk quote-PDF throughput as the process pool grows"""
+    import tempfile
+    from bulk_quotes import generate_quote_pdfs, ZipSink
+
+    baseline = None
+    for n in [int(w) for w in workers.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            result = generate_quote_pdfs((_sample_quote_context(i) for i in range(docs)), ZipSink(f"{tmp}/q.zip"), workers=n)
+            rate = result.written / (time.perf_counter() - start)
+        baseline = baseline or rate
+        click.echo(f"workers={n:<3} {rate:8.1f} PDFs/s  scaling={rate / baseline:4.2f}x  failed={len(result.failures)}")
+
+
+@cli.command()
+@click.option("--docs", default=50, show_default=True)
+@click.option("--workers", default=4, show_default=True, help="Parallel wkhtmltopdf jobs in batch mode")
+def leases(docs, workers):
+    """Lease PDF latency: first render (backend detection, cold imports) vs warm renders and batch mode"""
+    import utils
+
+    renderer = utils._html_pdf_renderer
+    contexts = [_sample_lease_context(i) for i in range(docs)]
+    start = time.perf_counter()
+    try:
+        utils.render_lease_to_pdf_bytes(contexts[0])
+    except RuntimeError as e:
+        click.echo(f"skipped: {e}")
+        return
+    cold = time.perf_counter() - start
+    warm = _timeit(lambda: utils.render_lease_to_pdf_bytes(contexts[0]), docs)
+    start = time.perf_counter()
+    utils.render_leases_to_pdf_bytes(contexts, workers=workers)
+    batch = (time.perf_counter() - start) / docs
+    click.echo(f"backend={renderer.backend}  first={cold * 1e3:.1f}ms  warm={warm * 1e3:.1f}ms  batch={batch * 1e3:.1f}ms/doc")
+
+
+@cli.command("quote-ids")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--count", default=100000, show_default=True, help="IDs to generate and quotes to insert")
+@click.option("--block-sizes", default="1,10,100,1000", show_default=True)
+@click.option("--lookups", default=2000, show_default=True)
+def quote_ids(uri, count, block_sizes, lookups):
+    """Quote-ID throughput per counter block size, and quote_id lookup latency with the unique index"""
+    import random
+    from pymongo import MongoClient, ASCENDING
+    from quotes import QuoteIdAllocator
+
+    db = MongoClient(uri)["agr_cpq_bench"]
+    db.client.drop_database(db.name)
+    ids = []
+    for size in [int(s) for s in block_sizes.split(",")]:
+        alloc = QuoteIdAllocator(block_size=size, counters=db["counters"])
+        start = time.perf_counter()
+        ids = [alloc.next() for _ in range(count)]
+        elapsed = time.perf_counter() - start
+        assert len(set(ids)) == count and ids == sorted(ids)
+        click.echo(f"block={size:>5}  {count / elapsed:>10,.0f} ids/s  ({-(-count // size)} counter round trips)")
+
+    quotes = db["quotes"]
+    for i in range(0, count, 10000):
+        quotes.insert_many([{"quote_id": q} for q in ids[i:i + 10000]], ordered=False)
+    sample = random.sample(ids, min(lookups, count))
+
+    def _lookup_times(n):
+        times = []
+        for qid in sample[:n]:
+            start = time.perf_counter()
+            quotes.find_one({"quote_id": qid})
+            times.append(time.perf_counter() - start)
+        return times
+
+    scan = _lookup_times(max(1, lookups // 100))
+    quotes.create_index([("quote_id", ASCENDING)], unique=True, partialFilterExpression={"quote_id": {"$type": "string"}})
+    point = _lookup_times(lookups)
+    click.echo(
+        f"quotes={count}  indexed p50={_percentile(point, 50) * 1e3:.3f}ms p99={_percentile(point, 99) * 1e3:.3f}ms  "
+        f"collection scan p50={_percentile(scan, 50) * 1e3:.3f}ms"
+    )
+    db.client.drop_database(db.name)
+
+
+def _scratch_db(uri: str):
+    """Point db.py, and everything built on it, at a fresh scratch database; returns (db, bucket)."""
+    import db as db_module
+
+    db_module.configure(uri, "agr_cpq_bench")
+    database = db_module.get_db()
+    database.client.drop_database(database.name)
+    return database, db_module.get_fs_bucket()
+
+
+@cli.command("sign-race")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--quotes", "n_quotes", default=50, show_default=True)
+@click.option("--requests-per-quote", default=8, show_default=True, help="Half buyer, half seller, all fired at once")
+@click.option("--threads", default=64, show_default=True)
+def sign_race(uri, n_quotes, requests_per_quote, threads):
+    """Concurrent /sign/<token> posts: every quote must end fully_signed with both signatures in one PDF"""
+    import io
+    import secrets
+    from concurrent.futures import ThreadPoolExecutor
+    import fitz
+    from bson import ObjectId
+    from gridfs import GridFS
+    from PIL import Image
+    import pdf_store
+    import signing_service
+    from quotes import hash_token
+
+    db, _ = _scratch_db(uri)
+    fs = GridFS(db)
+
+    src = fitz.open()
+    src.new_page()
+    original = src.tobytes()
+    buf = io.BytesIO()
+    Image.new("RGBA", (300, 100), (0, 0, 160, 255)).save(buf, format="PNG")
+    signature = buf.getvalue()
+
+    jobs = []
+    for _ in range(n_quotes):
+        oid = ObjectId()
+        tokens = {role: secrets.token_urlsafe(24) for role in ("buyer", "seller")}
+        hashes = {role: hash_token(t) for role, t in tokens.items()}
+        db["quotes"].insert_one({
+            "_id": oid, "quote_id": f"Q-RACE-{oid}", "status": "pending", "original_file_id": fs.put(original),
+            **{role: {"signed": False, "token_hash": th} for role, th in hashes.items()},
+        })
+        db["sign_tokens"].insert_many([{"_id": th, "quote_oid": oid, "role": role} for role, th in hashes.items()])
+        jobs += [tokens["buyer" if i % 2 else "seller"] for i in range(requests_per_quote)]
+    random.shuffle(jobs)
+
+    def _post(token):
+        client = signing_service.app.test_client()
+        return client.post(f"/sign/{token}", data={"signature": (io.BytesIO(signature), "sig.png")}).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        codes = list(pool.map(_post, jobs))
+    elapsed = time.perf_counter() - start
+
+    bad = []
+    for q in db["quotes"].find():
+        images = len(fitz.open(stream=pdf_store.VersionReader(q["signed_file_id"]).read(), filetype="pdf")[0].get_images()) if q.get("signed_file_id") else 0
+        if q.get("status") != "fully_signed" or images != 2:
+            bad.append((q["quote_id"], q.get("status"), images))
+    orphans = db["fs.files"].count_documents({}) - n_quotes * 3  # original + two signature deltas each
+    click.echo(
+        f"{len(jobs)} requests in {elapsed:.2f}s  status codes {dict(sorted((c, codes.count(c)) for c in set(codes)))}  "
+        f"inconsistent quotes={len(bad)}  orphaned files={orphans}"
+    )
+    for row in bad[:10]:
+        click.echo(f"  {row}")
+    db.client.drop_database(db.name)
+
+
+@cli.command("sign-memory")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--pages", default="1,50,300", show_default=True, help="PDF sizes to try, in pages")
+def sign_memory(uri, pages):
+    """Python-heap peak of signing and downloading a quote PDF as the PDF grows"""
+    import io
+    import secrets
+    import fitz
+    from bson import ObjectId
+    from PIL import Image
+    import signing_service
+    from quotes import hash_token
+
+    db, bucket = _scratch_db(uri)
+    client = signing_service.app.test_client()
+    buf = io.BytesIO()
+    Image.new("RGBA", (300, 100), (0, 0, 160, 255)).save(buf, format="PNG")
+    signature = buf.getvalue()
+
+    def _noise_png() -> bytes:
+        # Random pixels don't compress, so every page adds ~120 KB
+        out = io.BytesIO()
+        Image.frombytes("RGB", (200, 200), secrets.token_bytes(200 * 200 * 3)).save(out, format="PNG")
+        return out.getvalue()
+
+    for n in [int(p) for p in pages.split(",")]:
+        src = fitz.open()
+        for _ in range(n):
+            src.new_page().insert_image(fitz.Rect(50, 50, 450, 450), stream=_noise_png())
+        oid, token = ObjectId(), secrets.token_urlsafe(24)
+        th = hash_token(token)
+        fid = bucket.upload_from_stream("bench.pdf", src.tobytes(garbage=0))
+        size = bucket.open_download_stream(fid).length
+        db["quotes"].insert_one({"_id": oid, "quote_id": f"Q-MEM-{n}", "original_file_id": fid, "buyer": {"signed": False, "token_hash": th}})
+        db["sign_tokens"].insert_one({"_id": th, "quote_oid": oid, "role": "buyer"})
+        del src
+
+        def _sign():
+            rv = client.post(f"/sign/{token}", data={"signature": (io.BytesIO(signature), "sig.png")}, buffered=False)
+            for _ in rv.response:
+                pass
+            rv.close()
+
+        def _download():
+            rv = client.get(f"/quotes/Q-MEM-{n}/pdf?token={token}", buffered=False)
+            for _ in rv.response:
+                pass
+            rv.close()
+
+        click.echo(f"pdf={size / 1e6:7.1f}MB  sign peak={_peak_bytes(_sign) / 1e6:6.2f}MB  download peak={_peak_bytes(_download) / 1e6:6.2f}MB")
+    db.client.drop_database(db.name)
+
+
+@cli.command("signature-ingest")
+@click.option("--size", default="4000x3000", show_default=True, help="Synthetic phone-photo resolution")
+@click.option("--repeat", default=20, show_default=True)
+def signature_ingest(size, repeat):
+    """Signed-PDF size and stamping time: raw uploaded photo vs normalized, cached signature"""
+    import io
+    import fitz
+    from PIL import Image, ImageDraw, ImageFilter
+    import signing_service
+
+    w, h = (int(v) for v in size.split("x"))
+    # Off-white, unevenly lit paper with a blue pen stroke, saved the way phones do
+    photo = Image.linear_gradient("L").resize((w, h)).point(lambda p: 170 + p // 4).convert("RGB")
+    draw = ImageDraw.Draw(photo)
+    points = [(w * (0.2 + 0.6 * i / 40), h * (0.5 + 0.15 * ((-1) ** i) * (i % 7) / 7)) for i in range(41)]
+    draw.line(points, fill=(20, 30, 120), width=max(4, w // 300))
+    photo = photo.filter(ImageFilter.GaussianBlur(1.5))
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", quality=90)
+    upload = buf.getvalue()
+
+    src = fitz.open()
+    src.new_page()
+    base = src.tobytes()
+    placement = signing_service._signature_placement("buyer")
+
+    def _stamp(stream: bytes, iw: int, ih: int) -> bytes:
+        doc = fitz.open(stream=base, filetype="pdf")
+        page = doc[0]
+        pw = placement["w"]
+        y_top = page.rect.height - placement["y"]
+        page.insert_image(fitz.Rect(placement["x"], y_top - ih * pw / iw, placement["x"] + pw, y_top), stream=stream)
+        return doc.tobytes(deflate=True)
+
+    raw_time = _timeit(lambda: _stamp(upload, w, h), max(1, repeat // 4))
+    raw_pdf = _stamp(upload, w, h)
+
+    signing_service._signature_cache.invalidate()
+    start = time.perf_counter()
+    sig = signing_service._load_signature(upload, placement["w"])
+    cold = time.perf_counter() - start
+    warm = _timeit(lambda: signing_service._load_signature(upload, placement["w"]), repeat)
+    norm_time = _timeit(lambda: _stamp(sig.png, sig.width, sig.height), repeat)
+    norm_pdf = _stamp(sig.png, sig.width, sig.height)
+
+    click.echo(f"upload {len(upload) / 1e6:.2f}MB {w}x{h} -> normalized PNG {len(sig.png) / 1e3:.1f}KB {sig.width}x{sig.height}")
+    click.echo(f"normalize: first {cold * 1e3:.1f}ms, cached {warm * 1e6:.1f}us")
+    click.echo(f"stamp+save: raw {raw_time * 1e3:.1f}ms / {len(raw_pdf) / 1e3:.0f}KB PDF   normalized {norm_time * 1e3:.1f}ms / {len(norm_pdf) / 1e3:.0f}KB PDF")
+
+
+@cli.command("sign-storage")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--pages", default="1,50,300", show_default=True, help="Document sizes to try, in pages")
+@click.option("--signers", default=4, show_default=True, help="Signatures applied one after another")
+def sign_storage(uri, pages, signers):
+    """Per-signature time and GridFS bytes: incremental deltas vs full rewrites, as the document grows"""
+    import io
+    import os
+    import secrets
+    import tempfile
+    import fitz
+    from PIL import Image
+    import signing_service
+
+    db, bucket = _scratch_db(uri)
+    buf = io.BytesIO()
+    Image.new("RGBA", (300, 100), (0, 0, 160, 255)).save(buf, format="PNG")
+    signature = signing_service._load_signature(buf.getvalue(), 180)
+
+    def _noise_png() -> bytes:
+        out = io.BytesIO()
+        Image.frombytes("RGB", (200, 200), secrets.token_bytes(200 * 200 * 3)).save(out, format="PNG")
+        return out.getvalue()
+
+    for n in [int(p) for p in pages.split(",")]:
+        src = fitz.open()
+        for _ in range(n):
+            src.new_page().insert_image(fitz.Rect(50, 50, 450, 450), stream=_noise_png())
+        original = src.tobytes()
+        del src
+
+        # Before: every signature rewrote the whole file and stored it again
+        full_times, full_bytes, current = [], 0, original
+        for i in range(signers):
+            start = time.perf_counter()
+            doc = fitz.open(stream=current, filetype="pdf")
+            signing_service._overlay_signature(doc, signature, x=50 + 120 * i, y=120, w=100)
+            current = doc.tobytes()
+            doc.close()
+            bucket.upload_from_stream("full.pdf", io.BytesIO(current))
+            full_times.append(time.perf_counter() - start)
+            full_bytes += len(current)
+
+        # Now: incremental update, stored as a delta on the previous version
+        inc_times, fid = [], bucket.upload_from_stream("orig.pdf", io.BytesIO(original))
+        before = sum(f["length"] for f in db["fs.files"].find({}, {"length": 1}))
+        for i in range(signers):
+            start = time.perf_counter()
+            fid = signing_service._sign_gridfs_file(fid, signature, "signed.pdf", {"type": "bench"}, x=50 + 120 * i, y=120, w=100)
+            inc_times.append(time.perf_counter() - start)
+        inc_bytes = sum(f["length"] for f in db["fs.files"].find({}, {"length": 1})) - before
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "v.pdf")
+            with open(path, "wb") as f:
+                signing_service.pdf_store.download_version(fid, f)
+            images = sum(len(page.get_images()) for page in fitz.open(path)) - n
+        click.echo(
+            f"pdf={len(original) / 1e6:6.1f}MB x{signers} signers  full rewrite {_percentile(full_times, 50) * 1e3:7.1f}ms/sig "
+            f"{full_bytes / signers / 1e3:9.0f}KB/sig   incremental {_percentile(inc_times, 50) * 1e3:7.1f}ms/sig "
+            f"{inc_bytes / signers / 1e3:6.1f}KB/sig  (signatures in final PDF: {images})"
+        )
+    db.client.drop_database(db.name)
+
+
+def _multipart(fields: dict, files: dict) -> tuple:
+    boundary = "----bench" + str(random.getrandbits(64))
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, ctype) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f"Content-Type: {ctype}\r\n\r\n".encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+@cli.command("sign-load")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--workers", default="0,1,2,4", show_default=True, help="Overlay pool sizes to try (0 = stamp on the request thread)")
+@click.option("--requests", "n_requests", default=200, show_default=True, help="Sign requests per run, one per quote")
+@click.option("--concurrency", default=16, show_default=True, help="Concurrent clients (and server threads)")
+@click.option("--pages", default=20, show_default=True, help="Pages per quote PDF")
+def sign_load(uri, workers, n_requests, concurrency, pages):
+    """Load-test POST /sign/<token> over HTTP: requests/sec and latency as overlay workers vary"""
+    import http.client
+    import io
+    import logging
+    import secrets
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import fitz
+    from bson import ObjectId
+    from PIL import Image
+    from werkzeug.serving import make_server
+    import signing_service
+    from quotes import hash_token
+
+    db, bucket = _scratch_db(uri)
+
+    src = fitz.open()
+    for i in range(pages):
+        src.new_page().insert_text((72, 72), f"Lease page {i + 1}\n" + "Terms and conditions. " * 40)
+    original = bucket.upload_from_stream("bench.pdf", io.BytesIO(src.tobytes()))
+    buf = io.BytesIO()
+    Image.new("RGBA", (600, 200), (0, 0, 160, 255)).save(buf, format="PNG")
+    body, ctype = _multipart({}, {"signature": ("sig.png", buf.getvalue(), "image/png")})
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, signing_service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    def _post(token):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        start = time.perf_counter()
+        conn.request("POST", f"/sign/{token}", body=body, headers={"Content-Type": ctype})
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        return resp.status, time.perf_counter() - start
+
+    try:
+        for n in [int(w) for w in workers.split(",")]:
+            signing_service.shutdown_overlay_pool()
+            signing_service.SIGN_OVERLAY_WORKERS = n
+            if n:
+                signing_service._get_overlay_pool().submit(int).result()  # start the workers outside the timing
+            tokens = []
+            for _ in range(n_requests):
+                oid, token = ObjectId(), secrets.token_urlsafe(24)
+                th = hash_token(token)
+                db["quotes"].insert_one({"_id": oid, "quote_id": f"Q-LOAD-{oid}", "original_file_id": original,
+                                         "buyer": {"signed": False, "token_hash": th}})
+                db["sign_tokens"].insert_one({"_id": th, "quote_oid": oid, "role": "buyer"})
+                tokens.append(token)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(_post, tokens))
+            elapsed = time.perf_counter() - start
+            latencies = [t for _, t in results]
+            errors = sum(1 for status, _ in results if status != 200)
+            click.echo(
+                f"overlay workers={n}  {len(results) / elapsed:7.1f} req/s  p50={_percentile(latencies, 50) * 1e3:7.1f}ms  "
+                f"p99={_percentile(latencies, 99) * 1e3:7.1f}ms  errors={errors}"
+            )
+    finally:
+        server.shutdown()
+        signing_service.shutdown_overlay_pool()
+        db.client.drop_database(db.name)
+
+
+@cli.command("farmer-search")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--sizes", default="1000,10000,100000", show_default=True, help="Farmer counts to grow through")
+@click.option("--queries", default=200, show_default=True)
+def farmer_search(uri, sizes, queries):
+    """Farmer picker page latency (indexed prefix search) vs loading every farmer name"""
+    import random
+    import string
+    import db as db_module
+
+    database, _ = _scratch_db(uri)
+    db_module.ensure_indexes()
+    farmers = database["farmers"]
+    have = 0
+    for size in [int(s) for s in sizes.split(",")]:
+        while have < size:
+            n = min(10000, size - have)
+            farmers.insert_many([{"name": f"{random.choice(string.ascii_letters)}{random.randrange(10**9):09d} {have + i}"} for i in range(n)], ordered=False)
+            have += n
+        prefixes = [random.choice(string.ascii_letters) + str(random.randrange(10)) for _ in range(queries)]
+
+        paged = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            page, cursor = db_module.search_farmers(prefix)
+            if cursor is not None:
+                db_module.search_farmers(prefix, cursor)
+            paged.append(time.perf_counter() - start)
+        full = []
+        for _ in range(max(1, queries // 50)):
+            start = time.perf_counter()
+            list(farmers.find({}, {"name": 1}))
+            full.append(time.perf_counter() - start)
+        click.echo(
+            f"{size:>10,} farmers  first two pages p50={_percentile(paged, 50) * 1e3:6.2f}ms p99={_percentile(paged, 99) * 1e3:6.2f}ms  "
+            f"full list p50={_percentile(full, 50) * 1e3:8.2f}ms"
+        )
+    database.client.drop_database(database.name)
+
+@cli.command("import")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--farmers", "n_farmers", default=5000, show_default=True)
+@click.option("--crops", "n_crops", default=40000, show_default=True)
+@click.option("--chunk-size", default=1000, show_default=True)
+def import_rows(uri, n_farmers, n_crops, chunk_size):
+    """import-farmers / import-crops throughput for a cooperative-sized onboarding file, first run and re-run"""
+    import io
+    import json
+    import db as db_module
+    from bulk_import import ImportResult, import_crops, import_farmers, read_rows
+
+    database, _ = _scratch_db(uri)
+    db_module.ensure_indexes()
+    farmers_csv = "name\n" + "".join(f"Farmer {i}\n" for i in range(n_farmers))
+    crops_jsonl = "".join(
+        json.dumps({"farmer": f"Farmer {i % n_farmers}", "crop": f"Crop {i // n_farmers}", "base_price": 10 + i % 17,
+                    "discounts": "2:5,5:10" if i % 3 else "3:4"}) + "\n"
+        for i in range(n_crops)
+    )
+    for run in ("first run", "re-run"):
+        for label, fn, text, fmt in (("farmers", import_farmers, farmers_csv, "csv"), ("crops", import_crops, crops_jsonl, "jsonl")):
+            result = ImportResult()
+            fn(read_rows(io.StringIO(text), result, fmt), result, chunk_size=chunk_size)
+            click.echo(f"{run:<10} {label:<8} {result.rows:>7,} rows  {result.rows_per_sec:>9,.0f} rows/s  {result!r}")
+    database.client.drop_database(database.name)
+
+@cli.command("export")
+@click.option("--uri", default="mongodb://localhost:27017", show_default=True, help="Scratch mongod (database is dropped)")
+@click.option("--quotes", "n_quotes", default=1_000_000, show_default=True)
+@click.option("--farmers", "n_farmers", default=5000, show_default=True)
+@click.option("--batch-size", default=5000, show_default=True)
+def export(uri, n_quotes, n_farmers, batch_size):
+    """export-quotes throughput and peak RSS per format; RSS should not grow with --quotes"""
+    import os
+    import resource
+    import time
+    from datetime import datetime, timedelta
+    from bson import ObjectId
+    import db as db_module
+    from quote_export import FORMATS, export_quotes
+
+    database, _ = _scratch_db(uri)
+    db_module.ensure_indexes()
+    farmer_ids = db_module.farmers_col.insert_many([{"name": f"Farmer {i}"} for i in range(n_farmers)]).inserted_ids
+    start = datetime.utcnow() - timedelta(days=365)
+    for lo in range(0, n_quotes, 10_000):
+        db_module.quotes_col.insert_many([{
+            "_id": ObjectId(), "quote_id": f"Q-BENCH-{i:09d}", "created_at": start + timedelta(seconds=i * 30),
+            "status": "pending", "farmer_id": farmer_ids[i % n_farmers], "crop_name": f"Crop {i % 40}",
+            "crop_count": 1 + i % 9, "final_price": 12.5 * (1 + i % 9), "discount_percent": 5.0 * (i % 3),
+            "buyer_email": "buyer@example.com", "seller_email": None,
+        } for i in range(lo, min(lo + 10_000, n_quotes))], ordered=False)
+
+    def rss_mb():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    click.echo(f"{n_quotes:,} quotes seeded, peak RSS so far {rss_mb():.0f} MB")
+    for fmt in FORMATS:
+        with open(os.devnull, "wb") as out:
+            t = time.perf_counter()
+            n = export_quotes(out, fmt, batch_size=batch_size)
+            elapsed = time.perf_counter() - t
+        click.echo(f"{fmt:<8} {n:>10,} rows  {n / elapsed:>9,.0f} rows/s  peak RSS {rss_mb():.0f} MB")
+    t = time.perf_counter()
+    with open(os.devnull, "wb") as out:
+        n = export_quotes(out, "csv", farmer_id=farmer_ids[0], batch_size=batch_size)
+    click.echo(f"one farmer {n:>8,} rows  {(time.perf_counter() - t) * 1000:.0f} ms (ix_quotes_farmer_created)")
+    database.client.drop_database(database.name)
+
+
+# Modules no entry point may pull in at import time; each belongs behind a function-level import.
+_HEAVY_MODULES = ("fitz", "fpdf", "weasyprint", "pdfkit", "smtplib", "gridfs", "PIL", "pypdf", "numpy", "fontTools", "pyarrow")
+
+
+@cli.command("cold-start")
+@click.option("--modules", default="db,quotes,data_cache,email_utils,utils,bulk_quotes,main,signing_service", show_default=True)
+@click.option("--repeat", default=5, show_default=True)
+@click.option("--check", is_flag=True, help="Exit 1 if any module imports a heavy PDF/email/image dependency eagerly")
+def cold_start(modules, repeat, check):
+    """Import time of each entry point in a fresh interpreter (median of --repeat runs)"""
+    import os
+    import statistics
+    import subprocess
+    import sys
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = (
+        "import importlib, sys, time; t = time.perf_counter(); importlib.import_module(sys.argv[1]); "
+        "d = time.perf_counter() - t; print('eager:' + ','.join(m for m in sys.argv[2:] if m in sys.modules)); print(d)"
+    )
+    offenders = {}
+    for module in modules.split(","):
+        times, heavy = [], ""
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", probe, module, *_HEAVY_MODULES], cwd=here, capture_output=True, text=True)
+            if out.returncode != 0:
+                times = None
+                click.echo(f"{module:<16} failed: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+                break
+            lines = out.stdout.strip().splitlines()
+            heavy = lines[-2][len("eager:"):]
+            times.append(float(lines[-1]))
+        if times:
+            click.echo(f"{module:<16} {statistics.median(times) * 1e3:8.1f}ms  {('eager: ' + heavy) if heavy else ''}")
+        if heavy:
+            offenders[module] = heavy
+    if check and offenders:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,237 @@
+import csv
+import json
+import math
+import time
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, Optional
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failures = []  # (line number, error)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self) -> str:
+        return (f"ImportResult(rows={self.rows}, inserted={self.inserted}, updated={self.updated}, "
+                f"unchanged={self.unchanged}, failed={len(self.failures)})")
+
+
+def read_rows(f, result: ImportResult, fmt: Optional[str] = None) -> Iterator[tuple]:
+    """
+    Stream (line number, row dict) from a CSV file with a header row or a JSONL file;
+    fmt defaults to the file extension. Unparseable JSON lines are recorded as failures.
+    """
+    fmt = fmt or ("csv" if getattr(f, "name", "").lower().endswith(".csv") else "jsonl")
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for n, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            result.rows += 1
+            result.failures.append((n, f"invalid JSON: {e}"))
+            continue
+        if not isinstance(row, dict):
+            result.rows += 1
+            result.failures.append((n, "expected a JSON object"))
+            continue
+        yield n, row
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bulk_write(col, ops: list, lines: list, result: ImportResult) -> set:
+    """Unordered bulk write; records per-op errors against their lines and returns the failed op indexes."""
+    from pymongo.errors import BulkWriteError
+
+    if not ops:
+        return set()
+    try:
+        details = col.bulk_write(ops, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+    failed = set()
+    for err in details.get("writeErrors", []):
+        failed.add(err["index"])
+        result.failures.append((lines[err["index"]], err.get("errmsg", "write error")))
+    result.inserted += details.get("nUpserted", 0)
+    result.updated += details.get("nModified", 0)
+    result.unchanged += details.get("nMatched", 0) - details.get("nModified", 0)
+    return failed
+
+
+def _finish(result: ImportResult, progress) -> None:
+    result.elapsed = time.perf_counter() - result.started
+    if progress:
+        progress(result)
+
+
+def import_farmers(rows: Iterable[tuple], result: Optional[ImportResult] = None, chunk_size: int = 1000,
+                   progress: Optional[Callable[[ImportResult], None]] = None) -> ImportResult:
+    """
+    Upsert farmers by name from (line, {"name"}) rows in unordered bulk_write chunks, served
+    by uix_farmers_name. Existing farmers are left as they are.
+    """
+    from pymongo import UpdateOne
+    from db import farmers_col
+
+    result = result or ImportResult()
+    for chunk in _chunks(rows, chunk_size):
+        ops, lines, seen = [], [], set()
+        for line, row in chunk:
+            result.rows += 1
+            name = str(row.get("name") or "").strip()
+            if not name:
+                result.failures.append((line, "missing name"))
+            elif name in seen:
+                result.unchanged += 1
+            else:
+                seen.add(name)
+                ops.append(UpdateOne({"name": name}, {"$setOnInsert": {"name": name}}, upsert=True))
+                lines.append(line)
+        _bulk_write(farmers_col, ops, lines, result)
+        _finish(result, progress)
+    _finish(result, None)
+    return result
+
+
+@lru_cache(maxsize=4096)
+def _parse_tiers(text: str) -> list:
+    # Rows of one cooperative mostly repeat a handful of tier strings
+    from utils import parse_discount_rules
+    return parse_discount_rules(text, strict=True)
+
+
+def _discount_rules(value) -> list:
+    """Discount tiers from "2:5,3:10" or a list of {"min_crops", "discount_percent"}; ValueError if invalid."""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        rules = _parse_tiers(value)
+    elif isinstance(value, list):
+        try:
+            rules = [{"min_crops": int(r["min_crops"]), "discount_percent": float(r["discount_percent"])} for r in value]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("discount_rules entries need min_crops and discount_percent")
+    else:
+        raise ValueError("discounts must be a string like 2:5,3:10 or a list")
+    for r in rules:
+        if not math.isfinite(r["discount_percent"]):
+            raise ValueError(f"invalid discount_percent {r['discount_percent']!r}")
+    return rules
+
+
+def _crop_row(row: dict) -> tuple:
+    farmer = str(row.get("farmer") or "").strip()
+    name = str(row.get("crop") or row.get("name") or "").strip()
+    if not farmer or not name:
+        raise ValueError("farmer and crop are required")
+    try:
+        base_price = float(row.get("base_price"))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid base_price {row.get('base_price')!r}")
+    if not math.isfinite(base_price):
+        # float() accepts "nan" and "inf"; neither prices anything
+        raise ValueError(f"invalid base_price {row.get('base_price')!r}")
+    if base_price < 0:
+        raise ValueError("base_price must not be negative")
+    rules = _discount_rules(row.get("discount_rules", row.get("discounts")))
+    return farmer, name, base_price, rules
+
+
+def import_crops(rows: Iterable[tuple], result: Optional[ImportResult] = None, chunk_size: int = 1000,
+                 create_farmers: bool = False, progress: Optional[Callable[[ImportResult], None]] = None) -> ImportResult:
+    """
+    Upsert crops from (line, {"farmer", "crop", "base_price", "discounts"}) rows keyed on
+    uix_crops_farmer_name. Per chunk: one $in lookup for unknown farmer names (created first
+    when create_farmers), one for the crops being replaced, one unordered crop bulk_write and
+    one crop_price_stats bulk_write moving the stats from the old prices to the new ones.
+    """
+    from pymongo import UpdateOne
+    from db import crops_col, farmers_col, normalize_crop_name, record_crop_prices
+
+    result = result or ImportResult()
+    farmer_ids = {}
+    for chunk in _chunks(rows, chunk_size):
+        parsed = []
+        for line, row in chunk:
+            result.rows += 1
+            try:
+                parsed.append((line, *_crop_row(row)))
+            except ValueError as e:
+                result.failures.append((line, str(e)))
+
+        unknown = list({p[1] for p in parsed} - farmer_ids.keys())
+        if unknown and create_farmers:
+            farmers_col.bulk_write([UpdateOne({"name": n}, {"$setOnInsert": {"name": n}}, upsert=True) for n in unknown], ordered=False)
+        if unknown:
+            farmer_ids.update((f["name"], f["_id"]) for f in farmers_col.find({"name": {"$in": unknown}}, {"name": 1}))
+
+        # Later rows for the same crop win; the earlier ones count as unchanged
+        latest = {}
+        for line, farmer, name, base_price, rules in parsed:
+            fid = farmer_ids.get(farmer)
+            if fid is None:
+                result.failures.append((line, f"unknown farmer '{farmer}'"))
+                continue
+            if (fid, name) in latest:
+                result.unchanged += 1
+            latest[(fid, name)] = (line, base_price, rules)
+        if not latest:
+            _finish(result, progress)
+            continue
+
+        old_prices = {
+            (c["farmer_id"], c["name"]): c.get("base_price")
+            for c in crops_col.find(
+                {"farmer_id": {"$in": list({fid for fid, _ in latest})}, "name": {"$in": list({n for _, n in latest})}},
+                {"farmer_id": 1, "name": 1, "base_price": 1},
+            )
+            if (c["farmer_id"], c["name"]) in latest
+        }
+        ops, lines, keys = [], [], []
+        for (fid, name), (line, base_price, rules) in latest.items():
+            ops.append(UpdateOne(
+                {"farmer_id": fid, "name": name},
+                {"$set": {"base_price": base_price, "discount_rules": rules, "name_lc": normalize_crop_name(name)}},
+                upsert=True,
+            ))
+            lines.append(line)
+            keys.append((fid, name, base_price))
+        failed = _bulk_write(crops_col, ops, lines, result)
+
+        added, removed = [], []
+        for i, (fid, name, base_price) in enumerate(keys):
+            old = old_prices.get((fid, name))
+            if i in failed or old == base_price:
+                continue
+            added.append({"farmer_id": fid, "name": name, "base_price": base_price})
+            if old is not None:
+                removed.append({"farmer_id": fid, "name": name, "base_price": old})
+        record_crop_prices(added, removed)
+        _finish(result, progress)
+    _finish(result, None)
+    return result
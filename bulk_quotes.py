@@ -0,0 +1,167 @@
+import os
+import re
+import zipfile
+from collections import deque
+from typing import Callable, Iterable, Optional
+
+
+def _render_one(context: dict):
+    """Worker entry point: returns (pdf_bytes, None) or (None, error message)."""
+    from utils import render_quote_to_pdf_bytes
+    try:
+        return render_quote_to_pdf_bytes(context), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+_SAFE_NAME = re.compile(r"[A-Za-z0-9-]+")
+
+
+def _pdf_name(quote_id: str) -> str:
+    """<quote_id>.pdf; rejects IDs that could escape the output directory or archive."""
+    if not _SAFE_NAME.fullmatch(quote_id):
+        raise ValueError(f"unsafe quote_id for a file name: {quote_id!r}")
+    return f"{quote_id}.pdf"
+
+
+class DirectorySink:
+    """Write each PDF as <directory>/<quote_id>.pdf."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, quote_id: str, pdf_bytes: bytes) -> None:
+        with open(os.path.join(self.directory, _pdf_name(quote_id)), "wb") as f:
+            f.write(pdf_bytes)
+
+    def close(self) -> None:
+        pass
+
+
+class ZipSink:
+    """Append each PDF to a single zip archive."""
+
+    def __init__(self, path: str):
+        # PDFs are already compressed; storing avoids burning CPU on deflate
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+
+    def write(self, quote_id: str, pdf_bytes: bytes) -> None:
+        self._zip.writestr(_pdf_name(quote_id), pdf_bytes)
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+class GridFSSink:
+    """Store each PDF in GridFS as a quote_original and link it from the quote document."""
+
+    def __init__(self, link_quotes: bool = True):
+        from gridfs import GridFS
+        from db import get_db
+
+        self.fs = GridFS(get_db())
+        self.link_quotes = link_quotes
+        self.file_ids = {}
+
+    def write(self, quote_id: str, pdf_bytes: bytes) -> None:
+        fid = self.fs.put(pdf_bytes, filename=f"{quote_id}.pdf", metadata={"type": "quote_original", "quote_id": quote_id})
+        self.file_ids[quote_id] = fid
+
+    def close(self) -> None:
+        if not self.link_quotes or not self.file_ids:
+            return
+        from pymongo import UpdateOne
+        from db import quotes_col
+
+        ops = [UpdateOne({"quote_id": qid}, {"$set": {"original_file_id": fid}}) for qid, fid in self.file_ids.items()]
+        quotes_col.bulk_write(ops, ordered=False)
+
+
+class BulkResult:
+    def __init__(self):
+        self.written = 0
+        self.failures = []  # (index, quote_id, error)
+
+    def __repr__(self) -> str:
+        return f"BulkResult(written={self.written}, failed={len(self.failures)})"
+
+
+def generate_quote_pdfs(
+    contexts: Iterable[dict],
+    sink,
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    max_pool_restarts: int = 3,
+    render: Callable[[dict], tuple] = _render_one,
+) -> BulkResult:
+    """
+    Render quote contexts to PDF across a process pool and hand the results to
+    `sink` in input order. At most `max_in_flight` contexts are queued at once, so
+    arbitrarily large iterables stream through with bounded memory. A context that
+    fails to render is recorded in the result and does not stop the batch.
+    If a worker process dies, the quotes in flight are recorded as failed and a fresh
+    pool carries on; after `max_pool_restarts` the remaining quotes are recorded as
+    failed without rendering. `progress(done, failed)` is called after every item.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    result = BulkResult()
+    pending = deque()
+    done = 0
+
+    def _record(index, quote_id, error):
+        nonlocal done
+        if error is not None:
+            result.failures.append((index, quote_id, error))
+        done += 1
+        if progress:
+            progress(done, len(result.failures))
+
+    def _drain_one():
+        index, quote_id, future = pending.popleft()
+        try:
+            pdf_bytes, error = future.result()
+        except BrokenProcessPool:
+            pdf_bytes, error = None, "BrokenProcessPool: a worker process died while rendering"
+        except Exception as e:
+            pdf_bytes, error = None, f"{type(e).__name__}: {e}"
+        if error is None:
+            try:
+                sink.write(quote_id, pdf_bytes)
+                result.written += 1
+            except Exception as e:
+                error = f"sink: {type(e).__name__}: {e}"
+        _record(index, quote_id, error)
+
+    pool, restarts = ProcessPoolExecutor(max_workers=workers), 0
+    try:
+        for index, context in enumerate(contexts):
+            quote_id = str(context.get("quote_id") or f"quote-{index}")
+            while pool is not None:
+                try:
+                    pending.append((index, quote_id, pool.submit(render, context)))
+                    break
+                except BrokenProcessPool:
+                    # Everything still in flight fails with the pool; start over with a fresh one
+                    while pending:
+                        _drain_one()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    restarts += 1
+                    pool = ProcessPoolExecutor(max_workers=workers) if restarts <= max_pool_restarts else None
+            if pool is None:
+                _record(index, quote_id, f"skipped: worker pool crashed {restarts} times")
+                continue
+            if len(pending) >= max_in_flight:
+                _drain_one()
+        while pending:
+            _drain_one()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        sink.close()
+    return result
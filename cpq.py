@@ -1,20 +1,113 @@
 # cpq.py
+from bisect import bisect_right
+
 
 def calculate_price(base_price, crop_count, discount_rules):
     """
     Calculate total price applying tiered discounts.
     discount_rules = list of dicts like:
     [{'min_crops': 2, 'discount_percent': 5}, {'min_crops': 3, 'discount_percent': 10}]
+    or a precompiled DiscountSchedule.
     """
     total = base_price * crop_count
-    applicable_discount = 0
 
-    # Find highest discount applicable based on crop_count
-    for rule in discount_rules:
-        if crop_count >= rule['min_crops']:
-            if rule['discount_percent'] > applicable_discount:
-                applicable_discount = rule['discount_percent']
+    if isinstance(discount_rules, DiscountSchedule):
+        applicable_discount = discount_rules.discount_for(crop_count)
+    else:
+        applicable_discount = 0
+        # Find highest discount applicable based on crop_count
+        for rule in discount_rules:
+            if crop_count >= rule['min_crops']:
+                if rule['discount_percent'] > applicable_discount:
+                    applicable_discount = rule['discount_percent']
 
     discount_amount = total * (applicable_discount / 100)
     final_price = total - discount_amount
     return final_price, applicable_discount
+
+
+class DiscountSchedule:
+    """
+    Discount rules sorted once by min_crops, with the best discount reachable at
+    each threshold precomputed as a running max, so a lookup is a single bisect.
+    """
+
+    __slots__ = ("thresholds", "best_discounts")
+
+    def __init__(self, discount_rules):
+        thresholds = []
+        best_discounts = []
+        best = 0
+        for rule in sorted(discount_rules or [], key=lambda r: r['min_crops']):
+            if rule['discount_percent'] > best:
+                best = rule['discount_percent']
+            thresholds.append(rule['min_crops'])
+            best_discounts.append(best)
+        self.thresholds = thresholds
+        self.best_discounts = best_discounts
+
+    def __len__(self):
+        return len(self.thresholds)
+
+    def discount_for(self, crop_count):
+        """Highest discount percent applicable to crop_count (0 if no tier applies)."""
+        idx = bisect_right(self.thresholds, crop_count)
+        return self.best_discounts[idx - 1] if idx else 0
+
+    def discounts_for(self, crop_counts):
+        """Vectorized discount_for over an array of crop counts."""
+        import numpy as np
+
+        counts = np.asarray(crop_counts)
+        if not self.thresholds:
+            return np.zeros(counts.shape, dtype=float)
+        idx = np.searchsorted(np.asarray(self.thresholds), counts, side='right')
+        best = np.concatenate(([0.0], np.asarray(self.best_discounts, dtype=float)))
+        return best[idx]
+
+
+class CropPricer:
+    """Compiled pricing for one crop: base price plus its DiscountSchedule."""
+
+    __slots__ = ("base_price", "schedule")
+
+    def __init__(self, base_price, discount_rules):
+        self.base_price = base_price
+        self.schedule = discount_rules if isinstance(discount_rules, DiscountSchedule) else DiscountSchedule(discount_rules)
+
+    @classmethod
+    def from_crop(cls, crop: dict) -> "CropPricer":
+        """Build a pricer from a crops collection document."""
+        return cls(crop["base_price"], crop.get("discount_rules", []))
+
+    def price(self, crop_count):
+        """Same result as calculate_price(base_price, crop_count, discount_rules)."""
+        return calculate_price(self.base_price, crop_count, self.schedule)
+
+    def price_many(self, crop_counts):
+        """
+        Price an array of crop counts in one vectorized call.
+        Returns (final_prices, discount_percents) as NumPy arrays.
+        """
+        import numpy as np
+
+        counts = np.asarray(crop_counts)
+        discounts = self.schedule.discounts_for(counts)
+        total = self.base_price * counts.astype(float)
+        final = total - total * (discounts / 100)
+        return final, discounts
+
+
+def price_grid(pricers, crop_counts):
+    """
+    Price every crop in `pricers` against every count in `crop_counts`.
+    Returns (final_prices, discount_percents), each shaped (len(pricers), len(crop_counts)).
+    """
+    import numpy as np
+
+    counts = np.asarray(crop_counts)
+    finals = np.empty((len(pricers), counts.size), dtype=float)
+    discounts = np.empty((len(pricers), counts.size), dtype=float)
+    for row, pricer in enumerate(pricers):
+        finals[row], discounts[row] = pricer.price_many(counts.ravel())
+    return finals, discounts
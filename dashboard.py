@@ -0,0 +1,112 @@
+import streamlit as st
+
+import analytics
+import quote_export
+from cache import TTLCache
+from pickers import farmer_picker
+
+
+# Streamlit keeps a generated download in memory while the session lasts, so in-app exports
+# stop here; `python main.py export-quotes` streams any size to disk.
+EXPORT_MAX_ROWS = 200_000
+_MIME = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+# At most one incremental rollup refresh per minute per process, capped so a large backlog
+# (first run, or a long idle spell) is worked off over several page views.
+_refreshed = TTLCache(ttl=60, maxsize=1)
+
+
+def _refresh(force: bool = False):
+    if force:
+        _refreshed.invalidate()
+    return _refreshed.get_or_load("quotes", lambda: analytics.refresh_quote_rollups(max_batches=20))
+
+
+def _farmer_names(ids) -> dict:
+    from db import farmers_col
+
+    return {f["_id"]: f.get("name", "") for f in farmers_col.find({"_id": {"$in": list(ids)}}, {"name": 1})}
+
+
+def _export_file(fmt: str, farmer_id, since, until):
+    import tempfile
+    from datetime import datetime, time, timedelta
+
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    quote_export.export_quotes(
+        out, fmt, farmer_id=farmer_id,
+        since=datetime.combine(since, time()) if since else None,
+        until=datetime.combine(until + timedelta(days=1), time()) if until else None,
+        limit=EXPORT_MAX_ROWS,
+    )
+    out.seek(0)
+    return out
+
+
+def _render_export() -> None:
+    with st.expander("Export quotes"):
+        farmer = None
+        if st.checkbox("Only one farmer", key="export_one_farmer"):
+            farmer = farmer_picker("Farmer", "export_farmer")
+            if farmer is None:
+                return
+        c1, c2, c3 = st.columns(3)
+        since = c1.date_input("From", value=None, key="export_since")
+        until = c2.date_input("To", value=None, key="export_until")
+        fmt = c3.selectbox("Format", quote_export.FORMATS, key="export_format")
+        farmer_id = farmer["_id"] if farmer else None
+        st.download_button(
+            "Download quotes", data=lambda: _export_file(fmt, farmer_id, since, until),
+            file_name=f"quotes.{fmt}", mime=_MIME[fmt], on_click="ignore", key="export_download_btn",
+        )
+        st.caption(f"Generated when clicked; stops at {EXPORT_MAX_ROWS:,} quotes. "
+                   "For full history run `python main.py export-quotes`.")
+
+
+def render_analytics() -> None:
+    st.header("Quote Analytics")
+    if st.button("Refresh rollups", key="analytics_refresh_btn"):
+        if _refresh(force=True) is None:
+            st.info("Another refresh is already running; figures below may lag behind by a few quotes.")
+    else:
+        _refresh()
+
+    totals = analytics.overall_totals()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Quotes", f"{totals['quotes']:,}")
+    c2.metric("Quantity", f"{totals['quantity']:,}")
+    c3.metric("Revenue", f"₹{totals['revenue']:,.0f}")
+    c4.metric("Avg discount", f"{totals['avg_discount_percent']:.1f}%")
+
+    days = st.selectbox("Daily view", [7, 30, 90, 365], index=1, format_func=lambda d: f"Last {d} days", key="analytics_days")
+    daily = analytics.daily_totals(days)
+    if daily:
+        st.bar_chart({"day": [r["day"] for r in daily], "revenue": [r["revenue"] for r in daily]}, x="day", y="revenue")
+        st.dataframe([{
+            "Day": r["day"], "Quotes": r["quotes"], "Quantity": r["quantity"],
+            "Revenue (₹)": round(r["revenue"], 2), "Avg discount (%)": round(r["avg_discount_percent"], 2),
+        } for r in daily], hide_index=True)
+    else:
+        st.info("No quotes in this period.")
+
+    by = st.radio("Rank by", ["revenue", "quotes"], horizontal=True, key="analytics_rank_by")
+    left, right = st.columns(2)
+    farmers = analytics.top("farmer", by=by)
+    names = _farmer_names(r["farmer_id"] for r in farmers)
+    left.subheader("Top farmers")
+    left.dataframe([{
+        "Farmer": names.get(r["farmer_id"], str(r["farmer_id"])), "Quotes": r["quotes"],
+        "Revenue (₹)": round(r["revenue"], 2), "Avg discount (%)": round(r["avg_discount_percent"], 2),
+    } for r in farmers], hide_index=True)
+    right.subheader("Top crops")
+    right.dataframe([{
+        "Crop": r["crop"], "Quotes": r["quotes"], "Quantity": r["quantity"],
+        "Revenue (₹)": round(r["revenue"], 2), "Avg discount (%)": round(r["avg_discount_percent"], 2),
+    } for r in analytics.top("crop", by=by)], hide_index=True)
+
+    updated = analytics.rollups_updated_at()
+    st.caption(
+        f"From the quote_rollups summary collection, last extended {updated:%Y-%m-%d %H:%M} UTC. "
+        "Quotes appear about two minutes after they are created." if updated else "No quotes rolled up yet."
+    )
+    _render_export()
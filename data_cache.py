@@ -0,0 +1,181 @@
+import logging
+import threading
+
+from cache import TTLCache, price_suggestions
+
+log = logging.getLogger(__name__)
+
+
+# Farmer and crop lookups used by the Streamlit pages. Entries are dropped explicitly on
+# writes from this process; the TTL bounds staleness from writers elsewhere (CLI, other
+# Streamlit processes), and the optional change-stream listener tightens that further.
+farmers_cache = TTLCache(ttl=300, maxsize=512)
+crops_cache = TTLCache(ttl=300, maxsize=4096)
+
+
+def farmer_page(prefix: str = "", after=None) -> tuple:
+    """(farmers, next cursor) for one picker page; see db.search_farmers."""
+    def _load():
+        from db import search_farmers
+        return search_farmers(prefix, after)
+    return farmers_cache.get_or_load((prefix, after), _load)
+
+
+def _crops(farmer_id) -> dict:
+    """{crop name: crop document} for one farmer."""
+    def _load():
+        from db import crops_col
+        docs = crops_col.find({"farmer_id": farmer_id}, {"name": 1, "base_price": 1, "discount_rules": 1, "farmer_id": 1})
+        return {c["name"]: c for c in docs if c.get("name")}
+    return crops_cache.get_or_load(farmer_id, _load)
+
+
+def crop_names(farmer_id) -> list:
+    return list(_crops(farmer_id))
+
+
+def crop(farmer_id, name: str):
+    return _crops(farmer_id).get(name)
+
+
+def invalidate_farmers() -> None:
+    farmers_cache.invalidate()
+
+
+def invalidate_crops(farmer_id=None) -> None:
+    """Drop one farmer's crop list, or all of them when farmer_id is None."""
+    crops_cache.invalidate(farmer_id)
+    price_suggestions.invalidate()
+
+
+def cache_stats() -> dict:
+    return {
+        name: {"hits": c.hits, "misses": c.misses, "hit_rate": c.hit_rate}
+        for name, c in (("farmers", farmers_cache), ("crops", crops_cache), ("price_suggestions", price_suggestions))
+    }
+
+
+# Server codes for a stream that cannot continue from its resume token (InvalidResumeToken,
+# ChangeStreamFatalError, ChangeStreamHistoryLost) and for a server without change streams
+_RESUME_LOST = {260, 280, 286}
+_NOT_SUPPORTED = {40573}
+
+
+class ChangeStreamListener:
+    """
+    Invalidate caches from a Mongo change stream on farmers/crops, so writes made by other
+    processes show up immediately.
+
+    - Errors reconnect with exponential backoff (min_backoff doubling up to max_backoff
+      seconds), resuming after the last event seen, so nothing is missed across a blip.
+    - When the stream cannot resume (token invalid or aged out of the oplog) every cache is
+      dropped, since changes may have been missed, and a fresh stream starts.
+    - Change streams need a replica set (Atlas always is); on a standalone mongod the
+      listener stops and the TTL alone applies.
+    - status() reports the state and last error for the UI.
+    """
+
+    def __init__(self, watch=None, min_backoff: float = 1.0, max_backoff: float = 60.0, max_await_ms: int = 1000):
+        self._watch = watch
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_await_ms = max_await_ms
+        self.resume_token = None
+        self.state = "starting"
+        self.last_error = None
+        self.reconnects = 0
+        self.full_invalidations = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "ChangeStreamListener":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="data-cache-change-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = 5) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def status(self) -> dict:
+        return {"state": self.state, "last_error": self.last_error, "reconnects": self.reconnects,
+                "full_invalidations": self.full_invalidations}
+
+    def _open(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": ["farmers", "crops"]}}}]
+        watch = self._watch
+        if watch is None:
+            from db import get_db
+            watch = get_db().watch
+        kwargs = {"resume_after": self.resume_token} if self.resume_token else {}
+        return watch(pipeline, full_document="updateLookup", max_await_time_ms=self.max_await_ms, **kwargs)
+
+    def run(self) -> None:
+        """Watch until stopped (or change streams turn out to be unsupported)."""
+        from pymongo.errors import OperationFailure
+
+        delay = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                with self._open() as stream:
+                    self.state, delay = "watching", self.min_backoff
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self._apply(change)
+                        self.resume_token = stream.resume_token or self.resume_token
+            except OperationFailure as err:
+                self.last_error = f"{type(err).__name__}: {err}"
+                if err.code in _NOT_SUPPORTED:
+                    self.state = "unavailable"
+                    log.info("change streams unsupported by this server; caches rely on their TTL")
+                    return
+                if err.code in _RESUME_LOST and self.resume_token is not None:
+                    log.warning("change stream could not resume (%s); dropping all cached data", err)
+                    self.resume_token = None
+                    self._invalidate_all()
+                    continue
+                delay = self._backoff(delay, err)
+            except Exception as err:
+                self.last_error = f"{type(err).__name__}: {err}"
+                delay = self._backoff(delay, err)
+        self.state = "stopped"
+
+    def _backoff(self, delay: float, err: Exception) -> float:
+        self.state = "reconnecting"
+        self.reconnects += 1
+        log.warning("change stream failed (%s); reconnecting in %.0fs", err, delay)
+        self._stop.wait(delay)
+        return min(delay * 2, self.max_backoff)
+
+    def _invalidate_all(self) -> None:
+        self.full_invalidations += 1
+        invalidate_farmers()
+        invalidate_crops()
+
+    def _apply(self, change: dict) -> None:
+        if change["ns"]["coll"] == "farmers":
+            invalidate_farmers()
+        else:
+            doc = change.get("fullDocument") or {}
+            invalidate_crops(doc.get("farmer_id"))
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_change_stream_listener() -> ChangeStreamListener:
+    """Start the process-wide listener once (idempotent)."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = ChangeStreamListener().start()
+        return _listener
+
+
+def change_stream_status():
+    return _listener.status() if _listener is not None else None
@@ -0,0 +1,234 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pdf_store
+
+
+class DeletionWorker:
+    """Background cascade deletes.
+
+    - A job (db.delete_jobs_col) names a quote filter and optionally a crop filter. Quotes go
+      first, batch by batch, together with their sign tokens and GridFS files; then crops.
+    - Every batch is checkpointed on the job: the phase, running counts, and the file ids of
+      quotes already deleted but not yet released. A job whose worker died is reclaimed once
+      its lease expires and carries on from the checkpoint.
+    - Files are released through pdf_store.release, which keeps blobs other quotes still share.
+    - Throttled to a duty cycle: after a batch that took t seconds the worker sleeps
+      t * (1 - duty_cycle) / duty_cycle, so deletes never hold more than that share of the
+      database's attention however large the cascade.
+    """
+
+    def __init__(self, jobs_col=None, batch_size: int = 200, duty_cycle: float = 0.25, poll_interval: float = 2.0,
+                 lease_seconds: int = 300, max_attempts: int = 5):
+        if jobs_col is None:
+            from db import delete_jobs_col as jobs_col
+        self.jobs_col = jobs_col
+        self.batch_size = batch_size
+        self.duty_cycle = min(1.0, max(0.01, duty_cycle))
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, quote_filter: dict, crop_filter: dict | None = None, label: str = ""):
+        """Persist a deletion job and return its id; the work happens on the worker thread."""
+        now = datetime.utcnow()
+        job_id = self.jobs_col.insert_one({
+            "label": label,
+            "quote_filter": quote_filter,
+            "crop_filter": crop_filter,
+            "phase": "quotes",
+            "pending_files": [],
+            "deleted": {"quotes": 0, "crops": 0, "files": 0},
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now,
+        }).inserted_id
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def recent_jobs(self, limit: int = 10) -> list:
+        return list(self.jobs_col.find({}, {"quote_filter": 0, "crop_filter": 0, "pending_files": 0},
+                                       sort=[("created_at", -1)], limit=limit))
+
+    # -- worker -------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="deletion-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 10) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                worked = self.run_once()
+            except Exception:
+                worked = False
+            if not worked:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self) -> bool:
+        """Claim one job and run it to completion (or until stopped); False if none was due."""
+        job = self._claim()
+        if job is None:
+            return False
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                job = self._step(job)
+                if job["status"] == "done":
+                    break
+                self._throttle(time.monotonic() - started)
+        except Exception as err:
+            attempts = job.get("attempts", 0) + 1
+            self.jobs_col.update_one({"_id": job["_id"]}, {
+                "$set": {"status": "failed" if attempts >= self.max_attempts else "pending", "attempts": attempts,
+                         "last_error": f"{type(err).__name__}: {err}", "updated_at": datetime.utcnow()},
+                "$unset": {"lease_until": ""},
+            })
+        return True
+
+    def _throttle(self, busy: float) -> None:
+        self._stop.wait(busy * (1 - self.duty_cycle) / self.duty_cycle)
+
+    def _claim(self):
+        from pymongo import ReturnDocument
+
+        now = datetime.utcnow()
+        due = {"$or": [{"status": "pending"}, {"status": "running", "lease_until": {"$lt": now}}]}
+        claim = {"$set": {"status": "running", "lease_until": now + timedelta(seconds=self.lease_seconds)}}
+        return self.jobs_col.find_one_and_update(due, claim, sort=[("created_at", 1)], return_document=ReturnDocument.AFTER)
+
+    def _checkpoint(self, job: dict, update: dict) -> dict:
+        from pymongo import ReturnDocument
+
+        now = datetime.utcnow()
+        update.setdefault("$set", {}).update({"updated_at": now, "lease_until": now + timedelta(seconds=self.lease_seconds)})
+        return self.jobs_col.find_one_and_update({"_id": job["_id"]}, update, return_document=ReturnDocument.AFTER)
+
+    def _step(self, job: dict) -> dict:
+        """Run one batch of the job and return the job as checkpointed afterwards."""
+        if job.get("pending_files"):
+            released = pdf_store.release(job["pending_files"])
+            return self._checkpoint(job, {"$set": {"pending_files": []}, "$inc": {"deleted.files": released}})
+        if job["phase"] == "quotes":
+            return self._delete_quotes(job)
+        if job["phase"] == "crops":
+            return self._delete_crops(job)
+        return self._checkpoint(job, {"$set": {"phase": "done", "status": "done"}})
+
+    def _delete_quotes(self, job: dict) -> dict:
+        from db import quotes_col, sign_tokens_col
+
+        fields = {f: 1 for f in pdf_store.REFERENCE_FIELDS}
+        batch = list(quotes_col.find(job["quote_filter"], fields, sort=[("_id", 1)], limit=self.batch_size))
+        if not batch:
+            return self._checkpoint(job, {"$set": {"phase": "crops" if job.get("crop_filter") else "done"}})
+        ids = [q["_id"] for q in batch]
+        files = list(set().union(*(pdf_store.file_refs(q) for q in batch)))
+        # Record the files first: once the quotes are gone nothing else leads back to them
+        job = self._checkpoint(job, {"$set": {"pending_files": files}})
+        sign_tokens_col.delete_many({"quote_oid": {"$in": ids}})
+        removed = quotes_col.delete_many({"_id": {"$in": ids}}).deleted_count
+        return self._checkpoint(job, {"$inc": {"deleted.quotes": removed}})
+
+    def _delete_crops(self, job: dict) -> dict:
+        from db import crops_col, forget_crop_prices
+
+        batch = list(crops_col.find(job["crop_filter"], {"farmer_id": 1, "name": 1, "base_price": 1},
+                                    sort=[("_id", 1)], limit=self.batch_size))
+        if not batch:
+            return self._checkpoint(job, {"$set": {"phase": "done"}})
+        # A crash between these two leaves crop_price_stats counting the batch until
+        # `python main.py rebuild-price-stats` runs; it never subtracts twice.
+        removed = crops_col.delete_many({"_id": {"$in": [c["_id"] for c in batch]}}).deleted_count
+        forget_crop_prices(batch)
+        return self._checkpoint(job, {"$inc": {"deleted.crops": removed}})
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_deletion_worker() -> DeletionWorker:
+    """Process-wide worker (survives Streamlit reruns because modules are cached)."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = DeletionWorker()
+            _worker.start()
+        return _worker
+
+
+def sweep_orphaned_files(min_age: timedelta = timedelta(hours=1), batch_size: int = 500, dry_run: bool = False,
+                         max_passes: int = 10) -> dict:
+    """
+    Reclaim quote PDFs in GridFS that no quote references (left by the old inline deletes or
+    by interrupted writes), plus chunks whose fs.files document is gone. Files younger than
+    min_age are skipped: a quote's original PDF is stored just before the quote itself. Bases
+    freed by deleting their deltas are picked up by the next pass. Returns counts.
+    """
+    from db import get_db
+
+    files, chunks = get_db()["fs.files"], get_db()["fs.chunks"]
+    cutoff = datetime.utcnow() - min_age
+    query = {"metadata.type": {"$in": ["quote_original", "quote_signed"]}, "uploadDate": {"$lt": cutoff}}
+    stats = {"scanned": 0, "orphaned": 0, "orphaned_bytes": 0, "deleted": 0, "orphaned_chunk_files": 0}
+
+    for _ in range(max_passes):
+        deleted_before, after = stats["deleted"], None
+        while True:
+            page = query if after is None else {"$and": [query, {"_id": {"$gt": after}}]}
+            batch = list(files.find(page, {"length": 1}, sort=[("_id", 1)], limit=batch_size))
+            if not batch:
+                break
+            after = batch[-1]["_id"]
+            live = pdf_store.referenced(d["_id"] for d in batch)
+            orphans = [d for d in batch if d["_id"] not in live]
+            stats["scanned"] += len(batch)
+            stats["orphaned"] += len(orphans)
+            stats["orphaned_bytes"] += sum(d.get("length", 0) for d in orphans)
+            if orphans and not dry_run:
+                stats["deleted"] += pdf_store.release(d["_id"] for d in orphans)
+        if dry_run or stats["deleted"] == deleted_before:
+            break
+
+    # GridFS deletes the files document before the chunks, so a crash in between strands them.
+    # Uploads write chunks before the files document too; their ObjectId's age tells them apart.
+    owners = chunks.aggregate([{"$sort": {"files_id": 1}}, {"$group": {"_id": "$files_id"}}], allowDiskUse=True)
+    batch = []
+    for owner in owners:
+        batch.append(owner["_id"])
+        if len(batch) >= batch_size:
+            stats["orphaned_chunk_files"] += _drop_stranded_chunks(files, chunks, batch, cutoff, dry_run)
+            batch = []
+    stats["orphaned_chunk_files"] += _drop_stranded_chunks(files, chunks, batch, cutoff, dry_run)
+    return stats
+
+
+def _drop_stranded_chunks(files, chunks, file_ids: list, cutoff: datetime, dry_run: bool) -> int:
+    from bson import ObjectId
+
+    file_ids = [fid for fid in file_ids if isinstance(fid, ObjectId) and fid.generation_time.replace(tzinfo=None) < cutoff]
+    if not file_ids:
+        return 0
+    present = {d["_id"] for d in files.find({"_id": {"$in": file_ids}}, {"_id": 1})}
+    stranded = [fid for fid in file_ids if fid not in present]
+    if stranded and not dry_run:
+        chunks.delete_many({"files_id": {"$in": stranded}})
+    return len(stranded)
@@ -1,7 +1,30 @@
-import smtplib
-from email.message import EmailMessage
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable
+from datetime import datetime, timedelta
 import os
+import threading
+import time
+
+if TYPE_CHECKING:
+	from email.message import EmailMessage  # imported at call time; keeps startup light
+
+
+def _build_message(
+	from_addr: str,
+	to_emails: Iterable[str],
+	subject: str,
+	body: str,
+	pdf_bytes: bytes,
+	filename: str,
+) -> "EmailMessage":
+	from email.message import EmailMessage
+
+	msg = EmailMessage()
+	msg["From"] = from_addr
+	msg["To"] = ", ".join([e for e in to_emails if e])
+	msg["Subject"] = subject
+	msg.set_content(body)
+	msg.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename=filename)
+	return msg
 
 
 def send_pdf_via_gmail(
@@ -18,12 +41,9 @@ def send_pdf_via_gmail(
 	- Requires a Gmail App Password if 2FA is enabled (recommended).
 	- to_emails can be any iterable of email strings.
 	"""
-	msg = EmailMessage()
-	msg["From"] = gmail_user
-	msg["To"] = ", ".join([e for e in to_emails if e])
-	msg["Subject"] = subject
-	msg.set_content(body)
-	msg.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename=filename)
+	import smtplib
+
+	msg = _build_message(gmail_user, to_emails, subject, body, pdf_bytes, filename)
 
 	with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
 		smtp.login(gmail_user, app_password)
@@ -47,3 +67,260 @@ def send_gmail_pdf_env(
 	send_pdf_via_gmail(user, pw, to_emails, subject, body, pdf_bytes, filename)
 
 
+def _smtp_settings():
+	"""SMTP endpoint; defaults to Gmail over SSL. Point SMTP_HOST/SMTP_PORT/SMTP_SSL=0 at a local server for testing."""
+	host = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+	port = int(os.environ.get("SMTP_PORT", "465"))
+	use_ssl = os.environ.get("SMTP_SSL", "1").lower() not in {"0", "false", "no"}
+	return host, port, use_ssl
+
+
+def _is_transient(err: Exception) -> bool:
+	"""Connection drops and 4xx replies are retried; auth failures, refusals and 5xx are not."""
+	import smtplib
+
+	if isinstance(err, smtplib.SMTPRecipientsRefused):
+		return False
+	if isinstance(err, smtplib.SMTPResponseException):
+		return 400 <= err.smtp_code < 500
+	if isinstance(err, smtplib.SMTPServerDisconnected):
+		return True
+	# Every SMTPException is an OSError; the rest (no AUTH method, unsupported command) are permanent
+	if isinstance(err, smtplib.SMTPException):
+		return False
+	return isinstance(err, OSError)
+
+
+class MailDispatcher:
+	"""Background email queue.
+
+	- Jobs are persisted in Mongo (db.mail_jobs_col) before enqueue() returns, so a crash
+	  loses nothing; jobs stuck in "sending" are reclaimed once their lease expires.
+	- One authenticated SMTP connection per account is kept open and reused across messages.
+	- Each cycle claims up to batch_size due jobs and sends them over the cached connections.
+	- Transient failures are retried with exponential backoff up to max_attempts.
+	- App passwords live only in memory: jobs for an account wait until it is registered
+	  again (by enqueue() or register_account()) after a restart. GMAIL_USER/GMAIL_APP_PW
+	  from the environment are registered automatically.
+	"""
+
+	def __init__(self, jobs_col=None, batch_size: int = 20, poll_interval: float = 1.0, max_attempts: int = 6,
+			base_backoff: float = 5.0, lease_seconds: int = 300, idle_timeout: float = 60.0):
+		if jobs_col is None:
+			from db import mail_jobs_col as jobs_col
+		self.jobs_col = jobs_col
+		self.batch_size = batch_size
+		self.poll_interval = poll_interval
+		self.max_attempts = max_attempts
+		self.base_backoff = base_backoff
+		self.lease_seconds = lease_seconds
+		self.idle_timeout = idle_timeout
+		self._credentials = {}
+		self._connections = {}  # account -> (smtp, last_used monotonic)
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._thread = None
+		env_user, env_pw = os.environ.get("GMAIL_USER"), os.environ.get("GMAIL_APP_PW")
+		if env_user and env_pw:
+			self.register_account(env_user, env_pw)
+
+	def register_account(self, gmail_user: str, app_password: str) -> None:
+		self._credentials[gmail_user] = app_password
+		self._wake.set()
+
+	def enqueue(self, gmail_user: str, to_emails: Iterable[str], subject: str, body: str, pdf_bytes: bytes,
+			filename: str, app_password: str | None = None):
+		"""Persist a send job and return its id; delivery happens on the dispatcher thread."""
+		if app_password:
+			self.register_account(gmail_user, app_password)
+		if gmail_user not in self._credentials:
+			raise ValueError(f"No app password registered for {gmail_user}.")
+		now = datetime.utcnow()
+		job_id = self.jobs_col.insert_one({
+			"account": gmail_user,
+			"to": [e for e in to_emails if e],
+			"subject": subject,
+			"body": body,
+			"filename": filename,
+			"pdf": bytes(pdf_bytes),
+			"status": "pending",
+			"attempts": 0,
+			"next_attempt_at": now,
+			"last_error": None,
+			"created_at": now,
+		}).inserted_id
+		self.start()
+		self._wake.set()
+		return job_id
+
+	def job_statuses(self, job_ids) -> list:
+		"""The given jobs without their PDFs (status, attempts, last_error, ...), in the order given."""
+		job_ids = list(job_ids)
+		docs = {d["_id"]: d for d in self.jobs_col.find({"_id": {"$in": job_ids}}, {"pdf": 0, "body": 0})}
+		return [docs[i] for i in job_ids if i in docs]
+
+	def retry(self, job_id) -> bool:
+		"""Queue a failed job again with a fresh attempt budget; False if it had not failed."""
+		res = self.jobs_col.update_one(
+			{"_id": job_id, "status": "failed"},
+			{"$set": {"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow()}},
+		)
+		if not res.modified_count:
+			return False
+		self.start()
+		self._wake.set()
+		return True
+
+	# -- worker -------------------------------------------------------------
+
+	def start(self) -> None:
+		if self._thread and self._thread.is_alive():
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+		self._thread.start()
+
+	def stop(self, timeout: float | None = 10) -> None:
+		self._stop.set()
+		self._wake.set()
+		if self._thread:
+			self._thread.join(timeout)
+		self._close_all()
+
+	def _run(self) -> None:
+		while not self._stop.is_set():
+			try:
+				sent = self.run_once()
+			except Exception:
+				sent = 0
+			if not sent:
+				self._wake.wait(self.poll_interval)
+				self._wake.clear()
+			self._close_idle()
+
+	def run_once(self) -> int:
+		"""Claim and process one batch of due jobs; returns how many were handled."""
+		jobs = self._claim()
+		for job in jobs:
+			self._deliver(job)
+		return len(jobs)
+
+	def _claim(self) -> list:
+		accounts = list(self._credentials)
+		if not accounts:
+			return []
+		now = datetime.utcnow()
+		due = {"account": {"$in": accounts}, "$or": [
+			{"status": "pending", "next_attempt_at": {"$lte": now}},
+			{"status": "sending", "lease_until": {"$lt": now}},
+		]}
+		claim = {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=self.lease_seconds)}}
+		from pymongo import ReturnDocument
+
+		jobs = []
+		while len(jobs) < self.batch_size:
+			job = self.jobs_col.find_one_and_update(due, claim, sort=[("next_attempt_at", 1)], return_document=ReturnDocument.AFTER)
+			if not job:
+				break
+			jobs.append(job)
+		return jobs
+
+	def _deliver(self, job) -> None:
+		import smtplib
+
+		account = job["account"]
+		msg = _build_message(account, job["to"], job["subject"], job["body"], job["pdf"], job["filename"])
+		try:
+			try:
+				self._connection(account).send_message(msg)
+			except smtplib.SMTPServerDisconnected:
+				# Cached connection went stale between messages; reconnect once
+				self._drop(account)
+				self._connection(account).send_message(msg)
+		except Exception as err:
+			self._drop(account)
+			attempts = job.get("attempts", 0) + 1
+			if _is_transient(err) and attempts < self.max_attempts:
+				delay = self.base_backoff * (2 ** (attempts - 1))
+				update = {"status": "pending", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}
+			else:
+				update = {"status": "failed"}
+			update.update({"attempts": attempts, "last_error": f"{type(err).__name__}: {err}"})
+			self.jobs_col.update_one({"_id": job["_id"]}, {"$set": update, "$unset": {"lease_until": ""}})
+			return
+		self.jobs_col.update_one(
+			{"_id": job["_id"]},
+			{"$set": {"status": "sent", "sent_at": datetime.utcnow(), "attempts": job.get("attempts", 0) + 1},
+			 "$unset": {"pdf": "", "lease_until": ""}},
+		)
+
+	# -- connection pool ----------------------------------------------------
+
+	def _connection(self, account: str):
+		cached = self._connections.get(account)
+		if cached:
+			smtp, _ = cached
+		else:
+			import smtplib
+
+			host, port, use_ssl = _smtp_settings()
+			smtp = smtplib.SMTP_SSL(host, port, timeout=30) if use_ssl else smtplib.SMTP(host, port, timeout=30)
+			password = self._credentials[account]
+			smtp.ehlo_or_helo_if_needed()
+			if password and smtp.has_extn("auth"):
+				smtp.login(account, password)
+		self._connections[account] = (smtp, time.monotonic())
+		return smtp
+
+	def _drop(self, account: str) -> None:
+		cached = self._connections.pop(account, None)
+		if cached:
+			try:
+				cached[0].close()
+			except Exception:
+				pass
+
+	def _close_idle(self) -> None:
+		now = time.monotonic()
+		for account, (_, last_used) in list(self._connections.items()):
+			if now - last_used > self.idle_timeout:
+				try:
+					self._connections[account][0].quit()
+				except Exception:
+					pass
+				self._connections.pop(account, None)
+
+	def _close_all(self) -> None:
+		for account in list(self._connections):
+			self._drop(account)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_mail_dispatcher() -> MailDispatcher:
+	"""Process-wide dispatcher (survives Streamlit reruns because modules are cached)."""
+	global _dispatcher
+	with _dispatcher_lock:
+		if _dispatcher is None:
+			_dispatcher = MailDispatcher()
+			_dispatcher.start()
+		return _dispatcher
+
+
+def enqueue_pdf_email(
+	to_emails: Iterable[str],
+	subject: str,
+	body: str,
+	pdf_bytes: bytes,
+	filename: str,
+	gmail_user: str | None = None,
+	app_password: str | None = None,
+):
+	"""Queue a PDF email using provided creds or GMAIL_USER/GMAIL_APP_PW; returns immediately with the job id."""
+	user = gmail_user or os.environ.get("GMAIL_USER")
+	pw = app_password or os.environ.get("GMAIL_APP_PW")
+	if not user or not pw:
+		raise ValueError("Gmail user/app password not provided. Set fields or env vars GMAIL_USER/GMAIL_APP_PW.")
+	return get_mail_dispatcher().enqueue(user, to_emails, subject, body, pdf_bytes, filename, app_password=pw)
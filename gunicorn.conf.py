@@ -0,0 +1,35 @@
+# Production serving for the signing service:
+#   gunicorn -c gunicorn.conf.py
+# `python signing_service.py` remains the single-process development server.
+import os
+
+wsgi_app = "signing_service:app"
+bind = f"0.0.0.0:{os.environ.get('SIGN_PORT', '5001')}"
+
+# Threaded workers: requests mostly wait on Mongo/GridFS, and the CPU-bound PDF stamping is
+# handed to each worker's overlay process pool (SIGN_OVERLAY_WORKERS), so a handful of
+# processes with several threads each keeps every core busy without blocking signers.
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "90"))
+graceful_timeout = 30
+keepalive = 5
+max_requests = 2000
+max_requests_jitter = 200
+
+# MongoClient is not fork-safe: each worker imports the app (and creates its one client,
+# shared by its threads) after the fork.
+preload_app = False
+
+
+def post_worker_init(worker):
+    # Idempotent, so one worker per master generation is enough
+    if worker.age == 1:
+        import signing_service
+        signing_service._start_token_backfill()
+
+
+def worker_exit(server, worker):
+    import signing_service
+    signing_service.shutdown_overlay_pool()
@@ -1,6 +1,6 @@
 import click
-from db import farmers_col, crops_col, quotes_col
-from cpq import calculate_price
+from db import farmers_col, crops_col, quotes_col, insert_crop
+from cpq import CropPricer
 from datetime import datetime
 
 
@@ -42,7 +42,7 @@ def add_crop():
             except Exception:
                 click.echo(f"Invalid discount format for part '{part}', skipping.")
 
-    crops_col.insert_one({
+    insert_crop({
         "farmer_id": farmer["_id"],
         "name": crop_name,
         "base_price": base_price,
@@ -67,7 +67,7 @@ def get_quote():
     
     crop_count = click.prompt("Enter crop count", type=int)
     
-    final_price, discount = calculate_price(crop["base_price"], crop_count, crop.get("discount_rules", []))
+    final_price, discount = CropPricer.from_crop(crop).price(crop_count)
     
     # Save quote in DB
     quote = {
@@ -81,14 +81,220 @@ def get_quote():
     quotes_col.insert_one(quote)
 
     click.echo(f"Quote for {crop_count} '{crop_name}' crops: ₹{final_price:.2f} (Discount Applied: {discount}%)")
-from utils import parse_discount_rules, format_currency
-discount_rules = parse_discount_rules("2:5,3:10")
-print(discount_rules)
-# Output: [{'min_crops': 2, 'discount_percent': 5}, {'min_crops': 3, 'discount_percent': 10}]
-
-price_str = format_currency(12345.678)
-print(price_str)
-# Output: ₹12,345.68   
+@cli.command()
+def migrate():
+    """Create/verify all indexes and fix up older documents (idempotent; run after deploys)"""
+    from db import ensure_indexes, unset_list_quote_fields
+    failed = ensure_indexes()
+    fixed = unset_list_quote_fields()
+    if fixed:
+        click.echo(f"Removed {fixed} list-valued farmer_id/crop_name fields from multi-line quotes.")
+    for line in failed:
+        click.echo(f"  failed: {line}")
+    click.echo("Indexes up to date." if not failed else f"{len(failed)} index group(s) failed.")
+    if failed:
+        raise SystemExit(1)
+
+@cli.command()
+def rebuild_price_stats():
+    """Backfill normalized crop names and recompute historical price stats"""
+    from db import rebuild_crop_price_stats
+    rebuild_crop_price_stats()
+    click.echo("Crop price stats rebuilt.")
+
+@cli.command()
+def migrate_quote_ids():
+    """Assign missing/duplicate quote IDs and create the unique quote_id index"""
+    from db import migrate_quote_ids as migrate
+    result = migrate()
+    for oid, (old, new) in result["renamed"].items():
+        click.echo(f"  {oid}: {old} -> {new}")
+    click.echo(f"Assigned {result['assigned']} missing IDs, renamed {len(result['renamed'])} duplicates; unique index in place.")
+
+@cli.command()
+@click.option("--settle-seconds", default=120, show_default=True, help="Skip quotes younger than this (picked up next run)")
+def rollup_quotes(settle_seconds):
+    """Fold new quotes into the analytics rollups (incremental; safe to re-run or cron)"""
+    from datetime import timedelta
+    from analytics import refresh_quote_rollups
+    n = refresh_quote_rollups(settle=timedelta(seconds=settle_seconds))
+    if n is None:
+        click.echo("Another rollup refresh is running; skipped.")
+        return
+    click.echo(f"Rolled up {n} new quotes.")
+
+@cli.command()
+@click.option("--duty-cycle", default=0.25, show_default=True, help="Share of wall time spent deleting; the rest is sleep")
+@click.option("--batch-size", default=200, show_default=True)
+def run_deletions(duty_cycle, batch_size):
+    """Finish queued or interrupted cascade deletes in the foreground"""
+    from deletions import DeletionWorker
+    worker = DeletionWorker(batch_size=batch_size, duty_cycle=duty_cycle)
+    n = 0
+    while worker.run_once():
+        n += 1
+    for job in worker.recent_jobs(limit=n or 1):
+        d = job.get("deleted", {})
+        click.echo(f"  {job.get('label') or job['_id']}: {job['status']}, {d.get('quotes', 0)} quotes, {d.get('files', 0)} files, {d.get('crops', 0)} crops")
+    click.echo(f"Processed {n} deletion job(s).")
+
+@cli.command()
+@click.option("--min-age-hours", default=1.0, show_default=True, help="Leave files newer than this alone")
+@click.option("--dry-run", is_flag=True, help="Only count what would be reclaimed")
+def sweep_orphans(min_age_hours, dry_run):
+    """Delete quote PDFs in GridFS that no quote references, and stranded chunks"""
+    from datetime import timedelta
+    from deletions import sweep_orphaned_files
+    stats = sweep_orphaned_files(min_age=timedelta(hours=min_age_hours), dry_run=dry_run)
+    click.echo(f"Scanned {stats['scanned']} files: {stats['orphaned']} orphaned ({stats['orphaned_bytes'] / 1e6:.1f} MB), "
+               f"{stats['deleted']} deleted; {stats['orphaned_chunk_files']} stranded chunk sets{' found' if dry_run else ' removed'}.")
+
+def _report_import(result):
+    for line, error in sorted(result.failures):
+        click.echo(f"  line {line}: {error}")
+    click.echo(f"{result.rows} rows in {result.elapsed:.2f}s ({result.rows_per_sec:,.0f} rows/s): {result.inserted} inserted, "
+               f"{result.updated} updated, {result.unchanged} unchanged, {len(result.failures)} failed.")
+
+@cli.command()
+@click.argument("path", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Default: from the file extension")
+@click.option("--chunk-size", default=1000, show_default=True)
+def import_farmers(path, fmt, chunk_size):
+    """Upsert farmers from CSV (header: name) or JSONL ({"name"})"""
+    from bulk_import import ImportResult, import_farmers as run, read_rows
+    result = ImportResult()
+    run(read_rows(path, result, fmt), result, chunk_size=chunk_size)
+    _report_import(result)
+
+@cli.command()
+@click.argument("path", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Default: from the file extension")
+@click.option("--chunk-size", default=1000, show_default=True)
+@click.option("--create-farmers", is_flag=True, help="Create farmers that do not exist yet instead of rejecting their rows")
+def import_crops(path, fmt, chunk_size, create_farmers):
+    """Upsert crops from CSV/JSONL: farmer, crop, base_price, discounts ("2:5,3:10" or a list of tiers)"""
+    from bulk_import import ImportResult, import_crops as run, read_rows
+    result = ImportResult()
+    run(read_rows(path, result, fmt), result, chunk_size=chunk_size, create_farmers=create_farmers)
+    _report_import(result)
+
+@cli.command()
+@click.argument("out", type=click.File("wb"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl", "parquet"]), help="Default: from the file extension, else csv")
+@click.option("--farmer", help="Only quotes that include this farmer")
+@click.option("--since", type=click.DateTime(["%Y-%m-%d"]), help="First day (UTC), inclusive")
+@click.option("--until", type=click.DateTime(["%Y-%m-%d"]), help="Last day (UTC), inclusive")
+@click.option("--batch-size", default=5000, show_default=True, help="Quotes fetched per round trip")
+def export_quotes(out, fmt, farmer, since, until, batch_size):
+    """Stream quotes to CSV, JSONL or Parquet (OUT may be - for stdout) without loading them all"""
+    import time
+    from datetime import timedelta
+    from quote_export import FORMATS, export_quotes as run
+
+    farmer_id = None
+    if farmer:
+        doc = farmers_col.find_one({"name": farmer}, {"_id": 1})
+        if not doc:
+            raise click.BadParameter(f"no farmer named '{farmer}'", param_hint="--farmer")
+        farmer_id = doc["_id"]
+    ext = getattr(out, "name", "").rsplit(".", 1)[-1].lower()
+    fmt = fmt or (ext if ext in ("csv", "jsonl", "parquet") else "csv")
+    if fmt not in FORMATS:
+        raise click.UsageError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+    started = time.perf_counter()
+    n = run(out, fmt, farmer_id=farmer_id, since=since, until=until + timedelta(days=1) if until else None,
+            batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Exported {n} quotes as {fmt} in {elapsed:.1f}s ({n / elapsed if elapsed else 0:,.0f} rows/s).", err=True)
+
+def _insert_batch(batch) -> int:
+    """Insert (spec line, quote) pairs; reports rejected quotes and returns how many were written."""
+    from pymongo.errors import BulkWriteError
+    from quotes import insert_quotes
+
+    try:
+        insert_quotes([quote for _, quote in batch])
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            click.echo(f"line {batch[err['index']][0]}: not saved ({err.get('errmsg', 'write error')})")
+        return len(batch) - len(e.details.get("writeErrors", []))
+    return len(batch)
+
+@cli.command()
+@click.argument("specs_file", type=click.File("r", encoding="utf-8"))
+@click.option("--contexts-out", type=click.File("w", encoding="utf-8"), help="Write PDF contexts as JSONL (input for bulk-quote-pdfs)")
+@click.option("--chunk-size", default=1000, show_default=True)
+def create_quotes(specs_file, contexts_out, chunk_size):
+    """Create many multi-line quotes from JSONL: {"buyer", "valid_until", "lines": [{"farmer", "crop", "quantity"}]}"""
+    import json
+    from quotes import build_quote, fetch_crops
+
+    specs = [json.loads(line) for line in specs_file if line.strip()]
+    names = {ln["farmer"] for spec in specs for ln in spec.get("lines", [])}
+    farmers = {f["name"]: f["_id"] for f in farmers_col.find({"name": {"$in": list(names)}}, {"name": 1})}
+    farmer_names = {fid: name for name, fid in farmers.items()}
+
+    resolved, failed = [], 0
+    for n, spec in enumerate(specs, 1):
+        try:
+            lines = [{"farmer_id": farmers[ln["farmer"]], "crop_name": ln["crop"], "quantity": int(ln["quantity"])} for ln in spec["lines"]]
+        except (KeyError, ValueError, TypeError) as e:
+            failed += 1
+            click.echo(f"line {n}: invalid spec or unknown farmer ({e})")
+            continue
+        resolved.append((n, spec, lines))
+
+    crops = fetch_crops([ln for _, _, lines in resolved for ln in lines])
+    batch, created = [], 0
+    for n, spec, lines in resolved:
+        try:
+            quote, context, _ = build_quote(lines, farmer_names, crops=crops, buyer_name=spec.get("buyer", ""),
+                                            valid_until=spec.get("valid_until", ""), buyer_email=spec.get("buyer_email"))
+        except (KeyError, ValueError) as e:
+            failed += 1
+            click.echo(f"line {n}: {e}")
+            continue
+        batch.append((n, quote))
+        if contexts_out:
+            contexts_out.write(json.dumps(context) + "\n")
+        if len(batch) >= chunk_size:
+            written = _insert_batch(batch)
+            created, failed = created + written, failed + len(batch) - written
+            batch = []
+    written = _insert_batch(batch)
+    created, failed = created + written, failed + len(batch) - written
+    click.echo(f"Created {created} quotes, {failed} failed.")
+
+@cli.command()
+@click.argument("contexts_file", type=click.File("r", encoding="utf-8"))
+@click.option("--out", "out_path", help="Directory, or a path ending in .zip")
+@click.option("--gridfs", "to_gridfs", is_flag=True, help="Store PDFs in GridFS and link them to their quotes")
+@click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+def bulk_quote_pdfs(contexts_file, out_path, to_gridfs, workers):
+    """Render quote PDFs in parallel from a JSONL file of quote contexts"""
+    import json
+    from bulk_quotes import generate_quote_pdfs, DirectorySink, ZipSink, GridFSSink
+
+    if to_gridfs:
+        sink = GridFSSink()
+    elif out_path and out_path.lower().endswith(".zip"):
+        sink = ZipSink(out_path)
+    elif out_path:
+        sink = DirectorySink(out_path)
+    else:
+        click.echo("Pass --out DIR, --out FILE.zip or --gridfs.")
+        return
+
+    contexts = (json.loads(line) for line in contexts_file if line.strip())
+
+    def progress(done, failed):
+        if done % 100 == 0:
+            click.echo(f"{done} rendered, {failed} failed")
+
+    result = generate_quote_pdfs(contexts, sink, workers=workers, progress=progress)
+    click.echo(f"Wrote {result.written} PDFs, {len(result.failures)} failed.")
+    for index, quote_id, error in result.failures:
+        click.echo(f"  line {index + 1} ({quote_id}): {error}")
 
 if __name__ == "__main__":
     cli()
@@ -1,5 +1,9 @@
 import streamlit as st
-from db import farmers_col, crops_col, quotes_col
+from db import farmers_col, crops_col, quotes_col, forget_crop_prices
+import data_cache
+from pickers import farmer_picker
+from deletions import get_deletion_worker
+from quotes import quotes_owned_by, quotes_shared_by
 
 
 def render_manage_data() -> None:
@@ -9,47 +13,72 @@ def render_manage_data() -> None:
 
 	with tab1:
 		st.subheader("Delete Farmer")
-		farmers = list(farmers_col.find({}, {"name": 1}))
-		farmer_names = [f.get('name') for f in farmers if f.get('name')]
-		if not farmer_names:
-			st.info("No farmers to delete.")
-		else:
-			selected_farmer = st.selectbox("Select Farmer to delete", farmer_names, key="del_farmer")
-			cascade = st.checkbox("Also delete this farmer's crops and quotes", value=True)
+		farmer = farmer_picker("Select Farmer to delete", key="del_farmer", empty_message="No farmers to delete.")
+		if farmer is not None:
+			selected_farmer = farmer["name"]
+			cascade = st.checkbox("Also delete this farmer's crops and quotes", value=True,
+				help="Quotes shared with other farmers are kept.")
 			if st.button("Delete Farmer"):
-				farmer = farmers_col.find_one({"name": selected_farmer})
-				if farmer:
-					farmers_col.delete_one({"_id": farmer["_id"]})
-					deleted_crops = 0
-					deleted_quotes = 0
+				if farmers_col.delete_one({"_id": farmer["_id"]}).deleted_count:
+					data_cache.invalidate_farmers()
+					data_cache.invalidate_crops(farmer["_id"])
 					if cascade:
-						deleted_crops = crops_col.delete_many({"farmer_id": farmer["_id"]}).deleted_count
-						deleted_quotes = quotes_col.delete_many({"farmer_id": farmer["_id"]}).deleted_count
-					st.success(f"Deleted farmer '{selected_farmer}'. Removed {deleted_crops} crops and {deleted_quotes} quotes.")
+						# Crops, quotes and their PDFs go in throttled batches on the deletion worker
+						get_deletion_worker().enqueue(
+							quotes_owned_by(farmer["_id"]), crop_filter={"farmer_id": farmer["_id"]}, label=f"farmer '{selected_farmer}'",
+						)
+						st.success(f"Deleted farmer '{selected_farmer}'. Their crops and quotes are being removed in the background.")
+						_report_kept(quotes_shared_by(farmer["_id"]))
+					else:
+						st.success(f"Deleted farmer '{selected_farmer}'.")
 				else:
 					st.warning("Farmer not found.")
 
 	with tab2:
 		st.subheader("Delete Crop")
-		farmers = list(farmers_col.find({}, {"name": 1}))
-		farmer_names = [f.get('name') for f in farmers if f.get('name')]
-		if not farmer_names:
-			st.info("No farmers found.")
-		else:
-			selected_farmer = st.selectbox("Select Farmer", farmer_names, key="crop_farmer_for_delete")
-			farmer = farmers_col.find_one({"name": selected_farmer})
-			crops = list(crops_col.find({"farmer_id": farmer["_id"]}, {"name": 1})) if farmer else []
-			crop_names = [c.get('name') for c in crops if c.get('name')]
+		farmer = farmer_picker("Select Farmer", key="crop_farmer_for_delete", empty_message="No farmers found.")
+		if farmer is not None:
+			selected_farmer = farmer["name"]
+			crop_names = data_cache.crop_names(farmer["_id"])
 			if not crop_names:
 				st.info("No crops for this farmer.")
 			else:
 				selected_crop = st.selectbox("Select Crop to delete", crop_names, key="del_crop")
-				also_quotes = st.checkbox("Also delete quotes for this crop", value=True)
+				also_quotes = st.checkbox("Also delete quotes for this crop", value=True,
+					help="Quotes shared with other farmers are kept.")
 				if st.button("Delete Crop"):
-					crops_col.delete_one({"farmer_id": farmer["_id"], "name": selected_crop})
-					dq = 0
+					deleted = crops_col.find_one_and_delete({"farmer_id": farmer["_id"], "name": selected_crop})
+					if deleted:
+						forget_crop_prices([deleted])
+					data_cache.invalidate_crops(farmer["_id"])
 					if also_quotes:
-						dq = quotes_col.delete_many({"farmer_id": farmer["_id"], "crop_name": selected_crop}).deleted_count
-					st.success(f"Deleted crop '{selected_crop}' for '{selected_farmer}'. Removed {dq} quotes.")
+						get_deletion_worker().enqueue(
+							quotes_owned_by(farmer["_id"], selected_crop), label=f"quotes for '{selected_crop}' of '{selected_farmer}'",
+						)
+						st.success(f"Deleted crop '{selected_crop}' for '{selected_farmer}'. Its quotes are being removed in the background.")
+						_report_kept(quotes_shared_by(farmer["_id"], selected_crop))
+					else:
+						st.success(f"Deleted crop '{selected_crop}' for '{selected_farmer}'.")
+
+	_render_deletion_jobs()
+
+
+def _report_kept(shared_filter: dict) -> None:
+	kept = quotes_col.count_documents(shared_filter)
+	if kept:
+		st.info(f"Kept {kept} quote(s) shared with other farmers.")
+
+
+def _render_deletion_jobs() -> None:
+	jobs = get_deletion_worker().recent_jobs()
+	if not jobs:
+		return
+	with st.expander("Background deletions", expanded=any(j["status"] in ("pending", "running") for j in jobs)):
+		for job in jobs:
+			d = job.get("deleted", {})
+			line = f"{job.get('label') or job['_id']}: {job['status']} — {d.get('quotes', 0)} quotes, {d.get('files', 0)} PDFs, {d.get('crops', 0)} crops"
+			if job.get("last_error"):
+				line += f" (last error: {job['last_error']})"
+			st.caption(line)
 
 
@@ -0,0 +1,33 @@
+import streamlit as st
+
+
+# Streamlit drops the state of every widget that was not rendered in a run, so switching
+# pages would reset the forms on the page left behind. Free-form inputs register their key
+# with field(); the router saves those values after each run and field() puts them back
+# the next time the page renders. Selection widgets are not kept: their options come from
+# the database and a stale value could be invalid.
+_SAVED = "_page_state_saved"
+_SEEN = "_page_state_seen"
+
+
+def field(key: str, default=None) -> str:
+    """Register a kept input and seed its value; pass the result as the widget's key (and no value=)."""
+    saved = st.session_state.setdefault(_SAVED, {})
+    st.session_state.setdefault(_SEEN, set()).add(key)
+    if key not in st.session_state:
+        value = saved.get(key, default)
+        if value is not None:
+            st.session_state[key] = value
+    return key
+
+
+def begin_run() -> None:
+    st.session_state[_SEEN] = set()
+
+
+def save_fields() -> None:
+    """Remember the current value of every field rendered in this run."""
+    saved = st.session_state.setdefault(_SAVED, {})
+    for key in st.session_state.get(_SEEN, ()):
+        if key in st.session_state:
+            saved[key] = st.session_state[key]
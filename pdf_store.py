@@ -0,0 +1,181 @@
+import hashlib
+from typing import BinaryIO, List
+
+
+# Signed PDFs are stored as incremental-update deltas: a GridFS file whose metadata.base_id
+# points at the version it extends and whose content is only the bytes PyMuPDF appended.
+# A version is its chain of files concatenated, root first. Every stored blob carries its
+# SHA-256 (plus base, for deltas) and identical uploads reuse the existing file.
+
+_HASH_BLOCK = 1024 * 1024
+
+
+def _bucket():
+    from db import get_fs_bucket
+    return get_fs_bucket()
+
+
+def _files():
+    from db import get_db
+    return get_db()["fs.files"]
+
+
+def _sha256(stream: BinaryIO) -> str:
+    h = hashlib.sha256()
+    for block in iter(lambda: stream.read(_HASH_BLOCK), b""):
+        h.update(block)
+    return h.hexdigest()
+
+
+def put_blob(stream: BinaryIO, filename: str, metadata: dict, base_id=None):
+    """
+    Store a seekable stream in GridFS unless an identical blob (same bytes, same base) is
+    already there. Returns (file id, created). Pass base_id for a delta.
+    """
+    start = stream.tell()
+    digest = _sha256(stream)
+    existing = _files().find_one({"metadata.sha256": digest, "metadata.base_id": base_id}, {"_id": 1})
+    if existing:
+        return existing["_id"], False
+    stream.seek(start)
+    return _bucket().upload_from_stream(filename, stream, metadata=dict(metadata, sha256=digest, base_id=base_id)), True
+
+
+def version_chain(file_id) -> List[dict]:
+    """fs.files documents making up a version, root first. Legacy full copies are one link."""
+    chain = []
+    while file_id is not None:
+        doc = _files().find_one({"_id": file_id}, {"length": 1, "chunkSize": 1, "uploadDate": 1, "metadata.base_id": 1})
+        if doc is None:
+            raise LookupError(f"GridFS file {file_id} missing from version chain")
+        chain.append(doc)
+        file_id = (doc.get("metadata") or {}).get("base_id")
+    chain.reverse()
+    return chain
+
+
+def download_version(file_id, dest: BinaryIO) -> int:
+    """Write the full bytes of a version to dest chunk by chunk; returns its length."""
+    total = 0
+    for link in version_chain(file_id):
+        _bucket().download_to_stream(link["_id"], dest)
+        total += link["length"]
+    return total
+
+
+class VersionReader:
+    """
+    Seekable read-only file over a version chain, opening each GridFS link only when reads
+    reach it. Exposes length, chunk_size and upload_date like GridOut.
+    """
+
+    def __init__(self, file_id):
+        self._chain = version_chain(file_id)
+        self._offsets = []
+        pos = 0
+        for link in self._chain:
+            self._offsets.append(pos)
+            pos += link["length"]
+        self.length = pos
+        self.chunk_size = self._chain[-1].get("chunkSize", 255 * 1024)
+        self.upload_date = self._chain[-1].get("uploadDate")
+        self._pos = 0
+        self._open = None  # (index, GridOut)
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        base = {0: 0, 1: self._pos, 2: self.length}[whence]
+        self._pos = max(0, base + pos)
+        return self._pos
+
+    def _link_at(self, pos: int) -> int:
+        for i in range(len(self._chain) - 1, -1, -1):
+            if pos >= self._offsets[i]:
+                return i
+        return 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.length - self._pos
+        out = []
+        while size > 0 and self._pos < self.length:
+            i = self._link_at(self._pos)
+            if self._open is None or self._open[0] != i:
+                self.close()
+                self._open = (i, _bucket().open_download_stream(self._chain[i]["_id"]))
+            grid_out = self._open[1]
+            grid_out.seek(self._pos - self._offsets[i])
+            data = grid_out.read(min(size, self._chain[i]["length"] - (self._pos - self._offsets[i])))
+            if not data:
+                break
+            out.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b"".join(out)
+
+    def close(self) -> None:
+        if self._open is not None:
+            self._open[1].close()
+            self._open = None
+
+
+# Quote fields that point at a stored version; a blob is live while any of them, or a delta
+# built on it (metadata.base_id), refers to it.
+REFERENCE_FIELDS = ("original_file_id", "signed_file_id", "buyer.file_id", "seller.file_id",
+                    "buyer_signed_file_id", "seller_signed_file_id")
+
+
+def file_refs(quote: dict) -> set:
+    """GridFS ids a quote document points at (it needs the REFERENCE_FIELDS projected)."""
+    refs = set()
+    for path in REFERENCE_FIELDS:
+        value = quote
+        for part in path.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value is not None:
+            refs.add(value)
+    return refs
+
+
+def referenced(file_ids) -> set:
+    """The subset of file_ids still used by a quote or by a delta stored on top of them."""
+    from db import quotes_col
+
+    ids = list(file_ids)
+    if not ids:
+        return set()
+    wanted = set(ids)
+    refs = set()
+    query = {"$or": [{f: {"$in": ids}} for f in REFERENCE_FIELDS]}
+    for q in quotes_col.find(query, {f: 1 for f in REFERENCE_FIELDS}):
+        refs.update(file_refs(q) & wanted)
+    refs.update(_files().distinct("metadata.base_id", {"metadata.base_id": {"$in": ids}}))
+    return refs & wanted
+
+
+def release(file_ids) -> int:
+    """
+    Delete the given blobs that nothing references any more. Deltas go before their bases,
+    so a chain whose links are all listed is removed entirely. Returns how many were deleted.
+    """
+    from gridfs.errors import NoFile
+
+    pending = {fid for fid in file_ids if fid is not None}
+    deleted = 0
+    while pending:
+        free = pending - referenced(pending)
+        if not free:
+            break
+        for fid in free:
+            try:
+                _bucket().delete(fid)
+                deleted += 1
+            except NoFile:
+                pass
+        pending -= free
+    return deleted
@@ -0,0 +1,48 @@
+import streamlit as st
+
+import data_cache
+from page_state import field
+
+
+def _reset(key: str) -> None:
+    st.session_state[f"{key}_pages"] = [None]
+
+
+def _next_page(key: str, cursor) -> None:
+    st.session_state[f"{key}_pages"].append(cursor)
+
+
+def _prev_page(key: str) -> None:
+    st.session_state[f"{key}_pages"].pop()
+
+
+def farmer_picker(label: str, key: str, empty_message: str = "No farmers found! Please add a farmer first."):
+    """
+    Search-as-you-type farmer selectbox showing one page of matches at a time, so each rerun
+    costs one indexed query whatever the collection size. Returns {"_id", "name"} or None.
+    """
+    pages_key = f"{key}_pages"
+    if pages_key not in st.session_state:
+        _reset(key)
+    prefix = st.text_input(
+        f"{label} — search", key=field(f"{key}_search"), placeholder="Type the start of a name",
+        on_change=_reset, args=(key,),
+    ).strip()
+    pages = st.session_state[pages_key]
+    farmers, cursor = data_cache.farmer_page(prefix, pages[-1])
+
+    if not farmers:
+        if prefix:
+            st.info(f"No farmers starting with '{prefix}'.")
+        elif len(pages) == 1:
+            st.warning(empty_message)
+        return None
+
+    by_name = {f["name"]: f for f in farmers}
+    selected = st.selectbox(label, list(by_name), key=key)
+    prev_col, info_col, next_col = st.columns([1, 3, 1])
+    prev_col.button("Previous", key=f"{key}_prev", disabled=len(pages) == 1, on_click=_prev_page, args=(key,))
+    info_col.caption(f"Page {len(pages)}" + (" — more matches on the next page" if cursor else ""))
+    next_col.button("Next", key=f"{key}_next", disabled=cursor is None, on_click=_next_page, args=(key, cursor))
+    farmer = by_name.get(selected)
+    return {"_id": farmer["_id"], "name": farmer["name"]} if farmer else None
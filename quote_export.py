@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from typing import BinaryIO, Iterator, Optional
+
+
+# One flat row per quote, the same columns in every format. Multi-farmer/multi-crop quotes
+# join their farmers and crops with "; ".
+COLUMNS = ("quote_id", "created_at", "status", "farmer", "farmer_id", "crop", "crop_count", "lines",
+           "final_price", "discount_percent", "buyer_email", "seller_email")
+# Parquet is offered only when pyarrow is installed (it is optional)
+FORMATS = ("csv", "jsonl", "parquet") if find_spec("pyarrow") is not None else ("csv", "jsonl")
+_FIELDS = {"quote_id": 1, "created_at": 1, "status": 1, "farmer_id": 1, "crop_name": 1, "crop_count": 1,
+           "final_price": 1, "discount_percent": 1, "buyer_email": 1, "seller_email": 1,
+           "lines.farmer_id": 1, "lines.crop_name": 1}
+# created_at is stamped within moments of the quote's ObjectId, so the _id range below only
+# needs a little slack to be a safe pre-filter for date-only exports
+_ID_SLACK = timedelta(days=1)
+
+
+def export_query(farmer_id=None, since: Optional[datetime] = None, until: Optional[datetime] = None) -> dict:
+    """Filter for quotes with a line for farmer_id created in [since, until)."""
+    from bson import ObjectId
+    from quotes import quotes_for_farmer
+
+    query, created = {}, {}
+    if since:
+        created["$gte"] = since
+    if until:
+        created["$lt"] = until
+    if created:
+        query["created_at"] = created
+    if farmer_id is not None:
+        # Each $or branch has its index: ix_quotes_farmer_created, ix_quotes_lines_farmer_created
+        query.update(quotes_for_farmer(farmer_id))
+        return query
+    if created:
+        ids = {}
+        if since:
+            ids["$gte"] = ObjectId.from_datetime(since - _ID_SLACK)
+        if until:
+            ids["$lt"] = ObjectId.from_datetime(until + _ID_SLACK)
+        query["_id"] = ids
+    return query
+
+
+def _joined(values, names: Optional[dict] = None) -> str:
+    values = dict.fromkeys(v for v in values if v is not None)
+    return "; ".join(str(names.get(v, "") if names is not None else v) for v in values)
+
+
+def iter_quote_rows(farmer_id=None, since=None, until=None, batch_size: int = 5000, limit: int = 0) -> Iterator[dict]:
+    """
+    Stream export rows through a projected cursor fetching batch_size quotes per round trip;
+    only the current batch and the farmer id -> name map are held in memory.
+    """
+    from db import farmers_col, quotes_col
+
+    names = {f["_id"]: f.get("name", "") for f in farmers_col.find({}, {"name": 1}, batch_size=batch_size)}
+    query = export_query(farmer_id, since, until)
+    cursor = quotes_col.find(query, _FIELDS, batch_size=batch_size, limit=limit)
+    if farmer_id is None:
+        cursor = cursor.sort("_id", 1)
+    with cursor:
+        for q in cursor:
+            created = q.get("created_at")
+            lines = q.get("lines") or [q]
+            farmers = [ln.get("farmer_id") for ln in lines]
+            yield {
+                "quote_id": q.get("quote_id"),
+                "created_at": created.isoformat() if created else None,
+                "status": q.get("status"),
+                "farmer": _joined(farmers, names),
+                "farmer_id": _joined(farmers),
+                "crop": _joined(ln.get("crop_name") for ln in lines),
+                "crop_count": q.get("crop_count"),
+                "lines": len(lines),
+                "final_price": q.get("final_price"),
+                "discount_percent": q.get("discount_percent"),
+                "buyer_email": q.get("buyer_email"),
+                "seller_email": q.get("seller_email"),
+            }
+
+
+def _write_text(out: BinaryIO, write_rows) -> int:
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    try:
+        n = write_rows(text)
+        text.flush()
+    finally:
+        text.detach()  # leave `out` open for the caller
+    return n
+
+
+def _csv_rows(rows, f) -> int:
+    writer = csv.DictWriter(f, COLUMNS)
+    writer.writeheader()
+    n = 0
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+    return n
+
+
+def _jsonl_rows(rows, f) -> int:
+    n = 0
+    for n, row in enumerate(rows, 1):
+        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return n
+
+
+def write_csv(rows, out: BinaryIO) -> int:
+    return _write_text(out, lambda f: _csv_rows(rows, f))
+
+
+def write_jsonl(rows, out: BinaryIO) -> int:
+    return _write_text(out, lambda f: _jsonl_rows(rows, f))
+
+
+def write_parquet(rows, out: BinaryIO, row_group_size: int = 100_000) -> int:
+    """Write row_group_size rows at a time, so memory is bounded by one row group (needs pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("quote_id", pa.string()), ("created_at", pa.string()), ("status", pa.string()),
+        ("farmer", pa.string()), ("farmer_id", pa.string()), ("crop", pa.string()),
+        ("crop_count", pa.int64()), ("lines", pa.int64()), ("final_price", pa.float64()),
+        ("discount_percent", pa.float64()), ("buyer_email", pa.string()), ("seller_email", pa.string()),
+    ])
+    n = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        # Buffer a row group column by column: far smaller than keeping the row dicts
+        columns = {c: [] for c in COLUMNS}
+        pending = 0
+        for row in rows:
+            for c in COLUMNS:
+                columns[c].append(row[c])
+            pending += 1
+            if pending >= row_group_size:
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                n += pending
+                columns, pending = {c: [] for c in COLUMNS}, 0
+        if pending or not n:
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            n += pending
+    return n
+
+
+def export_quotes(out: BinaryIO, fmt: str = "csv", farmer_id=None, since=None, until=None,
+                  batch_size: int = 5000, limit: int = 0) -> int:
+    """Stream matching quotes to `out` as csv, jsonl or parquet; returns the number of rows written."""
+    writers = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+    if fmt not in writers:
+        raise ValueError(f"unknown export format: {fmt}")
+    if fmt not in FORMATS:
+        raise ValueError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+    return writers[fmt](iter_quote_rows(farmer_id, since, until, batch_size=batch_size, limit=limit), out)
@@ -0,0 +1,265 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from datetime import datetime
+
+from cpq import CropPricer
+
+
+class QuoteIdAllocator:
+    """
+    Hands out Q-YYYYMMDD-NNNNNNN IDs from a per-day counter in Mongo. Numbers are leased
+    in blocks, so only one round trip in `block_size` IDs touches the database; the
+    atomic $inc makes them unique across processes. IDs sort by day, and by issue order
+    within a process (blocks leased by concurrent processes interleave). Numbers left in
+    a block when the process exits are simply skipped. The 7-digit suffix never collides
+    with the 6-character hex suffix of older IDs.
+    """
+
+    def __init__(self, block_size: int = 100, counters=None):
+        self.block_size = block_size
+        self._counters = counters
+        self._lock = threading.Lock()
+        self._day = None
+        self._block = iter(())
+
+    def _lease(self, day: str):
+        from pymongo import ReturnDocument
+
+        if self._counters is None:
+            from db import counters_col
+            self._counters = counters_col
+        doc = self._counters.find_one_and_update(
+            {"_id": f"quote_id:{day}"}, {"$inc": {"seq": self.block_size}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        return iter(range(doc["seq"] - self.block_size + 1, doc["seq"] + 1))
+
+    def next(self) -> str:
+        day = datetime.utcnow().strftime("%Y%m%d")
+        with self._lock:
+            n = next(self._block, None) if day == self._day else None
+            if n is None:
+                self._day, self._block = day, self._lease(day)
+                n = next(self._block)
+        return f"Q-{day}-{n:07d}"
+
+
+_quote_ids = QuoteIdAllocator(block_size=int(os.environ.get("QUOTE_ID_BLOCK_SIZE", "100")))
+
+
+def new_quote_id() -> str:
+    return _quote_ids.next()
+
+
+def hash_token(t: str) -> str:
+    secret = os.environ.get("SIGN_SECRET", "change-me")
+    return hmac.new(secret.encode(), t.encode(), hashlib.sha256).hexdigest()
+
+
+def fetch_crops(lines) -> dict:
+    """Fetch every crop referenced by lines in one $in query; returns {(farmer_id, crop_name): crop}."""
+    from db import crops_col
+
+    wanted = {(ln["farmer_id"], ln["crop_name"]) for ln in lines}
+    if not wanted:
+        return {}
+    cursor = crops_col.find(
+        {"farmer_id": {"$in": list({f for f, _ in wanted})}, "name": {"$in": list({n for _, n in wanted})}},
+        {"farmer_id": 1, "name": 1, "base_price": 1, "discount_rules": 1},
+    )
+    return {(c["farmer_id"], c["name"]): c for c in cursor if (c["farmer_id"], c["name"]) in wanted}
+
+
+def price_lines(lines, crops: dict) -> list:
+    """
+    Price each line ({"farmer_id", "crop_name", "quantity"}) against its crop in one pass.
+    Raises KeyError naming the first line whose crop is missing.
+    """
+    priced = []
+    pricers = {}
+    for ln in lines:
+        key = (ln["farmer_id"], ln["crop_name"])
+        crop = crops.get(key)
+        if crop is None:
+            raise KeyError(f"Crop '{ln['crop_name']}' not found for farmer {ln['farmer_id']}")
+        pricer = pricers.get(key)
+        if pricer is None:
+            pricer = pricers[key] = CropPricer.from_crop(crop)
+        quantity = ln["quantity"]
+        final_price, discount = pricer.price(quantity)
+        priced.append({
+            "farmer_id": ln["farmer_id"],
+            "crop_name": ln["crop_name"],
+            "crop_count": quantity,
+            "base_price": crop["base_price"],
+            "discount_percent": discount,
+            "final_price": final_price,
+        })
+    return priced
+
+
+def _shared(values: list):
+    """The value every line has in common, or None when they differ."""
+    distinct = set(values)
+    return values[0] if len(distinct) == 1 else None
+
+
+def quotes_for_farmer(farmer_id) -> dict:
+    """Filter for quotes with at least one line for farmer_id."""
+    return {"$or": [{"farmer_id": farmer_id}, {"lines.farmer_id": farmer_id}]}
+
+
+def quotes_for_crop(farmer_id, crop_name: str) -> dict:
+    """Filter for quotes with a line for this farmer's crop (both on the same line)."""
+    return {"$or": [
+        {"farmer_id": farmer_id, "crop_name": crop_name, "lines": {"$exists": False}},
+        {"lines": {"$elemMatch": {"farmer_id": farmer_id, "crop_name": crop_name}}},
+    ]}
+
+
+def _owned(farmer_id) -> dict:
+    # Top-level farmer_id is only set when every line is this farmer's (lists predate `migrate`)
+    return {"farmer_id": {"$eq": farmer_id, "$not": {"$type": "array"}}}
+
+
+def quotes_owned_by(farmer_id, crop_name: str | None = None) -> dict:
+    """
+    Filter for quotes whose lines all belong to farmer_id (with crop_name: and include that
+    crop). This is what deleting a farmer or crop removes: joint quotes with other farmers
+    are kept, since they are the other farmers' records too.
+    """
+    if crop_name is None:
+        return _owned(farmer_id)
+    return {"$and": [_owned(farmer_id), quotes_for_crop(farmer_id, crop_name)]}
+
+
+def quotes_shared_by(farmer_id, crop_name: str | None = None) -> dict:
+    """Filter for joint quotes with a line for farmer_id (and crop_name) that a delete keeps."""
+    lines = quotes_for_farmer(farmer_id) if crop_name is None else quotes_for_crop(farmer_id, crop_name)
+    return {"$and": [lines, {"$nor": [_owned(farmer_id)]}]}
+
+
+def build_quote(
+    lines,
+    farmer_names: dict,
+    crops: dict | None = None,
+    buyer_name: str = "",
+    valid_until: str = "",
+    seller_email: str | None = None,
+    buyer_email: str | None = None,
+    signing_base: str | None = None,
+):
+    """
+    Price lines and assemble the complete quote document (with _id, quote_id and signing
+    token hashes), its PDF/HTML render context, and the raw signing tokens.
+    farmer_names maps farmer_id -> display name. Nothing is written to the database.
+
+    Single-line quotes keep the historical top-level fields unchanged. Multi-line quotes
+    carry every line in `lines`; their top-level farmer_id / crop_name are only set when
+    all lines share the value (never a list, so equality filters keep their meaning; see
+    quotes_for_farmer / quotes_for_crop), crop_count is the total quantity and
+    discount_percent the effective discount.
+    """
+    from bson import ObjectId
+
+    if not lines:
+        raise ValueError("a quote needs at least one line")
+    if crops is None:
+        crops = fetch_crops(lines)
+    priced = price_lines(lines, crops)
+    total_base = float(sum(p["base_price"] * p["crop_count"] for p in priced))
+    total_final = float(sum(p["final_price"] for p in priced))
+    total_discount = float(total_base - total_final)
+    if len(priced) == 1:
+        discount = priced[0]["discount_percent"]
+    else:
+        discount = (total_discount / total_base * 100) if total_base else 0
+
+    tokens = {"buyer": secrets.token_urlsafe(24), "seller": secrets.token_urlsafe(24)}
+    quote_id = new_quote_id()
+    now = datetime.utcnow()
+    quote = {
+        "_id": ObjectId(),
+        "farmer_id": _shared([p["farmer_id"] for p in priced]),
+        "crop_name": _shared([p["crop_name"] for p in priced]),
+        "crop_count": sum(p["crop_count"] for p in priced),
+        "final_price": priced[0]["final_price"] if len(priced) == 1 else total_final,
+        "discount_percent": discount,
+        "seller_email": seller_email or None,
+        "buyer_email": buyer_email or None,
+        "quote_id": quote_id,
+        "buyer": {"signed": False, "token_hash": hash_token(tokens["buyer"])},
+        "seller": {"signed": False, "token_hash": hash_token(tokens["seller"])},
+        "status": "pending",
+        "created_at": now,
+    }
+    if len(priced) > 1:
+        quote["lines"] = priced
+        for key in ("farmer_id", "crop_name"):
+            if quote[key] is None:
+                del quote[key]
+
+    signing_base = signing_base or os.environ.get("SIGN_BASE_URL", "http://localhost:5001/sign")
+    context = {
+        "quote_id": quote_id,
+        "date": now.date().isoformat(),
+        "farmer": ", ".join(dict.fromkeys(str(farmer_names.get(p["farmer_id"], "")) for p in priced)),
+        "buyer": buyer_name or "",
+        "breakdown": [{
+            "name": p["crop_name"],
+            "quantity": p["crop_count"],
+            "base": float(p["base_price"]),
+            "discount_percent": float(p["discount_percent"]),
+            "discount_amount": float((p["base_price"] * p["crop_count"]) - p["final_price"]),
+            "final": float(p["final_price"]),
+        } for p in priced],
+        "total_base": f"{total_base:,.2f}",
+        "total_discount": f"{total_discount:,.2f}",
+        "total_final": f"{total_final:,.2f}",
+        "valid_until": valid_until,
+        "buyer_confirm_link": f"{signing_base}/{tokens['buyer']}",
+        "seller_confirm_link": f"{signing_base}/{tokens['seller']}",
+    }
+    return quote, context, tokens
+
+
+def _token_hashes(quote: dict) -> dict:
+    return {role: quote[role]["token_hash"] for role in ("buyer", "seller")}
+
+
+def insert_quote(quote: dict) -> None:
+    """Write a complete quote document (tokens and file reference included) in one insert."""
+    from db import quotes_col, register_sign_tokens
+
+    quotes_col.insert_one(quote)
+    register_sign_tokens(quote["_id"], _token_hashes(quote))
+
+
+def insert_quotes(quotes: list) -> None:
+    """
+    Bulk variant of insert_quote for wholesale buyers: one insert_many for all quotes.
+    If some quotes are rejected (e.g. a duplicate quote_id), the rest are still inserted
+    and get their sign_tokens before the BulkWriteError is re-raised.
+    """
+    from pymongo.errors import BulkWriteError
+    from db import quotes_col, sign_tokens_col
+
+    if not quotes:
+        return
+    failed = None
+    try:
+        quotes_col.insert_many(quotes, ordered=False)
+    except BulkWriteError as e:
+        failed = e
+        rejected = {err["index"] for err in e.details.get("writeErrors", [])}
+        quotes = [q for i, q in enumerate(quotes) if i not in rejected]
+    if quotes:
+        sign_tokens_col.insert_many(
+            [{"_id": th, "quote_oid": q["_id"], "role": role} for q in quotes for role, th in _token_hashes(q).items()],
+            ordered=False,
+        )
+    if failed is not None:
+        raise failed
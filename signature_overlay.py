@@ -0,0 +1,49 @@
+from typing import NamedTuple
+
+
+# Kept free of Flask/Mongo imports: stamp_file runs in signing_service's overlay process
+# pool, whose workers import only this module.
+
+
+class SignatureImage(NamedTuple):
+    png: bytes
+    width: int  # pixels
+    height: int
+
+
+def overlay_signature(doc, signature: SignatureImage, x: int, y: int, page_index: int = 0, w: int = 150) -> None:
+    """Overlay a normalized signature onto the given page of an open PyMuPDF document.
+    x,y in points (72 per inch), origin top-left in PyMuPDF; we convert from bottom-left by page rect.
+    """
+    import fitz
+
+    page = doc[page_index]
+    rect = page.rect
+    # Convert y from bottom-left to top-left
+    y_top = rect.height - y
+    # Keep aspect ratio
+    h = signature.height * w / max(signature.width, 1)
+    bbox = fitz.Rect(x, y_top - h, x + w, y_top)
+    page.insert_image(bbox, stream=signature.png)
+
+
+def stamp_file(path: str, signature: SignatureImage, placement: dict) -> bool:
+    """
+    Stamp the signature onto the PDF at path as an incremental update appended to the same
+    file; returns True. PDFs MuPDF cannot append to (repaired on open, encrypted) are
+    rewritten in full to path + ".full" instead; returns False.
+    """
+    import fitz
+
+    doc = fitz.open(path)
+    try:
+        overlay_signature(doc, signature, **placement)
+        try:
+            # deflate: MuPDF stores inserted images as raw pixels otherwise
+            doc.save(path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True, deflate_images=True)
+            return True
+        except Exception:
+            doc.save(path + ".full", garbage=1, deflate=True)
+            return False
+    finally:
+        doc.close()
@@ -1,22 +1,39 @@
-from flask import Flask, request, send_file, abort, render_template_string
-from bson import ObjectId
-from gridfs import GridFS
+from flask import Flask, Response, request, abort, render_template_string
+from werkzeug.wsgi import wrap_file
+from contextlib import contextmanager
 from io import BytesIO
 from datetime import datetime
-from PIL import Image
-from pypdf import PdfReader, PdfWriter
-import fitz  # PyMuPDF
 import os
+import tempfile
 
-from db import db, quotes_col
-import hashlib, hmac, os
+from db import get_client, get_fs_bucket, quotes_col, sign_tokens_col, backfill_sign_tokens
+from cache import TTLCache
+import pdf_store
+from signature_overlay import SignatureImage, overlay_signature as _overlay_signature, stamp_file
+from quotes import hash_token
+import hashlib
+import threading
 
 app = Flask(__name__)
 
 @app.get("/health")
 def health():
+	"""Liveness: the process is up and serving."""
 	return {"ok": True}
 
+@app.get("/ready")
+def ready():
+	"""Readiness: Mongo answers a ping and the overlay pool can take work; 503 otherwise."""
+	checks = {}
+	try:
+		get_client().admin.command("ping")
+		checks["mongo"] = "ok"
+	except Exception as e:
+		checks["mongo"] = f"{type(e).__name__}: {e}"
+	checks["overlay_pool"] = "broken" if _overlay_pool_broken else "ok"
+	ok = all(v == "ok" for v in checks.values())
+	return {"ok": ok, **checks}, (200 if ok else 503)
+
 SIGN_FORM = """
 <!doctype html><html><head><meta charset='utf-8'><title>Sign Quote</title></head>
 <body style='font-family: Arial; max-width: 600px; margin: auto;'>
@@ -30,18 +47,32 @@ SIGN_FORM = """
 </body></html>
 """
 
-def _hash_token(t: str) -> str:
-    secret = os.environ.get("SIGN_SECRET", "change-me")
-    return hmac.new(secret.encode(), t.encode(), hashlib.sha256).hexdigest()
-
 def _find_by_token(token: str):
-    th = _hash_token(token)
+    th = hash_token(token)
+    tok = sign_tokens_col.find_one({"_id": th})
+    if tok:
+        q = quotes_col.find_one({"_id": tok["quote_oid"]})
+        return (q, tok["role"]) if q else (None, None)
+    # Quote created before sign_tokens existed and not yet backfilled
     q = quotes_col.find_one({"$or": [{"buyer.token_hash": th}, {"seller.token_hash": th}]})
     if not q:
         return None, None
     role = "buyer" if q.get("buyer", {}).get("token_hash") == th else "seller"
     return q, role
 
+
+def _start_token_backfill() -> threading.Thread:
+    """Migrate existing quote token hashes into sign_tokens without blocking startup."""
+    def _run():
+        try:
+            n = backfill_sign_tokens()
+            app.logger.info("sign_tokens backfill: %d tokens migrated", n)
+        except Exception:
+            app.logger.exception("sign_tokens backfill failed")
+    t = threading.Thread(target=_run, name="sign-token-backfill", daemon=True)
+    t.start()
+    return t
+
 @app.get("/sign/<token>")
 def sign_form_token(token):
     q, role = _find_by_token(token)
@@ -51,6 +82,211 @@ def sign_form_token(token):
         return render_template_string(SIGN_FORM, quote_id=q.get("quote_id", str(q.get("_id"))), role=role, msg="Already signed.")
     return render_template_string(SIGN_FORM, quote_id=q.get("quote_id", str(q.get("_id"))), role=role, msg=None)
 
+# PyMuPDF stamping is CPU-bound, so it runs in a bounded process pool per server process
+# instead of on the request thread. 0 stamps inline (development server, debugging).
+SIGN_OVERLAY_WORKERS = int(os.environ.get("SIGN_OVERLAY_WORKERS", str(min(4, os.cpu_count() or 1))))
+SIGN_OVERLAY_TIMEOUT = float(os.environ.get("SIGN_OVERLAY_TIMEOUT", "60"))
+_overlay_pool = None
+_overlay_pool_lock = threading.Lock()
+# Set when a submit/result fails and cleared once a replacement pool is up (see /ready)
+_overlay_pool_broken = False
+
+
+class OverlayUnavailable(RuntimeError):
+    """The overlay pool timed out or lost a worker; the pool was replaced, so retrying can succeed."""
+
+
+def _get_overlay_pool():
+    global _overlay_pool, _overlay_pool_broken
+    with _overlay_pool_lock:
+        if _overlay_pool is None and SIGN_OVERLAY_WORKERS > 0:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # forkserver: never fork this (threaded, Mongo-connected) process itself
+            _overlay_pool = ProcessPoolExecutor(max_workers=SIGN_OVERLAY_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+            _overlay_pool_broken = False
+        return _overlay_pool
+
+
+def _replace_overlay_pool(failed) -> None:
+    """Retire a pool whose worker died or hung and start a fresh one for the next request."""
+    global _overlay_pool, _overlay_pool_broken
+    with _overlay_pool_lock:
+        if _overlay_pool is not failed:
+            return  # another request already replaced it
+        _overlay_pool_broken = True
+        _overlay_pool = None
+    # A hung stamp keeps its worker until it returns (the executor has no public way to kill
+    # it), but nothing new is queued behind it
+    failed.shutdown(wait=False, cancel_futures=True)
+    _get_overlay_pool()
+
+
+def shutdown_overlay_pool() -> None:
+    global _overlay_pool
+    with _overlay_pool_lock:
+        if _overlay_pool is not None:
+            _overlay_pool.shutdown(wait=True, cancel_futures=True)
+            _overlay_pool = None
+
+
+def _run_overlay(path: str, signature: SignatureImage, placement: dict) -> bool:
+    from concurrent.futures.process import BrokenProcessPool
+
+    pool = _get_overlay_pool()
+    if pool is None:
+        return stamp_file(path, signature, placement)
+    try:
+        return pool.submit(stamp_file, path, signature, placement).result(timeout=SIGN_OVERLAY_TIMEOUT)
+    except (TimeoutError, BrokenProcessPool) as e:
+        app.logger.warning("signature overlay failed (%s); replacing the pool", type(e).__name__)
+        _replace_overlay_pool(pool)
+        raise OverlayUnavailable(str(e) or type(e).__name__) from e
+
+
+@app.errorhandler(OverlayUnavailable)
+def _overlay_unavailable(e):
+    from werkzeug.exceptions import ServiceUnavailable
+    return ServiceUnavailable("signing is temporarily unavailable, please retry", retry_after=5).get_response()
+
+
+# Optimistic retries when another signature lands between our read and our write
+SIGN_MAX_ATTEMPTS = 5
+
+
+# Signature ingest: uploads are decoded once, trimmed, downsampled to this resolution at
+# their placed width, reduced to a 2-colour transparent PNG and cached by content hash.
+SIGNATURE_DPI = int(os.environ.get("SIGNATURE_DPI", "200"))
+_signature_cache = TTLCache(ttl=3600, maxsize=256)
+
+
+def _ink_threshold(contrast) -> int:
+    """Otsu threshold of an ink-contrast image, clamped so blank or noisy scans stay sensible."""
+    hist = contrast.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    best, best_t, w_bg, sum_bg = 0.0, 128, 0, 0
+    for t, h in enumerate(hist):
+        w_bg += h
+        if w_bg == 0:
+            continue
+        w_fg = total - w_bg
+        if w_fg == 0:
+            break
+        sum_bg += t * h
+        m_bg, m_fg = sum_bg / w_bg, (sum_all - sum_bg) / w_fg
+        between = w_bg * w_fg * (m_bg - m_fg) ** 2
+        if between > best:
+            best, best_t = between, t
+    return min(max(best_t, 24), 160)
+
+
+def _normalize_signature(data: bytes, width_pt: float) -> SignatureImage:
+    """
+    Decode any Pillow-readable image, flatten it onto white, trim the margins around the
+    ink, downsample to SIGNATURE_DPI at width_pt and emit a 1-bit palette PNG whose
+    background is transparent and whose ink keeps its average colour.
+    Raises ValueError for data that is not an image, is too large to decode safely, or has
+    no ink.
+    """
+    from PIL import Image, ImageChops, ImageFilter, ImageOps, ImageStat, UnidentifiedImageError
+
+    try:
+        img = Image.open(BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"signature image too large: {e}") from e
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"unreadable signature image: {e}") from e
+    rgb = Image.new("RGB", img.size, "white")
+    rgba = img.convert("RGBA")
+    rgb.paste(rgba, mask=rgba.getchannel("A"))
+    gray = rgb.convert("L")
+    # Estimate the paper's local brightness (phone photos are unevenly lit) by blurring the
+    # strokes away at low resolution; ink is whatever is clearly darker than its paper
+    small = gray.resize((max(1, gray.width // 16), max(1, gray.height // 16)), Image.BOX)
+    paper = small.filter(ImageFilter.MaxFilter(5)).resize(gray.size, Image.BILINEAR)
+    contrast = ImageChops.subtract(paper, gray)
+    threshold = _ink_threshold(contrast)
+    ink = contrast.point(lambda p: 255 if p > threshold else 0)
+    bbox = ink.getbbox()
+    if not bbox:
+        raise ValueError("signature image is blank")
+    rgb, ink = rgb.crop(bbox), ink.crop(bbox)
+    max_px = max(1, round(width_pt / 72 * SIGNATURE_DPI))
+    if rgb.width > max_px:
+        size = (max_px, max(1, round(rgb.height * max_px / rgb.width)))
+        rgb = rgb.resize(size, Image.LANCZOS)
+        ink = ink.resize(size, Image.LANCZOS).point(lambda p: 255 if p >= 128 else 0)
+    ink = ink.convert("1")
+    colour = tuple(int(c) for c in ImageStat.Stat(rgb, ink).mean)
+    out = Image.new("P", rgb.size, 0)
+    out.putpalette([255, 255, 255, *colour])
+    out.paste(1, mask=ink)
+    buf = BytesIO()
+    out.save(buf, format="PNG", optimize=True, bits=1, transparency=0)
+    return SignatureImage(buf.getvalue(), out.width, out.height)
+
+
+def _load_signature(data: bytes, width_pt: float) -> SignatureImage:
+    key = (hashlib.sha256(data).hexdigest(), width_pt, SIGNATURE_DPI)
+    return _signature_cache.get_or_load(key, lambda: _normalize_signature(data, width_pt))
+
+
+def _signature_placement(role: str) -> dict:
+    return {"x": 380 if role == "seller" else 120, "y": 120, "page_index": 0, "w": 180}
+
+
+def _apply_signature(q: dict, role: str, signature: SignatureImage):
+    """
+    Stamp the signature onto the quote's latest signed PDF (the original if nobody has signed
+    yet) and commit it with a compare-and-set on sign_version. Status is derived server-side
+    from the document as it is at write time, so two simultaneous signers always end up
+    fully_signed with both signatures in signed_file_id. Returns (quote after update, new
+    GridFS file id), (quote, None) when this role has already signed, or (None, None) when
+    retries ran out.
+    """
+    from pymongo import ReturnDocument
+
+    other = "seller" if role == "buyer" else "buyer"
+    for _ in range(SIGN_MAX_ATTEMPTS):
+        if q.get(role, {}).get("signed"):
+            return q, None
+        # Quotes signed before signed_file_id existed keep the other signature in its own file
+        base_id = q.get("signed_file_id") or q.get(other, {}).get("file_id") or q.get("original_file_id")
+        if not base_id:
+            raise LookupError("original pdf missing")
+        fid = _sign_gridfs_file(base_id, signature, f"{q.get('quote_id','')}-{role}-signed.pdf",
+                                {"type": "quote_signed", "quote_id": q.get('quote_id',''), "role": role},
+                                **_signature_placement(role))
+        version = q.get("sign_version") or 0
+        updated = quotes_col.find_one_and_update(
+            {"_id": q["_id"], "sign_version": version if version else {"$in": [0, None]}, f"{role}.signed": {"$ne": True}},
+            [{"$set": {
+                f"{role}.signed": True,
+                f"{role}.signed_at": datetime.utcnow(),
+                f"{role}.file_id": fid,
+                "signed_file_id": fid,
+                "sign_version": version + 1,
+                "status": {"$cond": [{"$eq": [f"${other}.signed", True]}, "fully_signed", f"{role}_signed"]},
+            }}],
+            return_document=ReturnDocument.AFTER,
+        )
+        if updated:
+            return updated, fid
+        # Lost the race: drop our render (unless deduplication handed us a blob something
+        # else uses) and retry on top of whatever won; sweep-orphans catches a failed release
+        try:
+            pdf_store.release([fid])
+        except Exception:
+            app.logger.exception("could not release uncommitted render %s", fid)
+        q = quotes_col.find_one({"_id": q["_id"]})
+        if not q:
+            return None, None
+    return None, None
+
+
 @app.post("/sign/<token>")
 def sign_post_token(token):
     q, role = _find_by_token(token)
@@ -59,48 +295,87 @@ def sign_post_token(token):
     file = request.files.get("signature")
     if not file:
         return abort(400, "signature required")
-    sig_bytes = file.read()
-    fs = GridFS(db)
-    orig_id = q.get("original_file_id") or q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id") or q.get("original_file_id")
-    orig_id = q.get("original_file_id")
-    if not orig_id:
-        return abort(400, "original pdf missing")
-    pdf_bytes = fs.get(orig_id).read()
-    new_pdf = _overlay_signature(pdf_bytes, sig_bytes, x=380 if role=="seller" else 120, y=120, page_index=0, w=180)
-    fid = fs.put(new_pdf, filename=f"{q.get('quote_id','')}-{role}-signed.pdf", metadata={"type": "quote_signed", "quote_id": q.get('quote_id',''), "role": role})
-    quotes_col.update_one({"_id": q["_id"]}, {"$set": {f"{role}.signed": True, f"{role}.signed_at": datetime.utcnow(), f"{role}.file_id": fid, "status": ("fully_signed" if (role=="buyer" and q.get("seller",{}).get("signed")) or (role=="seller" and q.get("buyer",{}).get("signed")) else f"{role}_signed")}})
-    return send_file(BytesIO(new_pdf), mimetype="application/pdf", as_attachment=True, download_name=f"{q.get('quote_id','')}-{role}-signed.pdf")
-
-
-def _overlay_signature(pdf_bytes: bytes, signature_bytes: bytes, x: int, y: int, page_index: int = 0, w: int = 150) -> bytes:
-    """Overlay a signature image onto the given PDF page using PyMuPDF and return bytes.
-    x,y in points (72 per inch), origin top-left in PyMuPDF; we convert from bottom-left by page rect.
+    try:
+        signature = _load_signature(file.read(), _signature_placement(role)["w"])
+        q, fid = _apply_signature(q, role, signature)
+    except (LookupError, ValueError) as e:
+        return abort(400, str(e))
+    if q is None:
+        return abort(409, "quote is being signed concurrently, please retry")
+    if fid is None:
+        # Already signed (e.g. a double submit): hand back the current signed PDF
+        fid = q.get("signed_file_id") or q[role]["file_id"]
+    return _send_gridfs_pdf(fid, f"{q.get('quote_id','')}-{role}-signed.pdf")
+
+
+@app.get("/quotes/<quote_id>/pdf")
+def quote_pdf(quote_id):
+    """
+    Download a quote's latest PDF (?version=original for the unsigned one). Quote IDs are
+    sequential, so the caller must prove access with the buyer's or seller's signing token.
     """
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    page = doc[page_index]
-    sig_img = fitz.open(stream=signature_bytes, filetype="png")
-    rect = page.rect
-    # Convert y from bottom-left to top-left
-    y_top = rect.height - y
-    # Keep aspect ratio
-    iw = sig_img[0].rect.width
-    ih = sig_img[0].rect.height
-    if iw == 0:
-        iw = 1
-    scale = w / iw
-    h = ih * scale
-    bbox = fitz.Rect(x, y_top - h, x + w, y_top)
-    page.insert_image(bbox, stream=signature_bytes)
-    out = BytesIO()
-    doc.save(out)
-    doc.close()
-    return out.getvalue()
+    q, _ = _find_by_token(request.args.get("token", ""))
+    if not q or q.get("quote_id") != quote_id:
+        return abort(404)
+    if request.args.get("version") == "original":
+        fid = q.get("original_file_id")
+    else:
+        fid = q.get("signed_file_id") or q.get("original_file_id")
+    if not fid:
+        return abort(404, "pdf not available")
+    return _send_gridfs_pdf(fid, f"{quote_id}.pdf", as_attachment=False)
+
+
+@contextmanager
+def _spooled_gridfs_file(file_id):
+    """Copy a stored PDF version chunk by chunk into a temp file and yield its path."""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        pdf_store.download_version(file_id, tmp)
+    try:
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+
+def _sign_gridfs_file(src_id, signature: SignatureImage, filename: str, metadata: dict, **placement):
+    """
+    Overlay a signature on a stored PDF version as an incremental update and store only the
+    appended bytes, as a delta on src_id. PDFs MuPDF cannot append to (repaired on open,
+    encrypted) fall back to a full rewrite stored as a standalone blob.
+    """
+    with _spooled_gridfs_file(src_id) as src:
+        base_length = os.path.getsize(src)
+        if _run_overlay(src, signature, placement):
+            with open(src, "rb") as f:
+                f.seek(base_length)
+                return pdf_store.put_blob(f, filename, metadata, base_id=src_id)[0]
+        full = src + ".full"
+        try:
+            with open(full, "rb") as f:
+                return pdf_store.put_blob(f, filename, metadata)[0]
+        finally:
+            os.unlink(full)
+
+
+def _send_gridfs_pdf(file_id, download_name: str, as_attachment: bool = True) -> Response:
+    """
+    Stream a stored PDF version chunk by chunk. Versions are immutable, so the id is a strong
+    ETag; If-None-Match, If-Modified-Since and a single byte Range are handled by werkzeug,
+    which seeks the reader instead of reading what it skips. werkzeug has no
+    multipart/byteranges support, so a multi-range request gets the whole file (200) as
+    RFC 9110 allows, rather than a 416.
+    """
+    reader = pdf_store.VersionReader(file_id)
+    rv = Response(wrap_file(request.environ, reader, buffer_size=reader.chunk_size),
+                  mimetype="application/pdf", direct_passthrough=True)
+    rv.content_length = reader.length
+    rv.headers["Content-Disposition"] = f'{"attachment" if as_attachment else "inline"}; filename="{download_name}"'
+    rv.set_etag(str(file_id))
+    rv.last_modified = reader.upload_date
+    environ = request.environ
+    if request.range is not None and len(request.range.ranges) > 1:
+        environ = {k: v for k, v in environ.items() if k != "HTTP_RANGE"}
+    return rv.make_conditional(environ, accept_ranges=True, complete_length=reader.length)
 
 
 @app.post("/sign")
@@ -123,26 +398,29 @@ def sign_pdf():
     if not quote_id or not file:
         return abort(400, "missing quote_id or signature")
 
-    fs = GridFS(db)
-    doc = fs.find_one({"metadata.type": "quote_original", "metadata.quote_id": quote_id})
+    doc = next(iter(get_fs_bucket().find({"metadata.type": "quote_original", "metadata.quote_id": quote_id}, limit=1)), None)
     if not doc:
         return abort(404, "original pdf not found")
 
-    pdf_bytes = doc.read()
-    sig_bytes = file.read()
-
-    new_pdf = _overlay_signature(pdf_bytes, sig_bytes, x=x, y=y, page_index=page_index, w=w)
-    fs_id = fs.put(new_pdf, filename=f"{quote_id}-{role}-signed.pdf", metadata={"type": "quote_signed", "quote_id": quote_id, "role": role})
+    try:
+        signature = _load_signature(file.read(), w)
+    except ValueError as e:
+        return abort(400, str(e))
+    fs_id = _sign_gridfs_file(doc._id, signature, f"{quote_id}-{role}-signed.pdf",
+                              {"type": "quote_signed", "quote_id": quote_id, "role": role},
+                              x=x, y=y, page_index=page_index, w=w)
 
     # Update signing status on quote document by quote_id string
     update = {"$set": {f"{role}_signed": True, f"{role}_signed_at": datetime.utcnow(), f"{role}_signed_file_id": fs_id}}
     quotes_col.update_one({"quote_id": quote_id}, update, upsert=True)
 
-    return send_file(BytesIO(new_pdf), mimetype="application/pdf", as_attachment=True, download_name=f"{quote_id}-{role}-signed.pdf")
+    return _send_gridfs_pdf(fs_id, f"{quote_id}-{role}-signed.pdf")
 
 
 if __name__ == "__main__":
+	# Development server; production runs under gunicorn -c gunicorn.conf.py
 	port = int(os.environ.get("SIGN_PORT", "5001"))
+	_start_token_backfill()
 	app.run(host="0.0.0.0", port=port)
 
 
@@ -0,0 +1,24 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """Point db.py at a fresh in-memory mongomock database for one test."""
+    mongomock = pytest.importorskip("mongomock")
+    import mongomock.gridfs
+    import pymongo
+    import db
+
+    mongomock.gridfs.enable_gridfs_integration()
+    monkeypatch.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+    db.configure("mongodb://localhost:27017", f"test_{uuid.uuid4().hex[:12]}")
+    # GridFSBucket reads client.options.timeout, which mongomock clients lack
+    db.get_fs_bucket()._timeout = None
+    yield db.get_db()
+    db.configure()
@@ -0,0 +1,136 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import analytics
+
+A, B = ObjectId(), ObjectId()
+
+
+def _oid(when: datetime) -> ObjectId:
+    # from_datetime leaves the counter bytes zero; vary them so same-second quotes stay distinct
+    return ObjectId(ObjectId.from_datetime(when).binary[:4] + ObjectId().binary[4:])
+
+
+@pytest.fixture
+def quotes_col(mongo):
+    from db import quotes_col
+
+    d1, d2 = datetime(2026, 3, 1, 10), datetime(2026, 3, 2, 9)
+    quotes_col.insert_many([
+        {"_id": _oid(d1), "created_at": d1, "farmer_id": A, "crop_name": "Rice", "crop_count": 2,
+         "final_price": 90.0, "discount_percent": 10.0},
+        {"_id": _oid(d2), "created_at": d2, "crop_count": 3, "final_price": 118.0, "lines": [
+            {"farmer_id": A, "crop_name": "rice", "crop_count": 2, "base_price": 50.0, "final_price": 100.0},
+            {"farmer_id": B, "crop_name": "Wheat", "crop_count": 1, "base_price": 20.0, "final_price": 18.0},
+        ]},
+    ])
+    return quotes_col
+
+
+def test_rollups_total_quotes_per_day_farmer_and_crop(quotes_col):
+    assert analytics.refresh_quote_rollups() == 2
+
+    totals = analytics.overall_totals()
+    assert {k: totals[k] for k in ("quotes", "lines", "quantity", "revenue")} == {"quotes": 2, "lines": 3, "quantity": 5, "revenue": 208.0}
+    assert totals["avg_discount_percent"] == pytest.approx(100 * 12 / 220)
+
+    days = analytics.daily_totals(days=7, until=date(2026, 3, 2))
+    assert [(r["day"], r["quotes"], r["revenue"]) for r in days] == [("2026-03-01", 1, 90.0), ("2026-03-02", 1, 118.0)]
+    farmers = analytics.top("farmer")
+    assert [(r["farmer_id"], r["quotes"], r["revenue"]) for r in farmers] == [(A, 2, 190.0), (B, 1, 18.0)]
+    assert [(r["crop"], r["quotes"]) for r in analytics.top("crop", by="quotes")] == [("rice", 2), ("wheat", 1)]
+
+
+def test_rollups_are_incremental_and_replay_safe(quotes_col, monkeypatch):
+    analytics.refresh_quote_rollups()
+    assert analytics.refresh_quote_rollups() == 0
+
+    now = datetime.utcnow()
+    quotes_col.insert_one({"_id": _oid(now - timedelta(hours=1)), "created_at": now, "farmer_id": B, "crop_name": "Wheat",
+                           "crop_count": 1, "final_price": 20.0, "discount_percent": 0.0})
+    quotes_col.insert_one({"_id": _oid(now), "created_at": now, "farmer_id": B, "crop_name": "Wheat",
+                           "crop_count": 1, "final_price": 20.0, "discount_percent": 0.0})
+    # The quote from just now is left for the next run, in case an older _id is still being inserted
+    assert analytics.refresh_quote_rollups() == 1
+    assert analytics.overall_totals()["quotes"] == 3
+
+    # A run that stops after applying a batch but before moving the watermark...
+    quotes_col.insert_one({"_id": _oid(now - timedelta(minutes=30)), "created_at": now, "farmer_id": A, "crop_name": "Rice",
+                           "crop_count": 1, "final_price": 50.0, "discount_percent": 0.0})
+    real_apply = analytics._apply
+
+    def apply_then_crash(increments, batch_end):
+        real_apply(increments, batch_end)
+        raise ConnectionError("lost the server")
+
+    monkeypatch.setattr(analytics, "_apply", apply_then_crash)
+    with pytest.raises(ConnectionError):
+        analytics.refresh_quote_rollups()
+    monkeypatch.setattr(analytics, "_apply", real_apply)
+
+    # ...replays exactly that batch, even though a newer quote has settled since
+    quotes_col.insert_one({"_id": _oid(now - timedelta(minutes=20)), "created_at": now, "farmer_id": B, "crop_name": "Wheat",
+                           "crop_count": 1, "final_price": 20.0, "discount_percent": 0.0})
+    assert analytics.refresh_quote_rollups() == 2
+    assert analytics.overall_totals()["quotes"] == 5
+    assert {r["farmer_id"]: r["quotes"] for r in analytics.top("farmer", by="quotes")} == {A: 3, B: 3}
+
+
+def test_concurrent_refreshes_do_not_count_quotes_twice(quotes_col, monkeypatch):
+    from db import counters_col
+
+    now = datetime.utcnow()
+    quotes_col.insert_one({"_id": _oid(now - timedelta(minutes=1)), "created_at": now, "farmer_id": B, "crop_name": "Wheat",
+                           "crop_count": 1, "final_price": 20.0, "discount_percent": 0.0})
+    real_apply = analytics._apply
+    inner = []
+
+    # A second runner with a later horizon starts while the first is applying its batch
+    def apply_during_another_refresh(increments, batch_end):
+        if not inner:
+            inner.append(analytics.refresh_quote_rollups(settle=timedelta(0)))
+        real_apply(increments, batch_end)
+
+    monkeypatch.setattr(analytics, "_apply", apply_during_another_refresh)
+    assert analytics.refresh_quote_rollups(batch_size=1) == 2
+    assert inner == [None]
+    monkeypatch.setattr(analytics, "_apply", real_apply)
+
+    assert analytics.refresh_quote_rollups(settle=timedelta(0)) == 1
+    assert analytics.overall_totals()["quotes"] == 3
+    assert {r["farmer_id"]: r["quotes"] for r in analytics.top("farmer", by="quotes")} == {A: 2, B: 2}
+    assert "lease_owner" not in counters_col.find_one({"_id": "quote_rollups:watermark"})
+
+
+def test_refreshes_in_threads_count_each_quote_once(quotes_col):
+    import threading
+
+    now = datetime.utcnow()
+    quotes_col.insert_many([{"_id": _oid(now - timedelta(minutes=m)), "created_at": now, "farmer_id": B, "crop_name": "Wheat",
+                             "crop_count": 1, "final_price": 20.0, "discount_percent": 0.0} for m in (1, 5, 10)])
+    start = threading.Barrier(4)
+
+    def refresh(settle):
+        start.wait()
+        analytics.refresh_quote_rollups(settle=timedelta(minutes=settle), batch_size=1)
+
+    threads = [threading.Thread(target=refresh, args=(s,)) for s in (0, 2, 7, 0)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    analytics.refresh_quote_rollups(settle=timedelta(0))
+    assert analytics.overall_totals()["quotes"] == 5
+    assert {r["farmer_id"]: r["quotes"] for r in analytics.top("farmer", by="quotes")} == {A: 2, B: 4}
+
+
+def test_an_expired_lease_is_taken_over(quotes_col):
+    from db import counters_col
+
+    counters_col.insert_one({"_id": "quote_rollups:watermark", "lease_owner": "crashed",
+                             "lease_until": datetime.utcnow() + timedelta(minutes=1)})
+    assert analytics.refresh_quote_rollups() is None
+    counters_col.update_one({"_id": "quote_rollups:watermark"}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+    assert analytics.refresh_quote_rollups() == 2
@@ -0,0 +1,61 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def app(mongo, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+
+    # The script runner swaps in app.py as __main__; later process pools would re-run it
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+    return AppTest.from_file(APP, default_timeout=60)
+
+
+def test_failed_quote_email_is_shown_and_can_be_retried(app):
+    from db import mail_jobs_col
+
+    job_id = mail_jobs_col.insert_one({
+        "account": "seller@example.com", "to": ["buyer@example.com"], "subject": "Quote Q-1", "body": "", "filename": "Q-1.pdf",
+        "pdf": b"%PDF", "status": "failed", "attempts": 6, "last_error": "SMTPAuthenticationError: bad password",
+        "next_attempt_at": datetime.utcnow(),
+    }).inserted_id
+    app.session_state["_mail_jobs"] = [(job_id, "Q-1")]
+    app.run()
+    assert not app.exception
+    assert [e.value for e in app.sidebar.error] == ["Email for Q-1 was not sent: SMTPAuthenticationError: bad password"]
+
+    # No credentials are registered for the account, so the retried job just waits
+    app.sidebar.button(key=f"mail_retry_{job_id}").click().run()
+    job = mail_jobs_col.find_one({"_id": job_id})
+    assert (job["status"], job["attempts"]) == ("pending", 0)
+    assert not app.sidebar.error
+
+    mail_jobs_col.update_one({"_id": job_id}, {"$set": {"status": "failed"}})
+    app.run()
+    app.sidebar.button(key=f"mail_dismiss_{job_id}").click().run()
+    assert app.session_state["_mail_jobs"] == []
+    assert not app.sidebar.error
+
+
+def test_only_the_selected_page_runs(app, monkeypatch):
+    import data_cache
+
+    searches = []
+    real_page = data_cache.farmer_page
+    monkeypatch.setattr(data_cache, "farmer_page", lambda *a, **kw: searches.append(a) or real_page(*a, **kw))
+
+    app.run()
+    app.text_input(key="farmer_name_input").input("Asha").run()
+    assert not app.exception
+    assert [h.value for h in app.header] == ["Add a New Farmer"]
+    # Add Crop, Get Quote, Manage Data and Analytics all render a farmer picker; none of them ran
+    assert searches == []
+    assert list(app.session_state["_rerun_times"]) == ["Add Farmer"]
+    assert len(app.session_state["_rerun_times"]["Add Farmer"]) == 2
+    # The typed value is kept for when the page is shown again after visiting another
+    assert app.session_state["_page_state_saved"]["farmer_name_input"] == "Asha"
@@ -0,0 +1,28 @@
+import io
+
+import pytest
+
+import bulk_import
+
+
+def _import_csv(text, **kwargs):
+    f = io.StringIO(text)
+    f.name = "crops.csv"
+    result = bulk_import.ImportResult()
+    bulk_import.import_crops(bulk_import.read_rows(f, result), result, **kwargs)
+    return result
+
+
+@pytest.mark.parametrize("price", ["nan", "NaN", "inf", "-inf", "1e999"])
+def test_non_finite_base_price_is_rejected(mongo, price):
+    from db import crops_col
+
+    result = _import_csv(f"farmer,crop,base_price,discounts\nAsha,Rice,{price},\nAsha,Wheat,12.5,2:5\n", create_farmers=True)
+    assert result.failures == [(2, f"invalid base_price '{price}'")]
+    assert [(c["name"], c["base_price"]) for c in crops_col.find()] == [("Wheat", 12.5)]
+
+
+@pytest.mark.parametrize("discounts", ["2:nan", [{"min_crops": 2, "discount_percent": float("inf")}]])
+def test_non_finite_discount_is_rejected(discounts):
+    with pytest.raises(ValueError, match="discount_percent"):
+        bulk_import._crop_row({"farmer": "Asha", "crop": "Rice", "base_price": "10", "discounts": discounts})
@@ -0,0 +1,62 @@
+import os
+import zipfile
+
+import pytest
+
+import bulk_quotes
+
+
+def _fake_render(context):
+    if context.get("crash"):
+        os._exit(1)
+    return f"%PDF {context['quote_id']}".encode(), None
+
+
+class _ListSink:
+    def __init__(self):
+        self.written = []
+
+    def write(self, quote_id, pdf_bytes):
+        self.written.append(quote_id)
+
+    def close(self):
+        pass
+
+
+def test_dead_worker_does_not_abort_the_batch():
+    contexts = [{"quote_id": f"Q-{i}", "crash": i == 3} for i in range(12)]
+    sink = _ListSink()
+    result = bulk_quotes.generate_quote_pdfs(contexts, sink, workers=1, max_in_flight=2, render=_fake_render)
+    failed = {qid for _, qid, _ in result.failures}
+    assert "Q-3" in failed
+    # The pool is rebuilt: quotes submitted after the crash are still rendered
+    assert {"Q-8", "Q-9", "Q-10", "Q-11"} <= set(sink.written)
+    assert result.written + len(result.failures) == len(contexts)
+
+
+def test_repeated_crashes_stop_after_max_restarts():
+    contexts = [{"quote_id": f"Q-{i}", "crash": True} for i in range(8)]
+    result = bulk_quotes.generate_quote_pdfs(contexts, _ListSink(), workers=1, max_in_flight=1,
+                                             max_pool_restarts=1, render=_fake_render)
+    assert result.written == 0
+    assert len(result.failures) == len(contexts)
+    assert any("skipped" in error for _, _, error in result.failures)
+
+
+@pytest.mark.parametrize("quote_id", ["../escape", "a/b", "..", "Q 1", "C:\\x"])
+def test_sinks_reject_unsafe_quote_ids(tmp_path, quote_id):
+    with pytest.raises(ValueError):
+        bulk_quotes.DirectorySink(str(tmp_path / "out")).write(quote_id, b"%PDF")
+    sink = bulk_quotes.ZipSink(str(tmp_path / "out.zip"))
+    with pytest.raises(ValueError):
+        sink.write(quote_id, b"%PDF")
+    sink.close()
+    assert list(tmp_path.rglob("*.pdf")) == []
+
+
+def test_unsafe_quote_id_is_recorded_as_failure(tmp_path):
+    contexts = [{"quote_id": "Q-20260101-0000001"}, {"quote_id": "../../etc/x"}]
+    result = bulk_quotes.generate_quote_pdfs(contexts, bulk_quotes.ZipSink(str(tmp_path / "q.zip")), workers=1, render=_fake_render)
+    assert result.written == 1
+    assert [qid for _, qid, _ in result.failures] == ["../../etc/x"]
+    assert zipfile.ZipFile(tmp_path / "q.zip").namelist() == ["Q-20260101-0000001.pdf"]
@@ -0,0 +1,37 @@
+import pytest
+
+from cpq import CropPricer, DiscountSchedule, calculate_price, price_grid
+
+TIER_SETS = [
+    [],
+    [{"min_crops": 2, "discount_percent": 5}],
+    [{"min_crops": 3, "discount_percent": 10}, {"min_crops": 2, "discount_percent": 5}],
+    # A later tier with a smaller discount must not lower the best one already reached
+    [{"min_crops": 2, "discount_percent": 12}, {"min_crops": 5, "discount_percent": 4}, {"min_crops": 10, "discount_percent": 20}],
+    [{"min_crops": 0, "discount_percent": 1.5}, {"min_crops": 1, "discount_percent": 1.5}],
+]
+QUANTITIES = [0, 1, 2, 3, 4, 5, 9, 10, 11, 100, 10_000]
+
+
+@pytest.mark.parametrize("rules", TIER_SETS)
+def test_scalar_pricer_and_grid_agree(rules):
+    pricer = CropPricer(12.5, rules)
+    finals, discounts = price_grid([pricer], QUANTITIES)
+    for i, qty in enumerate(QUANTITIES):
+        expected = calculate_price(12.5, qty, rules)
+        assert pricer.price(qty) == pytest.approx(expected)
+        assert calculate_price(12.5, qty, DiscountSchedule(rules)) == pytest.approx(expected)
+        assert (finals[0][i], discounts[0][i]) == pytest.approx(expected)
+
+
+def test_price_grid_rows_follow_pricers():
+    pricers = [CropPricer.from_crop({"base_price": p, "discount_rules": rules}) for p, rules in zip((3, 7.25, 40), TIER_SETS)]
+    finals, discounts = price_grid(pricers, QUANTITIES)
+    assert finals.shape == discounts.shape == (3, len(QUANTITIES))
+    for row, pricer in enumerate(pricers):
+        assert list(finals[row]) == pytest.approx([pricer.price(q)[0] for q in QUANTITIES])
+
+
+def test_best_tier_wins():
+    assert calculate_price(10, 3, TIER_SETS[2]) == (27.0, 10)
+    assert calculate_price(10, 1, TIER_SETS[2]) == (10, 0)
@@ -0,0 +1,90 @@
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import data_cache
+
+
+class _Stream:
+    """Stands in for a pymongo ChangeStream replaying `events`, then raising `error`."""
+
+    def __init__(self, events, error=None, on_end=None):
+        self._events = list(events)
+        self._error = error
+        self._on_end = on_end
+        self.resume_token = None
+        self.alive = True
+
+    def try_next(self):
+        if self._events:
+            change = self._events.pop(0)
+            self.resume_token = change["_id"]
+            return change
+        if self._error:
+            raise self._error
+        self._on_end()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.alive = False
+
+
+def _change(n, coll="crops", farmer_id="f1"):
+    return {"_id": {"_data": f"token-{n}"}, "ns": {"coll": coll}, "fullDocument": {"farmer_id": farmer_id}}
+
+
+def _listener(script):
+    """A listener whose successive watch() calls replay `script`: [(events, error), ...]."""
+    calls = []
+
+    def watch(pipeline, **kwargs):
+        calls.append(kwargs.get("resume_after"))
+        events, error = script[len(calls) - 1]
+        return _Stream(events, error, on_end=listener._stop.set)
+
+    listener = data_cache.ChangeStreamListener(watch=watch, min_backoff=0.001)
+    return listener, calls
+
+
+@pytest.fixture(autouse=True)
+def _clean_caches():
+    data_cache.invalidate_farmers()
+    data_cache.invalidate_crops()
+
+
+def test_reconnects_and_resumes_after_last_event():
+    data_cache.crops_cache.set("f2", {"Rice": {}})
+    listener, calls = _listener([
+        ([_change(1)], AutoReconnect("connection reset")),
+        ([_change(2, farmer_id="f2")], None),
+    ])
+    listener.run()
+    assert calls == [None, {"_data": "token-1"}]
+    assert listener.reconnects == 1
+    assert "AutoReconnect" in listener.last_error
+    assert data_cache.crops_cache.get("f2") is None
+    assert listener.state == "stopped"
+
+
+def test_lost_resume_token_drops_every_cache():
+    listener, calls = _listener([
+        ([_change(1)], AutoReconnect("blip")),
+        ([], OperationFailure("history lost", code=286)),
+        ([], None),
+    ])
+    # Fill the caches after the first event so only a full invalidation can clear them
+    listener._apply = lambda change: (data_cache.farmers_cache.set(("", None), ([], None)), data_cache.crops_cache.set("other", {}))
+    listener.run()
+    assert calls == [None, {"_data": "token-1"}, None]
+    assert listener.full_invalidations == 1
+    assert data_cache.farmers_cache.get(("", None)) is None
+    assert data_cache.crops_cache.get("other") is None
+
+
+def test_standalone_server_stops_listening():
+    listener, calls = _listener([([], OperationFailure("only supported on replica sets", code=40573))])
+    listener.run()
+    assert listener.status()["state"] == "unavailable"
+    assert calls == [None]
@@ -0,0 +1,67 @@
+import pytest
+from bson import ObjectId
+
+from deletions import DeletionWorker
+from quotes import quotes_owned_by, quotes_shared_by
+
+A, B = ObjectId(), ObjectId()
+
+
+def _quote(quote_id, *lines):
+    if len(lines) == 1:
+        (farmer_id, crop_name), = lines
+        return {"quote_id": quote_id, "farmer_id": farmer_id, "crop_name": crop_name}
+    quote = {"quote_id": quote_id, "lines": [{"farmer_id": f, "crop_name": c} for f, c in lines]}
+    if len({f for f, _ in lines}) == 1:
+        quote["farmer_id"] = lines[0][0]
+    return quote
+
+
+@pytest.fixture
+def stored_quotes(mongo):
+    from db import quotes_col
+
+    quotes_col.insert_many([
+        _quote("a-wheat", (A, "Wheat")),
+        _quote("a-corn", (A, "Corn")),
+        _quote("a-both", (A, "Wheat"), (A, "Corn")),
+        _quote("joint", (A, "Wheat"), (B, "Corn")),
+        _quote("b-wheat", (B, "Wheat")),
+    ])
+    return quotes_col
+
+
+def _run(quote_filter, crop_filter=None):
+    worker = DeletionWorker(duty_cycle=1.0)
+    worker.start = lambda: None  # drive it with run_once()
+    worker.enqueue(quote_filter, crop_filter)
+    assert worker.run_once()
+    return worker
+
+
+def _left(quotes_col):
+    return sorted(q["quote_id"] for q in quotes_col.find())
+
+
+def test_crop_delete_only_removes_quotes_with_that_line(stored_quotes):
+    # The joint quote has A's Wheat and B's Corn; deleting A's Corn must not match it
+    assert sorted(q["quote_id"] for q in stored_quotes.find(quotes_shared_by(A, "Corn"))) == []
+    _run(quotes_owned_by(A, "Corn"))
+    assert _left(stored_quotes) == ["a-wheat", "b-wheat", "joint"]
+
+
+def test_farmer_delete_keeps_joint_quotes(stored_quotes):
+    from db import crops_col
+
+    crops_col.insert_many([{"farmer_id": A, "name": "Wheat"}, {"farmer_id": B, "name": "Corn"}])
+    assert [q["quote_id"] for q in stored_quotes.find(quotes_shared_by(A))] == ["joint"]
+    worker = _run(quotes_owned_by(A), crop_filter={"farmer_id": A})
+    assert _left(stored_quotes) == ["b-wheat", "joint"]
+    assert [c["farmer_id"] for c in crops_col.find()] == [B]
+    assert worker.recent_jobs()[0]["deleted"]["quotes"] == 3
+
+
+def test_unmigrated_list_farmer_ids_are_not_owned(stored_quotes):
+    stored_quotes.update_one({"quote_id": "joint"}, {"$set": {"farmer_id": [A, B]}})
+    _run(quotes_owned_by(A))
+    assert _left(stored_quotes) == ["b-wheat", "joint"]
@@ -0,0 +1,138 @@
+import email
+import smtplib
+import socket
+
+import pytest
+
+import email_utils
+
+
+class _Inbox:
+    """aiosmtpd handler: keeps accepted messages, refuses recipients at refused.example."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@refused.example"):
+            return "550 5.1.1 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    controller_mod = pytest.importorskip("aiosmtpd.controller")
+    inbox = _Inbox()
+    port = _free_port()
+    controller = controller_mod.Controller(inbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_SSL", "0")
+    yield inbox
+    controller.stop()
+
+
+@pytest.fixture
+def dispatcher(mongo, monkeypatch):
+    monkeypatch.delenv("GMAIL_USER", raising=False)
+    d = email_utils.MailDispatcher(base_backoff=0)
+    d.start = lambda: None  # drive it with run_once()
+    yield d
+    d.stop()
+
+
+def test_dispatcher_delivers_over_local_smtp(smtp_server, dispatcher):
+    job_id = dispatcher.enqueue("seller@example.com", ["buyer@example.com", ""], "Quote Q-1", "Please sign.",
+                                b"%PDF-1.4 test", "Q-1.pdf", app_password="pw")
+    second = dispatcher.enqueue("seller@example.com", ["other@example.com"], "Quote Q-2", "Body", b"%PDF", "Q-2.pdf")
+    assert dispatcher.run_once() == 2
+
+    assert [m["Subject"] for m in smtp_server.messages] == ["Quote Q-1", "Quote Q-2"]
+    attachment = next(p for p in smtp_server.messages[0].walk() if p.get_filename() == "Q-1.pdf")
+    assert attachment.get_payload(decode=True) == b"%PDF-1.4 test"
+    jobs = dispatcher.job_statuses([job_id, second])
+    assert [j["status"] for j in jobs] == ["sent", "sent"]
+    assert "pdf" not in dispatcher.jobs_col.find_one({"_id": job_id})
+
+
+def test_refused_recipient_fails_permanently_and_can_be_retried(smtp_server, dispatcher):
+    job_id = dispatcher.enqueue("seller@example.com", ["nobody@refused.example"], "Quote Q-3", "Body", b"%PDF",
+                                "Q-3.pdf", app_password="pw")
+    dispatcher.run_once()
+    [job] = dispatcher.job_statuses([job_id])
+    assert job["status"] == "failed"
+    assert "SMTPRecipientsRefused" in job["last_error"]
+    assert smtp_server.messages == []
+
+    assert dispatcher.retry(job_id)
+    assert not dispatcher.retry(job_id)  # only failed jobs are re-queued
+    assert dispatcher.job_statuses([job_id])[0]["status"] == "pending"
+
+
+def test_unreachable_server_is_retried_with_backoff(mongo, dispatcher, monkeypatch):
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(_free_port()))
+    monkeypatch.setenv("SMTP_SSL", "0")
+    dispatcher.base_backoff = 60
+    job_id = dispatcher.enqueue("seller@example.com", ["buyer@example.com"], "Quote Q-4", "Body", b"%PDF",
+                                "Q-4.pdf", app_password="pw")
+    dispatcher.run_once()
+    [job] = dispatcher.job_statuses([job_id])
+    assert (job["status"], job["attempts"]) == ("pending", 1)
+    assert dispatcher.run_once() == 0  # not due again until the backoff passes
+
+
+@pytest.mark.parametrize("err", [smtplib.SMTPNotSupportedError("SMTP AUTH extension not supported by server."),
+                                 smtplib.SMTPException("No suitable authentication method found.")])
+def test_permanent_smtp_errors_fail_without_retrying(mongo, dispatcher, monkeypatch, err):
+    def connect(account):
+        raise err
+
+    monkeypatch.setattr(dispatcher, "_connection", connect)
+    job_id = dispatcher.enqueue("seller@example.com", ["buyer@example.com"], "Quote Q-5", "Body", b"%PDF",
+                                "Q-5.pdf", app_password="pw")
+    dispatcher.run_once()
+    [job] = dispatcher.job_statuses([job_id])
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+
+
+@pytest.mark.parametrize("err, transient", [
+    (smtplib.SMTPServerDisconnected("gone"), True),
+    (ConnectionRefusedError(), True),
+    (socket.timeout(), True),
+    (smtplib.SMTPResponseException(421, b"busy"), True),
+    (smtplib.SMTPAuthenticationError(535, b"bad credentials"), False),
+    (smtplib.SMTPNotSupportedError(), False),
+    (smtplib.SMTPException(), False),
+])
+def test_only_connection_drops_and_4xx_are_transient(err, transient):
+    assert email_utils._is_transient(err) is transient
+
+
+def test_message_type_is_only_imported_when_used():
+    import os
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, email_utils; print(sorted(m for m in ('email.message', 'smtplib', 'ssl') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+    from email.message import EmailMessage
+
+    msg = email_utils._build_message("a@example.com", ["b@example.com", ""], "Quote", "Body", b"%PDF", "Q-1.pdf")
+    assert isinstance(msg, EmailMessage)
+    assert msg["To"] == "b@example.com"
@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from click.testing import CliRunner
+
+
+def test_get_quote_prices_through_crop_pricer(mongo):
+    import main
+    from db import crops_col, farmers_col, quotes_col
+
+    fid = farmers_col.insert_one({"name": "Asha"}).inserted_id
+    crops_col.insert_one({"farmer_id": fid, "name": "Rice", "base_price": 20.0, "discount_rules": [
+        {"min_crops": 5, "discount_percent": 10}, {"min_crops": 2, "discount_percent": 5},
+    ]})
+    result = CliRunner().invoke(main.cli, ["get-quote"], input="Asha\nRice\n6\n")
+    assert result.exit_code == 0, result.output
+    assert "₹108.00 (Discount Applied: 10%)" in result.output
+    quote = quotes_col.find_one()
+    assert (quote["final_price"], quote["discount_percent"], quote["farmer_id"]) == (108.0, 10, fid)
+
+
+def test_export_quotes_to_stdout_is_only_csv(mongo):
+    import csv
+    import main
+    from db import farmers_col, quotes_col
+    from quotes import build_quote
+
+    asha = farmers_col.insert_one({"name": "Asha"}).inserted_id
+    bala = farmers_col.insert_one({"name": "Bala"}).inserted_id
+    crops = {(fid, "Rice"): {"farmer_id": fid, "name": "Rice", "base_price": 20.0, "discount_rules": []} for fid in (asha, bala)}
+    joint, _, _ = build_quote([{"farmer_id": asha, "crop_name": "Rice", "quantity": 1},
+                               {"farmer_id": bala, "crop_name": "Rice", "quantity": 2}], {}, crops=crops)
+    single, _, _ = build_quote([{"farmer_id": asha, "crop_name": "Rice", "quantity": 3}], {}, crops=crops)
+    quotes_col.insert_many([joint, single])
+
+    result = CliRunner().invoke(main.cli, ["export-quotes", "-", "--farmer", "Bala"])
+    assert result.exit_code == 0, result.output
+    assert result.stderr.startswith("Exported 1 quotes as csv")
+    rows = list(csv.DictReader(result.stdout.splitlines()))
+    assert [(r["quote_id"], r["farmer"], r["crop"], r["lines"]) for r in rows] == [(joint["quote_id"], "Asha; Bala", "Rice", "2")]
+
+
+def test_importing_main_prints_nothing():
+    import os
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", "import main"], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout == ""
+
+
+def test_create_quotes_reports_empty_and_rejected_specs(mongo, monkeypatch):
+    import json
+    import main
+    import quotes
+    from db import crops_col, farmers_col, quotes_col, sign_tokens_col
+
+    fid = farmers_col.insert_one({"name": "Asha"}).inserted_id
+    crops_col.insert_one({"farmer_id": fid, "name": "Rice", "base_price": 20.0, "discount_rules": []})
+    quotes_col.create_index("quote_id", unique=True)
+    quotes_col.insert_one({"quote_id": "Q-TAKEN"})
+    monkeypatch.setattr(quotes, "new_quote_id", iter(["Q-TAKEN", "Q-FREE"]).__next__)
+
+    line = {"farmer": "Asha", "crop": "Rice", "quantity": 2}
+    specs = [{"buyer": "Ravi", "lines": [line]}, {"buyer": "Ravi", "lines": []}, {"buyer": "Ravi", "lines": [line]}]
+    result = CliRunner().invoke(main.cli, ["create-quotes", "-"], input="\n".join(json.dumps(s) for s in specs))
+    assert result.exit_code == 0, result.output
+    assert "line 1: not saved (" in result.output
+    assert "line 2: a quote needs at least one line" in result.output
+    assert "Created 1 quotes, 2 failed." in result.output
+    saved = quotes_col.find_one({"quote_id": "Q-FREE"})
+    assert {d["quote_oid"] for d in sign_tokens_col.find()} == {saved["_id"]}
+
+
+def test_parquet_export_without_pyarrow_fails_cleanly(mongo, tmp_path, monkeypatch):
+    from importlib.util import find_spec
+
+    import main
+    import quote_export
+
+    assert ("parquet" in quote_export.FORMATS) == (find_spec("pyarrow") is not None)
+    monkeypatch.setattr(quote_export, "FORMATS", ("csv", "jsonl"))
+    out = tmp_path / "quotes.parquet"
+    result = CliRunner().invoke(main.cli, ["export-quotes", str(out)])
+    assert result.exit_code == 2
+    assert "parquet export needs pyarrow" in result.output
+    assert not out.exists()
+    with pytest.raises(ValueError, match="needs pyarrow"):
+        quote_export.export_quotes(io.BytesIO(), "parquet")
@@ -0,0 +1,20 @@
+import io
+
+import pdf_store
+
+
+def test_release_keeps_blobs_still_in_use(mongo):
+    from db import quotes_col
+
+    base, _ = pdf_store.put_blob(io.BytesIO(b"%PDF base"), "q.pdf", {})
+    delta, _ = pdf_store.put_blob(io.BytesIO(b" delta"), "q.pdf", {}, base_id=base)
+    loose, _ = pdf_store.put_blob(io.BytesIO(b"%PDF loose"), "q.pdf", {})
+    quotes_col.insert_one({"signed_file_id": delta})
+
+    # base is only reachable through the delta's metadata.base_id
+    assert pdf_store.release([base, loose]) == 1
+    assert pdf_store.VersionReader(delta).read() == b"%PDF base delta"
+
+    quotes_col.delete_many({})
+    assert pdf_store.release([base, delta]) == 2
+    assert mongo["fs.files"].count_documents({}) == 0
@@ -0,0 +1,27 @@
+import db
+
+
+def _all_pages(prefix, limit):
+    pages, after = [], None
+    while True:
+        farmers, after = db.search_farmers(prefix, after=after, limit=limit)
+        pages.append([f["name"] for f in farmers])
+        if after is None:
+            return pages
+
+
+def test_search_pages_through_prefix_matches_in_name_order(mongo):
+    names = ["Bala", "Asif", "Asha", "Ashok", "Asha", "Ravi", "Ash"]
+    db.farmers_col.insert_many([{"name": n} for n in names])
+
+    # Two farmers named Asha straddle a page boundary: the _id tie-break keeps both, once
+    assert _all_pages("As", 2) == [["Ash", "Asha"], ["Asha", "Ashok"], ["Asif"]]
+    assert _all_pages("", 3) == [["Ash", "Asha", "Asha"], ["Ashok", "Asif", "Bala"], ["Ravi"]]
+    assert _all_pages("Z", 5) == [[]]
+
+
+def test_page_size_is_capped(mongo):
+    db.farmers_col.insert_many([{"name": f"F{i:04d}"} for i in range(db.SEARCH_MAX_PAGE_SIZE + 5)])
+    farmers, after = db.search_farmers("F", limit=10_000)
+    assert len(farmers) == db.SEARCH_MAX_PAGE_SIZE
+    assert after == (farmers[-1]["name"], farmers[-1]["_id"])
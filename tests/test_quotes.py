@@ -0,0 +1,133 @@
+import pytest
+from bson import ObjectId
+
+import quotes
+
+A, B = ObjectId(), ObjectId()
+CROPS = {
+    (A, "Wheat"): {"farmer_id": A, "name": "Wheat", "base_price": 10.0, "discount_rules": {}},
+    (A, "Corn"): {"farmer_id": A, "name": "Corn", "base_price": 5.0, "discount_rules": {}},
+    (B, "Corn"): {"farmer_id": B, "name": "Corn", "base_price": 6.0, "discount_rules": {}},
+}
+
+
+def _build(*lines):
+    lines = [{"farmer_id": f, "crop_name": c, "quantity": 2} for f, c in lines]
+    quote, _, tokens = quotes.build_quote(lines, {A: "Asha", B: "Bala"}, crops=CROPS)
+    return quote, tokens
+
+
+def test_joint_quote_has_no_list_fields(mongo):
+    quote, _ = _build((A, "Wheat"), (B, "Corn"))
+    assert "farmer_id" not in quote and "crop_name" not in quote
+    assert [(ln["farmer_id"], ln["crop_name"]) for ln in quote["lines"]] == [(A, "Wheat"), (B, "Corn")]
+
+    quote, _ = _build((A, "Wheat"), (A, "Corn"))
+    assert quote["farmer_id"] == A
+    assert "crop_name" not in quote
+
+
+def test_crop_filter_matches_farmer_and_crop_on_the_same_line(mongo):
+    from db import quotes_col
+
+    joint, _ = _build((A, "Wheat"), (B, "Corn"))
+    single, _ = _build((A, "Corn"))
+    quotes_col.insert_many([joint, single])
+
+    def matching(query):
+        return {q["quote_id"] for q in quotes_col.find(query)}
+
+    assert matching(quotes.quotes_for_crop(A, "Corn")) == {single["quote_id"]}
+    assert matching(quotes.quotes_for_crop(B, "Corn")) == {joint["quote_id"]}
+    assert matching(quotes.quotes_for_crop(B, "Wheat")) == set()
+    assert matching(quotes.quotes_for_farmer(A)) == {joint["quote_id"], single["quote_id"]}
+    assert matching(quotes.quotes_for_farmer(B)) == {joint["quote_id"]}
+
+
+def test_list_fields_from_older_quotes_are_unset(mongo):
+    from db import quotes_col, unset_list_quote_fields
+
+    quote, _ = _build((A, "Wheat"), (B, "Corn"))
+    quotes_col.insert_one({**quote, "farmer_id": [A, B], "crop_name": ["Wheat", "Corn"]})
+    assert unset_list_quote_fields() == 2
+    assert unset_list_quote_fields() == 0
+    stored = quotes_col.find_one({"_id": quote["_id"]})
+    assert "farmer_id" not in stored and "crop_name" not in stored
+
+
+def test_signing_service_looks_up_tokens_with_the_same_hash(mongo):
+    import signing_service
+
+    quote, tokens = _build((A, "Wheat"))
+    assert quote["buyer"]["token_hash"] == quotes.hash_token(tokens["buyer"])
+    assert signing_service.hash_token is quotes.hash_token
+
+
+def test_quote_ids_are_unique_across_processes_with_one_round_trip_per_block(mongo, monkeypatch):
+    import re
+    from datetime import datetime
+
+    from db import counters_col
+
+    leases = []
+    real_update = counters_col.find_one_and_update
+
+    class _Counters:
+        def find_one_and_update(self, *args, **kwargs):
+            leases.append(args[0]["_id"])
+            return real_update(*args, **kwargs)
+
+    # Two allocators on one counter stand in for two app processes
+    first = quotes.QuoteIdAllocator(block_size=3, counters=_Counters())
+    second = quotes.QuoteIdAllocator(block_size=3, counters=_Counters())
+    ids = [first.next(), first.next(), second.next(), first.next(), first.next(), second.next()]
+    assert len(set(ids)) == 6
+    assert all(re.fullmatch(r"Q-\d{8}-\d{7}", i) for i in ids)
+    from_first = [ids[0], ids[1], ids[3], ids[4]]
+    assert from_first == sorted(from_first)
+    assert len(leases) == 3
+
+    class _Tomorrow(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2099, 1, 2)
+
+    monkeypatch.setattr(quotes, "datetime", _Tomorrow)
+    assert first.next() == "Q-20990102-0000001"
+
+
+def test_quote_id_migration_renumbers_duplicates_and_enforces_uniqueness(mongo):
+    import pymongo.errors
+    from db import migrate_quote_ids, quotes_col
+
+    older, newer = ObjectId(), ObjectId()
+    quotes_col.insert_many([{"_id": older, "quote_id": "Q-20250101-abc123"}, {"_id": newer, "quote_id": "Q-20250101-abc123"},
+                            {"quote_id": None}])
+    fresh = iter(["Q-NEW-1", "Q-NEW-2"])
+    result = migrate_quote_ids(new_id=lambda: next(fresh))
+    assert result["assigned"] == 1
+    assert result["renamed"] == {newer: ("Q-20250101-abc123", "Q-NEW-2")}
+    assert quotes_col.find_one({"_id": older})["quote_id"] == "Q-20250101-abc123"
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        quotes_col.insert_one({"quote_id": "Q-NEW-1"})
+
+
+def test_quote_without_lines_is_rejected():
+    with pytest.raises(ValueError, match="at least one line"):
+        quotes.build_quote([], {}, crops=CROPS)
+
+
+def test_quotes_inserted_alongside_a_rejected_one_still_get_tokens(mongo):
+    import pymongo.errors
+    from db import quotes_col, sign_tokens_col
+
+    quotes_col.create_index("quote_id", unique=True)
+    first, _ = _build((A, "Wheat"))
+    duplicate, _ = _build((A, "Corn"))
+    last, last_tokens = _build((B, "Corn"))
+    duplicate["quote_id"] = first["quote_id"]
+
+    with pytest.raises(pymongo.errors.BulkWriteError):
+        quotes.insert_quotes([first, duplicate, last])
+    assert {d["quote_oid"] for d in sign_tokens_col.find()} == {first["_id"], last["_id"]}
+    assert sign_tokens_col.find_one({"_id": quotes.hash_token(last_tokens["seller"])})["role"] == "seller"
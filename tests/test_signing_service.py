@@ -0,0 +1,224 @@
+import io
+import os
+import secrets
+import time
+
+import pytest
+from bson import ObjectId
+
+import signing_service
+from quotes import hash_token
+
+
+def _png(size=(300, 100), ink=(0, 0, 160, 255)) -> bytes:
+    from PIL import Image
+
+    img = Image.new("RGBA", size, (255, 255, 255, 255))
+    if ink:
+        img.paste(ink, (20, 30, size[0] - 20, 60))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _crash(path, signature, placement):
+    os._exit(1)
+
+
+def _hang(path, signature, placement):
+    time.sleep(2)
+
+
+@pytest.fixture
+def quote(mongo):
+    """A pending quote with its original PDF in GridFS; yields (quote, buyer token, seller token)."""
+    fitz = pytest.importorskip("fitz")
+    import pdf_store
+    from db import quotes_col, sign_tokens_col
+
+    doc = fitz.open()
+    doc.new_page()
+    original, _ = pdf_store.put_blob(io.BytesIO(doc.tobytes()), "Q-1.pdf", {"type": "quote_original", "quote_id": "Q-1"})
+    oid = ObjectId()
+    tokens = {role: secrets.token_urlsafe(24) for role in ("buyer", "seller")}
+    quotes_col.insert_one({"_id": oid, "quote_id": "Q-1", "status": "pending", "original_file_id": original,
+                           **{role: {"signed": False, "token_hash": hash_token(t)} for role, t in tokens.items()}})
+    sign_tokens_col.insert_many([{"_id": hash_token(t), "quote_oid": oid, "role": role} for role, t in tokens.items()])
+    yield quotes_col.find_one({"_id": oid}), tokens["buyer"], tokens["seller"]
+
+
+@pytest.fixture
+def client():
+    signing_service._signature_cache.invalidate()
+    return signing_service.app.test_client()
+
+
+def _sign(client, token, data=None):
+    return client.post(f"/sign/{token}", data={"signature": (io.BytesIO(data or _png()), "sig.png")})
+
+
+@pytest.fixture
+def overlay_pool(monkeypatch):
+    monkeypatch.setattr(signing_service, "SIGN_OVERLAY_WORKERS", 1)
+    yield
+    signing_service.shutdown_overlay_pool()
+
+
+@pytest.mark.parametrize("stamp, timeout", [(_crash, 60), (_hang, 0.5)])
+def test_failed_overlay_worker_returns_503_and_replaces_the_pool(quote, client, overlay_pool, monkeypatch, stamp, timeout):
+    from db import quotes_col
+
+    q, buyer, _ = quote
+    real_stamp = signing_service.stamp_file
+    monkeypatch.setattr(signing_service, "SIGN_OVERLAY_TIMEOUT", timeout)
+    monkeypatch.setattr(signing_service, "stamp_file", stamp)
+    failed_pool = signing_service._get_overlay_pool()
+
+    rv = _sign(client, buyer)
+    assert rv.status_code == 503
+    assert rv.headers["Retry-After"] == "5"
+    assert b"please retry" in rv.data
+    assert signing_service._overlay_pool is not failed_pool
+    assert quotes_col.find_one({"_id": q["_id"]})["status"] == "pending"
+
+    monkeypatch.setattr(signing_service, "stamp_file", real_stamp)
+    assert _sign(client, buyer).status_code == 200
+    assert quotes_col.find_one({"_id": q["_id"]})["status"] == "buyer_signed"
+    assert client.get("/ready").json["overlay_pool"] == "ok"
+
+
+def test_decompression_bomb_is_rejected(quote, client, monkeypatch):
+    from PIL import Image
+
+    _, buyer, _ = quote
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)  # the 300x100 upload is over twice this
+    rv = _sign(client, buyer)
+    assert rv.status_code == 400
+    assert b"too large" in rv.data
+
+
+@pytest.mark.parametrize("image", [_png(ink=None), _png(ink=(250, 250, 250, 255)), _png(ink=(0, 0, 0, 0))])
+def test_blank_signature_is_rejected(quote, client, image):
+    from db import quotes_col
+
+    q, buyer, _ = quote
+    rv = _sign(client, buyer, image)
+    assert rv.status_code == 400
+    assert b"blank" in rv.data
+    assert quotes_col.find_one({"_id": q["_id"]})["status"] == "pending"
+
+
+def test_signature_is_trimmed_to_its_ink():
+    signature = signing_service._normalize_signature(_png(), 180)
+    assert (signature.width, signature.height) == (260, 30)
+
+
+def test_pdf_download_serves_single_ranges_and_ignores_multiple(quote, client):
+    import pdf_store
+
+    q, buyer, _ = quote
+    url = f"/quotes/Q-1/pdf?token={buyer}"
+    full = pdf_store.VersionReader(q["original_file_id"]).read()
+
+    rv = client.get(url, headers={"Range": "bytes=5-14"})
+    assert rv.status_code == 206
+    assert rv.headers["Content-Range"] == f"bytes 5-14/{len(full)}"
+    assert rv.data == full[5:15]
+
+    rv = client.get(url, headers={"Range": "bytes=0-4,10-14"})
+    assert rv.status_code == 200
+    assert rv.headers["Accept-Ranges"] == "bytes"
+    assert rv.data == full
+
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_render_that_lost_the_race_is_released(quote, client, monkeypatch):
+    import pdf_store
+    from db import get_db, quotes_col
+
+    stale, buyer, seller = quote
+    assert _sign(client, seller).status_code == 200
+    released = []
+    real_release = pdf_store.release
+    monkeypatch.setattr(pdf_store, "release", lambda ids: released.append(list(ids)) or real_release(ids))
+
+    # Signing from the stale read stamps on the original, loses the compare-and-set and retries
+    signature = signing_service._load_signature(_png(), 180)
+    q, fid = signing_service._apply_signature(stale, "buyer", signature)
+    assert q["status"] == "fully_signed"
+    [[lost]] = released
+    assert lost != fid
+    files = get_db()["fs.files"]
+    assert files.find_one({"_id": lost}) is None
+    live = {d["_id"] for d in files.find()}
+    assert live == {stale["original_file_id"], q["seller"]["file_id"], fid}
+    assert quotes_col.count_documents({}) == 1
+
+
+def test_tokens_resolve_through_sign_tokens(mongo, client):
+    from db import quotes_col
+    from quotes import build_quote, insert_quotes
+
+    fid = ObjectId()
+    crops = {(fid, "Rice"): {"farmer_id": fid, "name": "Rice", "base_price": 10.0, "discount_rules": []}}
+    quote, _, tokens = build_quote([{"farmer_id": fid, "crop_name": "Rice", "quantity": 1}], {}, crops=crops)
+    insert_quotes([quote])
+    # The lookup is a point read on sign_tokens, not a match on the quote's own hashes
+    quotes_col.update_one({"_id": quote["_id"]}, {"$unset": {"buyer.token_hash": "", "seller.token_hash": ""}})
+
+    for role, token in tokens.items():
+        q, found_role = signing_service._find_by_token(token)
+        assert (q["_id"], found_role) == (quote["_id"], role)
+    rv = client.get(f"/sign/{tokens['seller']}")
+    assert rv.status_code == 200
+    assert b"(seller)" in rv.data
+    assert client.get("/sign/not-a-token").status_code == 404
+
+
+def test_legacy_quote_tokens_work_before_and_after_backfill(mongo):
+    from db import backfill_sign_tokens, quotes_col, sign_tokens_col
+
+    token = secrets.token_urlsafe(24)
+    oid = quotes_col.insert_one({"quote_id": "Q-OLD", "buyer": {"signed": False, "token_hash": hash_token(token)},
+                                 "seller": {"signed": False}}).inserted_id
+    assert signing_service._find_by_token(token) == (quotes_col.find_one({"_id": oid}), "buyer")
+    assert backfill_sign_tokens() == 1
+    assert backfill_sign_tokens() == 0
+    assert sign_tokens_col.find_one({"_id": hash_token(token)}) == {"_id": hash_token(token), "quote_oid": oid, "role": "buyer"}
+
+
+def test_simultaneous_signers_end_fully_signed_with_both_signatures(quote):
+    import threading
+
+    import fitz
+    import pdf_store
+    from db import quotes_col
+
+    q, buyer, seller = quote
+    start = threading.Barrier(2)
+    codes = {}
+
+    def post(role, token):
+        client = signing_service.app.test_client()
+        start.wait()
+        codes[role] = _sign(client, token).status_code
+
+    threads = [threading.Thread(target=post, args=args) for args in (("buyer", buyer), ("seller", seller))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert codes == {"buyer": 200, "seller": 200}
+
+    final = quotes_col.find_one({"_id": q["_id"]})
+    assert final["status"] == "fully_signed"
+    assert final["sign_version"] == 2
+    pdf = fitz.open(stream=pdf_store.VersionReader(final["signed_file_id"]).read(), filetype="pdf")
+    assert len(pdf[0].get_images()) == 2
+
+    # A repeated submit changes nothing and hands back the signed PDF
+    rv = _sign(signing_service.app.test_client(), buyer)
+    assert rv.status_code == 200
+    assert quotes_col.find_one({"_id": q["_id"]})["sign_version"] == 2
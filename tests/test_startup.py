@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import _HEAVY_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the module with MongoClient disabled, then lists the heavy modules it pulled in
+_PROBE = """
+import importlib, sys
+import pymongo
+
+def _connect(self, *args, **kwargs):
+    raise SystemExit("MongoClient created while importing " + sys.argv[1])
+
+pymongo.MongoClient.__init__ = _connect
+importlib.import_module(sys.argv[1])
+print(",".join(m for m in sys.argv[2:] if m in sys.modules))
+"""
+
+
+def _run(code: str, *args) -> str:
+    out = subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ""
+
+
+@pytest.mark.parametrize("module", ["signing_service", "main", "db", "quotes", "data_cache", "email_utils", "utils",
+                                    "bulk_quotes", "dashboard", "analytics"])
+def test_import_neither_connects_nor_loads_heavy_dependencies(module):
+    assert _run(_PROBE, module, *_HEAVY_MODULES) == ""
+
+
+def test_first_app_run_loads_no_heavy_dependencies():
+    pytest.importorskip("streamlit.testing.v1")
+    pytest.importorskip("mongomock")
+    code = (
+        "import sys, mongomock, pymongo; pymongo.MongoClient = mongomock.MongoClient; "
+        "from streamlit.testing.v1 import AppTest; "
+        "at = AppTest.from_file('app.py', default_timeout=60).run(); "
+        "assert not at.exception, at.exception; "
+        "print(','.join(m for m in sys.argv[1:] if m in sys.modules))"
+    )
+    assert _run(code, *_HEAVY_MODULES) == ""
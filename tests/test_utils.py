@@ -0,0 +1,231 @@
+import pytest
+
+import utils
+
+
+def _quote_context(**overrides):
+    context = {
+        "quote_id": "Q-20260101-0000001", "date": "2026-01-01", "farmer": "Asha", "buyer": "Ravi",
+        "breakdown": [{"name": "Rice", "quantity": 3, "base": 20.0, "discount_percent": 5.0, "discount_amount": 3.0, "final": 57.0}],
+        "total_base": "60.00", "total_discount": "3.00", "total_final": "57.00", "valid_until": "2026-02-01",
+    }
+    context.update(overrides)
+    return context
+
+
+@pytest.fixture
+def unicode_font(tmp_path, monkeypatch):
+    if not utils._unicode_font_path():
+        pytest.skip("no Unicode font installed")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    subsets = utils._unicode_font_file
+    subsets.cache_clear()
+    yield
+    subsets.cache_clear()
+
+
+def test_quote_pdf_embeds_unicode_subset(unicode_font):
+    fitz = pytest.importorskip("fitz")
+    pdf = utils.render_quote_to_pdf_bytes(_quote_context(farmer="Āśā Ōmkār"))
+    text = fitz.open(stream=pdf, filetype="pdf")[0].get_text()
+    assert "₹57.00" in text
+    assert "Āśā Ōmkār" in text
+
+
+def test_font_subsets_are_keyed_by_block(unicode_font):
+    assert utils._font_chars(_quote_context()) == utils._BASE_FONT_CHARS
+    # Different characters from the same block share one subset file
+    assert utils._font_chars(_quote_context(farmer="Ā")) == utils._font_chars(_quote_context(farmer="ś"))
+    utils.render_quote_to_pdf_bytes(_quote_context(farmer="Ā"))
+    utils.render_quote_to_pdf_bytes(_quote_context(farmer="ś"))
+    assert utils._unicode_font_file.cache_info().misses == 1
+
+
+def test_missing_subset_file_is_rebuilt(unicode_font):
+    import os
+
+    path = utils._unicode_font_file(utils._unicode_font_path(), utils._BASE_FONT_CHARS)
+    os.remove(path)
+    assert utils.render_quote_to_pdf_bytes(_quote_context()).startswith(b"%PDF")
+    assert os.path.exists(path)
+
+
+def test_subsets_live_in_a_private_per_user_directory(unicode_font, tmp_path):
+    import os
+    import stat
+
+    path = utils._unicode_font_file(utils._unicode_font_path(), utils._BASE_FONT_CHARS)
+    assert os.path.dirname(path) == str(tmp_path / "agr-cpq" / "fonts")
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
+
+
+def test_shared_cache_directory_is_refused_and_quote_falls_back_to_arial(unicode_font, tmp_path, monkeypatch):
+    import os
+
+    fitz = pytest.importorskip("fitz")
+    font_dir = tmp_path / "agr-cpq" / "fonts"
+    font_dir.mkdir(parents=True)
+    os.chmod(font_dir, 0o777)
+    (font_dir / "planted.ttf").write_bytes(b"not a font")
+    warnings = []
+    monkeypatch.setattr(utils.log, "warning", lambda msg, *args, **kwargs: warnings.append(msg % args))
+
+    pdf = utils.render_quote_to_pdf_bytes(_quote_context())
+    assert "INR 57.00" in fitz.open(stream=pdf, filetype="pdf")[0].get_text()
+    assert warnings == [f"could not load Unicode font {utils._unicode_font_path()}; quotes fall back to Arial"]
+
+
+def test_font_that_cannot_be_subset_falls_back_to_arial(unicode_font, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+
+    def broken(font_path, chars):
+        raise KeyError("glyf")
+
+    monkeypatch.setattr(utils, "_unicode_font_file", broken)
+    pdf = utils.render_quote_to_pdf_bytes(_quote_context())
+    assert "INR 57.00" in fitz.open(stream=pdf, filetype="pdf")[0].get_text()
+
+
+@pytest.fixture
+def template_dir(tmp_path, monkeypatch):
+    """A fresh shared Jinja2 environment whose loader reads tmp_path."""
+    monkeypatch.setattr(utils, "_jinja_env", None)
+    monkeypatch.setattr(utils._get_jinja_env().loader, "searchpath", [str(tmp_path)])
+    return tmp_path
+
+
+def test_templates_are_compiled_once_and_reloaded_when_changed(template_dir):
+    import os
+
+    path = template_dir / "note.html"
+    path.write_text("Hello {{ name }}")
+    env = utils._get_jinja_env()
+    assert utils.render_template_to_html("note.html", {"name": "<Asha>"}) == "Hello &lt;Asha&gt;"
+    first = env.get_template("note.html")
+    assert utils._get_jinja_env() is env
+    assert env.get_template("note.html") is first  # served from the environment's cache
+
+    path.write_text("Bye {{ name }}")
+    mtime = os.stat(path).st_mtime + 5
+    os.utime(path, (mtime, mtime))
+    assert utils.render_template_to_html("note.html", {"name": "Asha"}) == "Bye Asha"
+    assert env.get_template("note.html") is not first
+
+
+def _lease_context():
+    party = {"name": "Asha", "address": "Village Road", "contact": "9999999999", "id_type": "Aadhaar", "id_number": "1234"}
+    return {
+        "agreement_id": "LEASE-0001", "agreement_date": "2026-01-01", "lessor": party, "lessee": party,
+        "property": {"village": "V", "taluka": "T", "district": "D", "state": "S", "parcel_id": "42/1", "area_acres": 2.5},
+        "term": {"start_date": "2026-01-01", "end_date": "2026-12-31", "duration_text": "12 months"},
+        "possession_date": "2026-01-01", "crops": [{"name": "Wheat", "variety": "HD-2967", "season": "Rabi", "acreage": 2.5}],
+        "amounts": {"original": 50000.0, "discount_percent": 5.0, "discount_amount": 2500.0, "final": 47500.0},
+        "payment_schedule": [{"due_date": "2026-03-01", "amount": 47500.0, "method": "NEFT", "notes": None}],
+        "irrigation_clause": "Irrigation from existing source.", "termination_notice_days": 30,
+        "additional_clauses": None, "witnesses": [party, party], "signature_date": "2026-01-01",
+    }
+
+
+@pytest.fixture
+def no_temp_files(monkeypatch):
+    import tempfile
+
+    def _refuse(*args, **kwargs):
+        raise AssertionError("rendering touched a temp file")
+
+    utils.render_quote_to_pdf_bytes(_quote_context())  # builds the cached font subset once
+    for name in ("NamedTemporaryFile", "TemporaryFile", "mkstemp"):
+        monkeypatch.setattr(tempfile, name, _refuse)
+
+
+def test_quote_pdf_renders_in_memory(no_temp_files, tmp_path):
+    fitz = pytest.importorskip("fitz")
+    pdf = utils.render_quote_to_pdf_bytes(_quote_context())
+    assert "Q-20260101-0000001" in fitz.open(stream=pdf, filetype="pdf")[0].get_text()
+
+    path = tmp_path / "q.pdf"
+    assert utils.render_quote_to_pdf(_quote_context(), str(path)) == str(path)
+    assert path.read_bytes().startswith(b"%PDF")
+
+
+def test_lease_pdf_renders_in_memory(no_temp_files, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(utils._html_pdf_renderer, "render", lambda html: rendered.append(html) or b"%PDF-lease")
+    assert utils.render_lease_to_pdf_bytes(_lease_context()) == b"%PDF-lease"
+    [html] = rendered
+    assert "LEASE-0001" in html and "HD-2967" in html
+
+
+class _FakePdfkit:
+    """pdfkit whose wkhtmltopdf binary is missing (configuration raises) or present."""
+
+    def __init__(self, installed=True, fails_on=None):
+        self.installed, self.fails_on = installed, fails_on
+        self.configured = self.rendered = 0
+
+    def configuration(self, **kwargs):
+        self.configured += 1
+        if not self.installed:
+            raise OSError("No wkhtmltopdf executable found")
+        return object()
+
+    def from_string(self, html, output_path, options=None, configuration=None):
+        if self.fails_on and self.fails_on in html:
+            raise OSError("wkhtmltopdf exited with 1")
+        self.rendered += 1
+        return b"%PDF-pdfkit"
+
+
+def _fake_weasyprint(monkeypatch):
+    import sys
+    import types
+
+    class HTML:
+        def __init__(self, string):
+            self.string = string
+
+        def write_pdf(self, target, font_config=None):
+            font_configs.add(id(font_config))
+            target.write(b"%PDF-weasy")
+
+    font_configs = set()
+    fonts = types.SimpleNamespace(FontConfiguration=object)
+    monkeypatch.setitem(sys.modules, "weasyprint", types.SimpleNamespace(HTML=HTML))
+    monkeypatch.setitem(sys.modules, "weasyprint.text", types.SimpleNamespace(fonts=fonts))
+    monkeypatch.setitem(sys.modules, "weasyprint.text.fonts", fonts)
+    return font_configs
+
+
+def test_missing_wkhtmltopdf_is_probed_once(monkeypatch):
+    import sys
+
+    pdfkit = _FakePdfkit(installed=False)
+    monkeypatch.setitem(sys.modules, "pdfkit", pdfkit)
+    font_configs = _fake_weasyprint(monkeypatch)
+    renderer = utils.HtmlPdfRenderer()
+    assert renderer.render_many(["<p>1</p>", "<p>2</p>", "<p>3</p>"]) == [b"%PDF-weasy"] * 3
+    assert renderer.backend == "weasyprint"
+    assert pdfkit.configured == 1
+    assert len(font_configs) == 1  # one warm FontConfiguration for every document
+
+
+def test_pdfkit_failure_falls_back_for_that_document_only(monkeypatch):
+    import sys
+
+    pdfkit = _FakePdfkit(fails_on="broken")
+    monkeypatch.setitem(sys.modules, "pdfkit", pdfkit)
+    _fake_weasyprint(monkeypatch)
+    renderer = utils.HtmlPdfRenderer()
+    assert renderer.render_many(["<p>ok</p>", "<p>broken</p>", "<p>ok</p>"], workers=2) == [
+        b"%PDF-pdfkit", b"%PDF-weasy", b"%PDF-pdfkit"]
+    assert renderer.backend == "pdfkit"
+    assert pdfkit.rendered == 2
+
+
+def test_no_backend_raises_a_clear_error(monkeypatch):
+    import sys
+
+    monkeypatch.setitem(sys.modules, "pdfkit", None)
+    monkeypatch.setitem(sys.modules, "weasyprint", None)
+    with pytest.raises(RuntimeError, match="Install wkhtmltopdf"):
+        utils.HtmlPdfRenderer().render("<p>x</p>")
@@ -1,9 +1,42 @@
 # utils.py
+import logging
+from functools import lru_cache
 
-def parse_discount_rules(discount_str):
+log = logging.getLogger(__name__)
+
+_jinja_env = None
+
+
+def _get_jinja_env():
+    """
+    Process-wide Jinja2 environment for the local templates folder.
+    Compiled templates stay in the environment's cache and are only re-parsed
+    when the template file's mtime changes (auto_reload). Set
+    JINJA_BYTECODE_CACHE_DIR to also keep compiled bytecode on disk across processes.
+    """
+    global _jinja_env
+    if _jinja_env is None:
+        from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+        import os
+
+        templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
+        bytecode_dir = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+        if bytecode_dir:
+            os.makedirs(bytecode_dir, exist_ok=True)
+        _jinja_env = Environment(
+            loader=FileSystemLoader(templates_dir),
+            autoescape=select_autoescape(['html', 'xml']),
+            auto_reload=True,
+            bytecode_cache=FileSystemBytecodeCache(bytecode_dir) if bytecode_dir else None,
+        )
+    return _jinja_env
+
+
+def parse_discount_rules(discount_str, strict=False):
     """
     Parse discount string like "2:5,3:10" into list of dicts:
     [{"min_crops": 2, "discount_percent": 5}, {"min_crops": 3, "discount_percent": 10}]
+    Invalid parts are skipped, or raise ValueError when strict.
     """
     rules = []
     if discount_str:
@@ -13,8 +46,8 @@ def parse_discount_rules(discount_str):
                 min_crops, disc = part.split(':')
                 rules.append({"min_crops": int(min_crops), "discount_percent": float(disc)})
             except Exception:
-                # You can log or print warning here if you want
-                pass
+                if strict:
+                    raise ValueError(f"invalid discount '{part.strip()}' (expected min_crops:percent)")
     return rules
 
 
@@ -23,6 +56,12 @@ def format_currency(amount):
     return f"₹{amount:,.2f}"
 
 
+def _write_bytes(data: bytes, output_pdf_path: str) -> str:
+    with open(output_pdf_path, 'wb') as f:
+        f.write(data)
+    return output_pdf_path
+
+
 def render_lease_to_pdf(context: dict, output_pdf_path: str) -> str:
     """
     Render the lease agreement HTML template with the provided context and
@@ -30,67 +69,207 @@ def render_lease_to_pdf(context: dict, output_pdf_path: str) -> str:
 
     Returns the path to the generated PDF.
     """
-    from jinja2 import Environment, FileSystemLoader, select_autoescape
-    import os
+    return _write_bytes(render_lease_to_pdf_bytes(context), output_pdf_path)
 
-    templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
-    env = Environment(
-        loader=FileSystemLoader(templates_dir),
-        autoescape=select_autoescape(['html', 'xml'])
-    )
-    template = env.get_template('lease.html')
-    html_content = template.render(**context)
 
-    return _render_html_to_pdf(html_content, output_pdf_path)
+def render_lease_to_pdf_bytes(context: dict) -> bytes:
+    """Render the lease agreement straight to PDF bytes in memory."""
+    html_content = render_template_to_html('lease.html', context)
+    return _render_html_to_pdf_bytes(html_content)
 
 
 def render_quote_to_pdf(context: dict, output_pdf_path: str) -> str:
     """Generate a simple quote PDF using FPDF (no external system deps)."""
+    return _write_bytes(render_quote_to_pdf_bytes(context), output_pdf_path)
+
+
+_UNICODE_FONT_CANDIDATES = [
+    r'C:\\Windows\\Fonts\\Nirmala.ttf',
+    r'C:\\Windows\\Fonts\\seguisym.ttf',
+    r'C:\\Windows\\Fonts\\arialuni.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+]
+# Characters every quote can draw without re-subsetting: Latin-1 plus ₹
+_BASE_FONT_CHARS = frozenset(range(0x20, 0x7f)) | frozenset(range(0xa0, 0x100)) | {0x20b9}
+
+
+@lru_cache(maxsize=1)
+def _unicode_font_path():
+    """First available Unicode font (for ₹), probed once per process."""
+    import os
+    for font_path in _UNICODE_FONT_CANDIDATES:
+        if os.path.exists(font_path):
+            return font_path
+    return None
+
+
+# Contexts needing other characters get whole 128-code-point blocks, so a handful of subsets
+# covers every document
+_FONT_BLOCK = 0x80
+
+
+def _font_cache_dir() -> str:
+    """
+    Per-user directory for font subsets (~/.cache/agr-cpq/fonts, or under $XDG_CACHE_HOME).
+    Files found here are embedded in every quote, so the directory must be private to us.
+    """
+    import os
+    import stat
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    font_dir = os.path.join(base, 'agr-cpq', 'fonts')
+    os.makedirs(font_dir, mode=0o700, exist_ok=True)
+    st = os.lstat(font_dir)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{font_dir} is not a directory")
+    if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+        raise PermissionError(f"{font_dir} must be owned by this user and not accessible to others")
+    return font_dir
+
+
+@lru_cache(maxsize=32)
+def _unicode_font_file(font_path: str, chars: frozenset) -> str:
+    """
+    Subset font_path to `chars` once and save it as a small .ttf in the per-user cache
+    directory (shared by this user's processes). FPDF then parses a few hundred glyphs per
+    document instead of the whole font.
+    """
+    import hashlib
+    import os
+    from fontTools import subset, ttLib
+
+    key = hashlib.sha1(f"{font_path}:{os.path.getmtime(font_path)}:{sorted(chars)}".encode()).hexdigest()[:16]
+    font_dir = _font_cache_dir()
+    path = os.path.join(font_dir, f"uni-{key}.ttf")
+    if os.path.exists(path):
+        return path
+
+    options = subset.Options()
+    options.glyph_names = True  # FPDF subsets by glyph name when writing the PDF
+    options.name_IDs = ['*']
+    options.name_languages = ['*']
+    options.notdef_outline = True
+    options.layout_features = []
+    options.drop_tables += ['FFTM']
+    options.hinting = False  # PDF viewers rasterize without TrueType hints
+    font = ttLib.TTFont(font_path, recalcTimestamp=False)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=chars)
+    subsetter.subset(font)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    font.save(tmp)
+    os.replace(tmp, path)  # atomic: concurrent renderers never see a partial file
+    return path
+
+
+def _context_chars(value) -> frozenset:
+    """Every code point appearing in a (nested) render context."""
+    if isinstance(value, dict):
+        return frozenset().union(*(_context_chars(v) for v in value.values()))
+    if isinstance(value, (list, tuple)):
+        return frozenset().union(*(_context_chars(v) for v in value))
+    return frozenset(map(ord, str(value)))
+
+
+def _font_chars(context: dict) -> frozenset:
+    """Latin-1 and ₹, plus each whole block holding a character the context uses."""
+    blocks = {c // _FONT_BLOCK for c in _context_chars(context) - _BASE_FONT_CHARS}
+    if not blocks:
+        return _BASE_FONT_CHARS
+    return _BASE_FONT_CHARS | frozenset(c for b in blocks for c in range(b * _FONT_BLOCK, (b + 1) * _FONT_BLOCK))
+
+
+def _add_unicode_font(pdf, context: dict) -> bool:
+    """Register the UNI regular/bold fonts on pdf; False if no Unicode font is usable."""
+    import os
+
+    font_path = _unicode_font_path()
+    if not font_path:
+        return False
+    try:
+        chars = _font_chars(context)
+        path = _unicode_font_file(font_path, chars)
+        if not os.path.exists(path):  # cache directory cleaned since it was cached
+            _unicode_font_file.cache_clear()
+            path = _unicode_font_file(font_path, chars)
+        pdf.add_font('UNI', '', path)
+        pdf.add_font('UNI', 'B', path)
+    except Exception:
+        log.warning("could not load Unicode font %s; quotes fall back to Arial", font_path, exc_info=True)
+        return False
+    return True
+
+
+class _QuoteLayout:
+    """Static page chrome of a quote PDF, shared by every document."""
+
+    title = 'AGRI-CPQ QUOTE'
+    col_widths = (60, 20, 30, 30, 30)
+    headers = ('Crop', 'Qty', 'Base', 'Discount', 'Final')
+    # Signature boxes (buyer left, seller right)
+    box_xs = (20, 120)
+    box_w, box_h = 70, 25
+
+    def draw_title(self, pdf, font):
+        pdf.set_font(font, 'B', 16)
+        pdf.cell(0, 10, self.title, ln=1, align='C')
+
+    def draw_table_header(self, pdf, font):
+        pdf.set_font(font, 'B', 11)
+        for w, h in zip(self.col_widths, self.headers):
+            pdf.cell(w, 8, h, border=1, align='C')
+        pdf.ln(8)
+
+    def draw_signatures(self, pdf, font, buyer_name: str, seller_name: str):
+        pdf.ln(8)
+        pdf.set_font(font, 'B', 12)
+        pdf.cell(0, 8, 'Signatures', ln=1)
+        pdf.set_font(font, '', 11)
+        # Labels
+        y0 = pdf.get_y()
+        left, right = self.box_xs
+        pdf.text(x=left, y=y0 + 6, txt=f"Buyer: {buyer_name}")
+        pdf.text(x=right, y=y0 + 6, txt=f"Seller: {seller_name}")
+        # Draw boxes
+        box_y = y0 + 8
+        for x in self.box_xs:
+            pdf.rect(x=x, y=box_y, w=self.box_w, h=self.box_h)
+        pdf.set_font(font, '', 9)
+        for x in self.box_xs:
+            pdf.text(x=x + 3, y=box_y + 6, txt='Sign here')
+        # Date labels
+        pdf.set_font(font, '', 11)
+        for x in self.box_xs:
+            pdf.text(x=x, y=box_y + self.box_h + 5, txt='Date: __________')
+
+
+_QUOTE_LAYOUT = _QuoteLayout()
+
+
+def render_quote_to_pdf_bytes(context: dict) -> bytes:
+    """Generate the quote PDF with FPDF and return its bytes without touching disk."""
     from fpdf import FPDF
-    import tempfile, os
 
+    layout = _QUOTE_LAYOUT
     pdf = FPDF(format='A4', unit='mm')
     pdf.add_page()
     # Load a Unicode font if available for ₹, otherwise use 'INR '
-    currency_symbol = '₹'
-    unicode_font_loaded = False
-    try:
-        font_candidates = [
-            r'C:\\Windows\\Fonts\\Nirmala.ttf',
-            r'C:\\Windows\\Fonts\\seguisym.ttf',
-            r'C:\\Windows\\Fonts\\arialuni.ttf',
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-        ]
-        import os
-        for font_path in font_candidates:
-            if os.path.exists(font_path):
-                pdf.add_font('UNI', '', font_path, uni=True)
-                pdf.add_font('UNI', 'B', font_path, uni=True)
-                unicode_font_loaded = True
-                break
-    except Exception:
-        unicode_font_loaded = False
-    if unicode_font_loaded:
-        pdf.set_font('UNI', 'B', 16)
+    if _add_unicode_font(pdf, context):
+        font, currency_symbol = 'UNI', '₹'
     else:
-        pdf.set_font('Arial', 'B', 16)
-        currency_symbol = 'INR '
-    pdf.cell(0, 10, 'AGRI-CPQ QUOTE', ln=1, align='C')
+        font, currency_symbol = 'Arial', 'INR '
+    layout.draw_title(pdf, font)
 
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', '', 11)
+    pdf.set_font(font, '', 11)
     pdf.cell(0, 8, f"Quote ID: {context.get('quote_id','')}", ln=1)
     pdf.cell(0, 8, f"Date: {context.get('date','')}", ln=1)
     pdf.cell(0, 8, f"Farmer: {context.get('farmer','')}  |  Buyer: {context.get('buyer','')}", ln=1)
     pdf.ln(2)
 
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', 'B', 11)
-    col_widths = [60, 20, 30, 30, 30]
-    headers = ['Crop', 'Qty', 'Base', 'Discount', 'Final']
-    for w, h in zip(col_widths, headers):
-        pdf.cell(w, 8, h, border=1, align='C')
-    pdf.ln(8)
+    layout.draw_table_header(pdf, font)
 
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', '', 11)
+    col_widths = layout.col_widths
+    pdf.set_font(font, '', 11)
     for it in context.get('breakdown', []):
         pdf.cell(col_widths[0], 8, str(it.get('name','')), border=1)
         pdf.cell(col_widths[1], 8, str(it.get('quantity','')), border=1, align='C')
@@ -102,113 +281,175 @@ def render_quote_to_pdf(context: dict, output_pdf_path: str) -> str:
         pdf.ln(8)
 
     pdf.ln(2)
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', 'B', 12)
+    pdf.set_font(font, 'B', 12)
     pdf.cell(0, 8, f"Total Base: {currency_symbol}{context.get('total_base','')}", ln=1, align='R')
     pdf.cell(0, 8, f"Total Discount: {currency_symbol}{context.get('total_discount','')}", ln=1, align='R')
     pdf.cell(0, 8, f"Final Price: {currency_symbol}{context.get('total_final','')}", ln=1, align='R')
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', '', 10)
+    pdf.set_font(font, '', 10)
     pdf.cell(0, 6, f"Valid until: {context.get('valid_until','')}", ln=1, align='R')
 
-    # Signature placeholders (buyer left, seller right)
-    pdf.ln(8)
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', 'B', 12)
-    pdf.cell(0, 8, 'Signatures', ln=1)
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', '', 11)
-    buyer_name = str(context.get('buyer', ''))
-    seller_name = str(context.get('farmer', ''))
-    # Labels
-    y0 = pdf.get_y()
-    pdf.text(x=20, y=y0 + 6, txt=f"Buyer: {buyer_name}")
-    pdf.text(x=120, y=y0 + 6, txt=f"Seller: {seller_name}")
-    # Signature boxes (with optional embedded links)
-    box_y = y0 + 8
-    box_w, box_h = 70, 25
-    # Draw boxes
-    pdf.rect(x=20, y=box_y, w=box_w, h=box_h)
-    pdf.rect(x=120, y=box_y, w=box_w, h=box_h)
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', '', 9)
-    pdf.text(x=23, y=box_y + 6, txt='Sign here')
-    pdf.text(x=123, y=box_y + 6, txt='Sign here')
-    # Date labels
-    pdf.set_font('UNI' if unicode_font_loaded else 'Arial', '', 11)
-    pdf.text(x=20, y=box_y + box_h + 5, txt='Date: __________')
-    pdf.text(x=120, y=box_y + box_h + 5, txt='Date: __________')
+    layout.draw_signatures(pdf, font, str(context.get('buyer', '')), str(context.get('farmer', '')))
 
     # (confirmation links removed per request)
 
-    pdf.output(output_pdf_path)
-    return output_pdf_path
+    return bytes(pdf.output())
 
 
 def _render_html_to_pdf(html_content: str, output_pdf_path: str) -> str:
     """Prefer pdfkit (wkhtmltopdf); if unavailable, fall back to WeasyPrint."""
-    # First try pdfkit, which works well on Windows with wkhtmltopdf
-    try:
-        import pdfkit  # type: ignore
-        import os
-        wkhtml_cmd = os.environ.get('WKHTMLTOPDF_CMD')
-        config = pdfkit.configuration(wkhtmltopdf=wkhtml_cmd) if wkhtml_cmd else None
-        options = {
-            'page-size': 'A4',
-            'margin-top': '15mm',
-            'margin-right': '12mm',
-            'margin-bottom': '15mm',
-            'margin-left': '12mm',
-            'encoding': 'UTF-8',
-        }
-        if config:
-            pdfkit.from_string(html_content, output_pdf_path, options=options, configuration=config)
-        else:
-            pdfkit.from_string(html_content, output_pdf_path, options=options)
-        return output_pdf_path
-    except Exception:
-        # Fallback to WeasyPrint
+    return _write_bytes(_render_html_to_pdf_bytes(html_content), output_pdf_path)
+
+
+_PDFKIT_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '15mm',
+    'margin-right': '12mm',
+    'margin-bottom': '15mm',
+    'margin-left': '12mm',
+    'encoding': 'UTF-8',
+}
+
+
+class HtmlPdfRenderer:
+    """
+    Long-lived HTML-to-PDF renderer. Backend detection happens once: pdfkit
+    (wkhtmltopdf) is preferred, and once it is found to be missing it is never
+    retried. WeasyPrint is imported once and keeps a warm FontConfiguration so
+    fonts are not rediscovered for every document.
+    """
+
+    def __init__(self):
+        import threading
+        self._lock = threading.Lock()
+        self._pdfkit = None
+        self._pdfkit_config = None
+        self._pdfkit_ok = None  # None = not probed yet
+        self._weasy_html = None
+        self._weasy_font_config = None
+        self._weasy_ok = None
+
+    def _probe_pdfkit(self) -> bool:
+        if self._pdfkit_ok is None:
+            try:
+                import pdfkit  # type: ignore
+                import os
+                wkhtml_cmd = os.environ.get('WKHTMLTOPDF_CMD')
+                # configuration() raises OSError when the wkhtmltopdf binary is missing
+                self._pdfkit_config = pdfkit.configuration(wkhtmltopdf=wkhtml_cmd) if wkhtml_cmd else pdfkit.configuration()
+                self._pdfkit = pdfkit
+                self._pdfkit_ok = True
+            except Exception:
+                self._pdfkit_ok = False
+        return self._pdfkit_ok
+
+    def _probe_weasyprint(self) -> bool:
+        if self._weasy_ok is None:
+            try:
+                from weasyprint import HTML  # type: ignore
+                try:
+                    from weasyprint.text.fonts import FontConfiguration  # type: ignore
+                except ImportError:  # WeasyPrint < 53
+                    from weasyprint.fonts import FontConfiguration  # type: ignore
+                self._weasy_html = HTML
+                self._weasy_font_config = FontConfiguration()
+                self._weasy_ok = True
+            except Exception:
+                self._weasy_ok = False
+        return self._weasy_ok
+
+    @property
+    def backend(self):
+        """'pdfkit', 'weasyprint' or None, detected on first use."""
+        with self._lock:
+            if self._probe_pdfkit():
+                return 'pdfkit'
+            if self._probe_weasyprint():
+                return 'weasyprint'
+            return None
+
+    def _render_pdfkit(self, html_content: str) -> bytes:
+        # output_path=False makes pdfkit return the PDF from wkhtmltopdf's stdout
+        return self._pdfkit.from_string(html_content, False, options=_PDFKIT_OPTIONS, configuration=self._pdfkit_config)
+
+    def _render_weasyprint(self, html_content: str) -> bytes:
+        from io import BytesIO
+        buf = BytesIO()
+        with self._lock:
+            self._weasy_html(string=html_content).write_pdf(buf, font_config=self._weasy_font_config)
+        return buf.getvalue()
+
+    def render(self, html_content: str) -> bytes:
+        """Render one HTML document to PDF bytes."""
+        backend = self.backend
+        error = None
+        if backend == 'pdfkit':
+            try:
+                return self._render_pdfkit(html_content)
+            except Exception as e:
+                # This document failed; fall back to WeasyPrint for it only
+                error = e
+                with self._lock:
+                    has_weasyprint = self._probe_weasyprint()
+                if not has_weasyprint:
+                    raise RuntimeError(
+                        "PDF generation failed. Install wkhtmltopdf (recommended) or WeasyPrint dependencies."
+                    ) from error
+        elif backend is None:
+            raise RuntimeError(
+                "PDF generation failed. Install wkhtmltopdf (recommended) or WeasyPrint dependencies."
+            )
         try:
-            from weasyprint import HTML  # type: ignore
-            HTML(string=html_content).write_pdf(output_pdf_path)
-            return output_pdf_path
+            return self._render_weasyprint(html_content)
         except Exception as fallback_error:
             raise RuntimeError(
                 "PDF generation failed. Install wkhtmltopdf (recommended) or WeasyPrint dependencies."
             ) from fallback_error
 
+    def render_many(self, html_contents, workers: int = 4) -> list:
+        """
+        Render many documents. wkhtmltopdf runs out of process, so pdfkit jobs run
+        `workers` at a time; WeasyPrint renders in-process on the warm instance.
+        """
+        html_contents = list(html_contents)
+        if self.backend == 'pdfkit' and workers > 1 and len(html_contents) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(self.render, html_contents))
+        return [self.render(h) for h in html_contents]
+
+
+_html_pdf_renderer = HtmlPdfRenderer()
+
+
+def _render_html_to_pdf_bytes(html_content: str) -> bytes:
+    """In-memory variant of _render_html_to_pdf: returns the PDF bytes."""
+    return _html_pdf_renderer.render(html_content)
+
+
+def render_leases_to_pdf_bytes(contexts, workers: int = 4) -> list:
+    """Batch variant of render_lease_to_pdf_bytes, one PDF per context, in order."""
+    htmls = [render_template_to_html('lease.html', ctx) for ctx in contexts]
+    return _html_pdf_renderer.render_many(htmls, workers=workers)
+
 
 def render_template_to_html(template_name: str, context: dict) -> str:
     """Render a Jinja2 template from the local templates folder to an HTML string."""
-    from jinja2 import Environment, FileSystemLoader, select_autoescape
-    import os
-
-    templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
-    env = Environment(
-        loader=FileSystemLoader(templates_dir),
-        autoescape=select_autoescape(['html', 'xml'])
-    )
-    template = env.get_template(template_name)
+    template = _get_jinja_env().get_template(template_name)
     return template.render(**context)
 
 
 def send_email_with_attachment(smtp_user: str, app_password: str, to_emails: list, subject: str, body: str, attachment_bytes: bytes, filename: str) -> None:
     """Send an email with a PDF attachment via Gmail SMTP (requires app password)."""
-    import smtplib
-    from email.message import EmailMessage
-
-    message = EmailMessage()
-    message["From"] = smtp_user
-    message["To"] = ", ".join([e for e in to_emails if e])
-    message["Subject"] = subject
-    message.set_content(body)
-    message.add_attachment(attachment_bytes, maintype="application", subtype="pdf", filename=filename)
+    from email_utils import send_pdf_via_gmail
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-        smtp.login(smtp_user, app_password)
-        smtp.send_message(message)
+    send_pdf_via_gmail(smtp_user, app_password, to_emails, subject, body, attachment_bytes, filename)
 
 
 def save_bytes_to_gridfs(data: bytes, filename: str, metadata: dict | None = None):
     """Save raw bytes to MongoDB GridFS and return the file id."""
     from gridfs import GridFS
-    from db import db
+    from db import get_db
 
-    fs = GridFS(db)
+    fs = GridFS(get_db())
     file_id = fs.put(data, filename=filename, metadata=metadata or {})
     return file_id